@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: batch.py
+Description:
+    This module runs a file of file-open tasks through the `oa_version2` graph
+    concurrently, in one process, to replay logged user commands. The graph, the chat
+    model with its response cache, the file index and the desktop layout are loaded
+    once and shared by every task. Tasks are opened for real only with `--live`;
+    otherwise opening is replaced by logging the target (a dry run). The report lists
+    the outcome and duration of every task along with the overall throughput.
+
+    python batch.py tasks.txt [--workers 4] [--timeout 60] [--live] [--output report.json]
+
+    The tasks file is plain text, one task per line ("#" starts a comment), or JSON
+    Lines with a `task` key.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+import file_index
+import frecency
+import log_pipeline
+import model
+import oa_version2
+import telemetry
+import tools
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+
+
+def load_tasks(path: str) -> list[str]:
+    """
+    **Read the tasks of a batch.**
+    Parameters:
+        path (str): A text file with one task per line, or JSON Lines with a `task` key.
+    Returns:
+        list[str]: The tasks in file order, without blank lines and comments.
+    """
+    tasks = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            tasks.append(json.loads(line)["task"] if line.startswith("{") else line)
+    return tasks
+
+
+def _dry_open(path: str) -> None:
+    logger.info("Dry run, not opening %s", path)
+
+
+def warm_up() -> None:
+    """Load everything the tasks share once, before they start, instead of once per task."""
+    start = time.perf_counter()
+    oa_version2.get_async_graph()
+    model.get_cached_llm()
+    file_index.get_index()
+    # Creates the shared search coordinator and reads the desktop layout.
+    oa_version2.init()
+    logger.info("Warmed up in %.3fs", time.perf_counter() - start)
+
+
+async def _run_task(task: str, slots: asyncio.Semaphore, timeout: float | None) -> dict:
+    async with slots:
+        start = time.perf_counter()
+        try:
+            states = await asyncio.wait_for(oa_version2.ainvoke({"task": task}), timeout)
+            result = {"status": "done", "satisfied": bool(states.get("satisfied")), "target_path": states.get("target_path", "")}
+        except Exception as e:  # one failing task must not stop the batch
+            logger.exception("Task %r failed", task)
+            result = {"status": "failed", "error": repr(e)}
+        return {"task": task, **result, "seconds": round(time.perf_counter() - start, 4)}
+
+
+async def arun_batch(tasks: list[str], workers: int = DEFAULT_WORKERS, timeout: float | None = None) -> list[dict]:
+    """Run `tasks` with at most `workers` in flight; the results are in task order."""
+    slots = asyncio.Semaphore(workers)
+    return list(await asyncio.gather(*(_run_task(task, slots, timeout) for task in tasks)))
+
+
+def run_batch(tasks: list[str], workers: int = DEFAULT_WORKERS, dry_run: bool = True, timeout: float | None = None) -> dict:
+    """
+    **Run a batch of tasks concurrently and summarize it.**
+    Parameters:
+        tasks (list[str]): The tasks, as a user would say them.
+        workers (int): The number of tasks run at once.
+        dry_run (bool): Log the targets instead of opening them, and remember them only for the
+                        batch. Live runs may also drive the Start menu as a last resort, which
+                        is only safe with one worker.
+        timeout (float | None): The longest a task may run in seconds, unbounded if None.
+    Returns:
+        dict: `results`, one dictionary per task with `task`, `status`, `satisfied`,
+              `target_path` (or `error`) and `seconds`, and the `summary` of the batch.
+    """
+    if dry_run:
+        tools.set_opener(_dry_open)
+        # Nothing is opened, so the user's history of opened targets is left alone.
+        frecency.set_store(frecency.FrecencyStore(db_path=":memory:"))
+    try:
+        warm_up()
+        start = time.perf_counter()
+        results = asyncio.run(arun_batch(tasks, workers, timeout))
+        elapsed = time.perf_counter() - start
+    finally:
+        if dry_run:
+            tools.set_opener(None)
+            frecency.set_store(None)
+
+    latencies = telemetry.Histogram(max(1, len(results)))
+    for result in results:
+        latencies.add(result["seconds"])
+    cached_llm = model.get_cached_llm()
+    summary = {
+        "tasks": len(results),
+        "done": sum(result["status"] == "done" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "satisfied": sum(bool(result.get("satisfied")) for result in results),
+        "workers": workers,
+        "dry_run": dry_run,
+        "seconds": round(elapsed, 4),
+        "tasks_per_second": round(len(results) / elapsed, 3) if elapsed else None,
+        "latency": latencies.summary(),
+        "llm_cache": getattr(getattr(cached_llm, "cache", None), "stats", None),
+        "model": getattr(model.get_llm(), "stats", None),
+    }
+    return {"results": results, "summary": summary}
+
+
+def _print(report: dict) -> None:
+    for result in report["results"]:
+        outcome = (result.get("target_path") or "-") if result["status"] == "done" else result["error"]
+        print(f"{result['seconds']:8.3f}s  {result['status']:<6}  {result['task']}  ->  {outcome}")
+    summary = report["summary"]
+    print(f"{summary['tasks']} tasks, {summary['done']} done ({summary['satisfied']} satisfied), {summary['failed']} failed "
+          f"in {summary['seconds']:.3f}s with {summary['workers']} workers: {summary['tasks_per_second']} tasks/s, "
+          f"p50 {summary['latency'].get('p50', 0.):.3f}s, p95 {summary['latency'].get('p95', 0.):.3f}s")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a file of tasks through the file-open graph concurrently.")
+    parser.add_argument("tasks", help="a text file with one task per line, or JSON Lines with a task key")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--timeout", type=float, help="the longest a task may run in seconds")
+    parser.add_argument("--live", action="store_true", help="open the targets instead of only logging them")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    log_pipeline.setup()
+    report = run_batch(load_tasks(args.tasks), max(1, args.workers), dry_run=not args.live, timeout=args.timeout)
+    _print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    return 1 if report["summary"]["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
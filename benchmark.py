@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: benchmark.py
+Description:
+    This module runs both graphs end to end without Windows, a microphone, Everything or
+    a model endpoint, so latency can be measured reproducibly on a Linux CI machine. The
+    chat model is a deterministic stub with configurable latency and structured outputs,
+    the screen is a `SyntheticBackend`, the input a `RecordingBackend`, the desktop a
+    synthetic registry blob and the file index a synthetic tree of any size. Every
+    scenario reports its throughput and the p50/p95/p99 latency of the whole run and of
+    every node, collected with `telemetry`; `--baseline` turns the report into a
+    regression check.
+
+    python benchmark.py [--runs 20] [--files 10000 100000] [--output report.json]
+    python benchmark.py --baseline report.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from langchain_core.messages import AIMessage
+from PIL import Image, ImageDraw
+
+import candidate_ranker
+import desktop_blob
+import file_index
+import frame_change
+import frecency
+import llm_cache
+import model
+import oa_version2
+import operation_assistant
+import pc_operator
+import plan_cache
+import screen_capture
+import telemetry
+import tools
+
+DESKTOP_APPS = ["微信", "QQ音乐", "网易云音乐", "腾讯会议", "钉钉", "Visual Studio Code", "Google Chrome", "WPS Office", "Steam", "回收站"]
+WORDS = ["项目", "报告", "会议", "纪要", "预算", "合同", "照片", "旅行", "简历", "方案", "report", "budget", "notes", "draft", "final", "invoice"]
+EXTENSIONS = ["docx", "pdf", "xlsx", "pptx", "txt", "jpg", "png", "mp3", "mp4", "zip", "exe", "lnk"]
+
+
+"""Stub chat model"""
+class StubChatModel:
+    """
+    **A deterministic chat model answering after a configurable latency.**
+    Plain calls echo the last message; structured calls return `responders[schema name]`
+    called with the messages and the number of earlier calls for that schema.
+    """
+
+    def __init__(self, latency: float = .05, jitter: float = 0., responders: dict | None = None, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.responders = responders or {}
+        self.model_name = "stub"
+        self.calls: dict[str, int] = {}
+        self._random = random.Random(seed)
+
+    def _delay(self) -> float:
+        return max(0., self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _answer(self, schema, messages: list):
+        name = getattr(schema, "__name__", "chat") if schema is not None else "chat"
+        index = self.calls.get(name, 0)
+        self.calls[name] = index + 1
+        if schema is None:
+            return AIMessage(content=messages[-1].content)
+        data = self.responders[name](messages, index)
+        return schema.model_validate(data) if hasattr(schema, "model_validate") else data
+
+    def invoke(self, messages: list, schema=None, **kwargs):
+        time.sleep(self._delay())
+        return self._answer(schema, messages)
+
+    async def ainvoke(self, messages: list, schema=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._answer(schema, messages)
+
+    def with_structured_output(self, schema, **kwargs) -> "_StructuredStub":
+        return _StructuredStub(self, schema)
+
+
+class _StructuredStub:
+    def __init__(self, stub: StubChatModel, schema):
+        self.stub = stub
+        self.schema = schema
+
+    def invoke(self, messages: list, **kwargs):
+        return self.stub.invoke(messages, self.schema)
+
+    async def ainvoke(self, messages: list, **kwargs):
+        return await self.stub.ainvoke(messages, self.schema)
+
+
+"""Synthetic environment"""
+def synthetic_names(count: int, seed: int = 0) -> list[str]:
+    generator = random.Random(seed)
+    return [f"{generator.choice(WORDS)}{generator.choice(WORDS)} {index}.{generator.choice(EXTENSIONS)}" for index in range(count)]
+
+
+def synthetic_index(count: int, seed: int = 0, directories: int = 1000) -> file_index.FileIndex:
+    """
+    **Build an in-memory index of `count` synthetic files.**
+    The entries are written to an in-memory store and loaded like a real one, so the
+    load path is part of what is measured.
+    """
+    index = file_index.FileIndex(db_path=":memory:", roots=[])
+    root = os.path.join(os.sep, "bench")
+    rows = []
+    for number, name in enumerate(synthetic_names(count, seed)):
+        parent = os.path.join(root, f"dir{number % directories}")
+        rows.append((os.path.join(parent, name), parent, name, 0))
+    index._db.executemany("INSERT INTO entries VALUES (?, ?, ?, ?)", rows)
+    index.load()
+    return index
+
+
+def reactive_screen(recorder: pc_operator.RecordingBackend, resolution: tuple[int, int]) -> screen_capture.SyntheticBackend:
+    """A screen showing a different window after every recorded input or opened item, as if the UI reacted."""
+    def frame() -> Image.Image:
+        image = Image.new("RGB", resolution, (40, 90, 160))
+        step = len(recorder.actions)
+        left, top = (97 * step) % (resolution[0] // 2), (61 * step) % (resolution[1] // 2)
+        ImageDraw.Draw(image).rectangle((left, top, left + resolution[0] // 2, top + resolution[1] // 2), fill=(235, 235, 235))
+        return image
+    return screen_capture.SyntheticBackend(frame, resolution)
+
+
+def install(llm: StubChatModel, files: int, resolution: tuple[int, int] = (1920, 1080), cache: bool = False) -> pc_operator.RecordingBackend:
+    """Install the stub model, fake screen and input, synthetic desktop and file index, and empty caches; returns the input recorder."""
+    model.set_llm(llm, model_name="stub")
+    model.get_cached_llm().cache = llm_cache.ResponseCache(db_path=None)
+    model.get_cached_llm().cache.enabled = cache
+    plan_cache.set_cache(plan_cache.PlanCache(db_path=":memory:"))
+    plan_cache.get_cache().enabled = cache
+    frecency.set_store(frecency.FrecencyStore(db_path=":memory:"))
+    frecency.get_store().enabled = cache
+
+    recorder = pc_operator.RecordingBackend(resolution)
+    pc_operator.set_backend(recorder)
+    screen_capture.set_backend(reactive_screen(recorder, resolution))
+    tools.set_desktop_blob(desktop_blob.generate_blob(DESKTOP_APPS + synthetic_names(40, seed=1)))
+    tools.set_opener(lambda path: recorder.actions.append(("open", path)))
+    file_index.set_index(synthetic_index(files))
+    return recorder
+
+
+"""Scenarios"""
+def _judge_responder(target: str):
+    def respond(messages, index):
+        return {"satisfied": True, "regex": "", "target_path": target}
+    return respond
+
+
+def _analyze_responder(steps: int, resolution: tuple[int, int]):
+    def respond(messages, index):
+        if index >= steps:
+            return {"operations": [], "completed": True, "completable": True}
+        x, y = (40 + 90 * index) % resolution[0], 60
+        return {"operations": [{"operation": "double_click", "coord": [x, y]}], "completed": False, "completable": True}
+    return respond
+
+
+def scenario_open(task: str, llm: StubChatModel) -> None:
+    asyncio.run(oa_version2.ainvoke({"task": task}))
+
+
+def scenario_operate(task: str, llm: StubChatModel) -> None:
+    llm.calls.pop("AnalyzeState", None)
+    operation_assistant.run(task)
+
+
+SCENARIOS = {
+    # A desktop shortcut named in the request, matched by the local ranker.
+    "open/desktop": (scenario_open, "打开微信"),
+    # A vague request the judge has to settle.
+    "open/judge": (scenario_open, "帮我找一下上次的文件"),
+    # A desktop shortcut opened directly, confirmed by one changed frame.
+    "operate/desktop": (scenario_operate, "打开微信"),
+    # Three vision round trips, two with operations, then completion.
+    "operate/vision": (scenario_operate, "打开微信并给文件传输助手发消息"),
+}
+
+
+def _summary(durations: list[float], wall: float) -> dict:
+    histogram = telemetry.Histogram(len(durations))
+    for duration in durations:
+        histogram.add(duration)
+    summary = histogram.summary()
+    return {"runs": len(durations), "throughput": len(durations) / wall if wall else 0.,
+            "p50": summary["p50"], "p95": summary["p95"], "p99": summary["p99"], "mean": summary["mean"]}
+
+
+def run_scenario(name: str, runs: int, llm: StubChatModel) -> dict:
+    function, task = SCENARIOS[name]
+    telemetry.reset()
+    function(task, llm)  # warm-up: graph compilation, imports, first index queries
+
+    telemetry.reset()
+    durations = []
+    start = time.perf_counter()
+    for _ in range(runs):
+        begin = time.perf_counter()
+        function(task, llm)
+        durations.append(time.perf_counter() - begin)
+    result = _summary(durations, time.perf_counter() - start)
+
+    result["nodes"] = {
+        key.removeprefix("node.").removesuffix(".seconds"): {percent: value[percent] for percent in ("count", "p50", "p95", "p99")}
+        for key, value in telemetry.snapshot().items() if key.startswith("node.")
+    }
+    result["llm_calls_per_run"] = telemetry.snapshot().get("llm_calls", {}).get("count", 0) / runs
+    return result
+
+
+def _measure(function, runs: int) -> dict:
+    durations = []
+    start = time.perf_counter()
+    for _ in range(runs):
+        begin = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - begin)
+    return _summary(durations, time.perf_counter() - start)
+
+
+def run_micro(files: list[int], runs: int) -> dict:
+    """Components measured on their own: the desktop blob decoder, the file index and the ranker."""
+    results = {}
+    for icons in (100, 1000, 5000):
+        blob = desktop_blob.generate_blob(synthetic_names(icons))
+        results[f"desktop_blob.decode/{icons}"] = _measure(lambda: desktop_blob.decode(blob), runs)
+
+    for count in files:
+        start = time.perf_counter()
+        index = synthetic_index(count)
+        results[f"file_index.load/{count}"] = _summary([time.perf_counter() - start], time.perf_counter() - start)
+        results[f"file_index.search/{count}"] = _measure(lambda: index.search(r"报告.*\.docx$", max_results=50), runs)
+
+    candidates = [{"name": name, "path": os.path.join(os.sep, "bench", name)} for name in synthetic_names(50)]
+    results["candidate_ranker.rank/50"] = _measure(lambda: candidate_ranker.rank("打开项目报告", candidates), runs)
+    return results
+
+
+"""Regression check"""
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """The scenarios whose p95 grew by more than `tolerance` over the baseline."""
+    regressions = []
+    for section in ("scenarios", "micro"):
+        for name, result in report.get(section, {}).items():
+            reference = baseline.get(section, {}).get(name)
+            if reference and reference["p95"] and result["p95"] > reference["p95"] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {result['p95'] * 1e3:.2f} ms > {reference['p95'] * 1e3:.2f} ms")
+    return regressions
+
+
+def _print(report: dict) -> None:
+    print(f"{'benchmark':<36}{'runs':>6}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for section in ("scenarios", "micro"):
+        for name, result in report[section].items():
+            print(f"{name:<36}{result['runs']:>6}{result['throughput']:>10.1f}"
+                  f"{result['p50'] * 1e3:>10.2f}{result['p95'] * 1e3:>10.2f}{result['p99'] * 1e3:>10.2f}")
+            for node, timing in result.get("nodes", {}).items():
+                print(f"  {node:<34}{timing['count']:>6}{'':>10}"
+                      f"{timing['p50'] * 1e3:>10.2f}{timing['p95'] * 1e3:>10.2f}{timing['p99'] * 1e3:>10.2f}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the offline end-to-end benchmarks.")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--scenarios", nargs="*", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--files", type=int, nargs="*", default=[10_000, 100_000], help="synthetic file tree sizes, up to 10M")
+    parser.add_argument("--latency", type=float, default=.05, help="stub model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.)
+    parser.add_argument("--resolution", type=int, nargs=2, default=(1920, 1080))
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response and plan caches on")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="a previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=.25, help="the allowed p95 growth over the baseline")
+    args = parser.parse_args(argv)
+
+    resolution = tuple(args.resolution)
+    llm = StubChatModel(args.latency, args.jitter, responders={
+        "JudgeState": _judge_responder(os.path.join(os.sep, "bench", "dir0", synthetic_names(1)[0])),
+        "AnalyzeState": _analyze_responder(2, resolution),
+    })
+    install(llm, min(args.files, default=10_000), resolution, args.cache)
+    telemetry.settings.enabled, telemetry.settings.spans_path = True, None
+    frame_change.stats.update(analyses=0, llm_calls_avoided=0, settle_waits=0)
+
+    report = {"scenarios": {name: run_scenario(name, args.runs, llm) for name in args.scenarios},
+              "micro": run_micro(args.files, args.runs)}
+    _print(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: candidate_ranker.py
+Description:
+    This module scores search candidates against the user's request locally, before any
+    of them are shown to the LLM judge. The request is reduced to its keywords, and a
+    candidate is scored by how many of them its name covers, by fuzzy matching, known
+    aliases of applications ("微信" -> WeChat) and pinyin for Chinese names (so homophones
+    from speech recognition such as "维信" still find "微信"), by how much of its name
+    the keywords explain and by the file types the request implies ("文档" -> docx/pdf).
+    A single clear winner that covers the main keyword lets the judge skip the model
+    call, otherwise only the best candidates are forwarded.
+"""
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+from file_index import CATEGORY_EXTENSIONS
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # pinyin matching is optional
+    lazy_pinyin = None
+
+CONFIDENCE_THRESHOLD = 0.85
+CONFIDENCE_MARGIN = 0.1
+TOP_K = 20
+# The most a target opened often before (see frecency.py) adds to its score.
+FRECENCY_WEIGHT = .15
+
+FOLDER = "folder"
+# Words in a request that imply the kind of file wanted.
+INTENT_EXTENSIONS = {
+    "文档": CATEGORY_EXTENSIONS["doc"],
+    "报告": frozenset(("doc", "docx", "pdf", "wps", "txt", "md")),
+    "论文": frozenset(("doc", "docx", "pdf", "tex")),
+    "表格": frozenset(("xls", "xlsx", "csv", "et")),
+    "幻灯片": frozenset(("ppt", "pptx", "dps", "key")),
+    "演示": frozenset(("ppt", "pptx", "dps", "key")),
+    "ppt": frozenset(("ppt", "pptx", "dps", "key")),
+    "pdf": frozenset(("pdf",)),
+    "图片": CATEGORY_EXTENSIONS["pic"],
+    "照片": CATEGORY_EXTENSIONS["pic"],
+    "视频": CATEGORY_EXTENSIONS["video"],
+    "电影": CATEGORY_EXTENSIONS["video"],
+    "音乐": CATEGORY_EXTENSIONS["audio"],
+    "歌": CATEGORY_EXTENSIONS["audio"],
+    "压缩包": CATEGORY_EXTENSIONS["zip"],
+    "程序": CATEGORY_EXTENSIONS["exe"],
+    "软件": CATEGORY_EXTENSIONS["exe"],
+    "应用": CATEGORY_EXTENSIONS["exe"],
+    "可执行": CATEGORY_EXTENSIONS["exe"],
+    "文件夹": frozenset((FOLDER,)),
+    "目录": frozenset((FOLDER,)),
+}
+
+# Names of common applications in either language, so a request for "微信" finds "WeChat.lnk"
+# and one for "wechat" finds "微信.lnk".
+ALIASES = {
+    "微信": ("wechat", "weixin"),
+    "企业微信": ("wxwork", "wecom"),
+    "钉钉": ("dingtalk",),
+    "飞书": ("feishu", "lark"),
+    "腾讯会议": ("wemeet", "tencentmeeting"),
+    "网易云音乐": ("cloudmusic", "neteasemusic"),
+    "百度网盘": ("baidunetdisk",),
+    "谷歌浏览器": ("chrome", "googlechrome"),
+    "浏览器": ("chrome", "msedge", "firefox"),
+    "记事本": ("notepad",),
+    "计算器": ("calculator", "calc"),
+    "画图": ("mspaint",),
+    "命令提示符": ("cmd",),
+    "任务管理器": ("taskmgr",),
+    "控制面板": ("controlpanel",),
+    "回收站": ("recyclebin",),
+}
+
+
+def _alias_table() -> dict[str, list[str]]:
+    """`ALIASES` in both directions, longest names first so "企业微信" is replaced before "微信"."""
+    table = {}
+    for name, aliases in ALIASES.items():
+        table.setdefault(name, []).extend(aliases)
+        for alias in aliases:
+            table.setdefault(alias, []).append(name)
+    return dict(sorted(table.items(), key=lambda item: len(item[0]), reverse=True))
+
+
+_ALIASES = _alias_table()
+
+_PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+# Request phrasing that never names the target itself.
+FILLER_WORDS = (
+    "请", "帮我", "帮忙", "给我", "我想", "我要", "打开", "开启", "启动", "运行", "找到", "找一下", "查找", "搜索",
+    "一下", "相关", "系统中", "电脑上", "桌面上", "里的", "中的", "的", "与", "和", "或", "以及", "可执行", "安装",
+    "文件夹", "文件", "应用程序", "软件", "程序", "please", "open", "find", "the",
+)
+# Filler words asking for the target to be opened, and nothing else.
+OPEN_WORDS = ("打开", "开启", "启动", "运行", "open")
+_FILLER = re.compile("|".join(sorted(map(re.escape, FILLER_WORDS), key=len, reverse=True)), re.IGNORECASE)
+
+
+def normalize(text: str) -> str:
+    """Lower-case, NFKC-fold and strip whitespace and punctuation."""
+    return _PUNCTUATION.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def keywords(task: str) -> list[str]:
+    """
+    **Extract the words of a request that may name its target.**
+    Punctuation and filler phrasing are removed, e.g. "请帮我打开项目2报告" -> ["项目2报告"].
+    """
+    found = []
+    for segment in _PUNCTUATION.split(_FILLER.sub(" ", unicodedata.normalize("NFKC", task))):
+        if len(segment) > 1 and segment.lower() not in found:
+            found.append(segment.lower())
+    return found
+
+
+def is_open_request(task: str, name: str) -> bool:
+    """Whether the request only asks to open `name`: it has an open verb and every keyword names the item."""
+    lowered = task.lower()
+    if not any(word in lowered for word in OPEN_WORDS):
+        return False
+    # Aliases and sounds count as the name too, e.g. "WeChat" or a misrecognized "维信" for "微信".
+    matches, _ = _term_matches(_Query(task), {"name": name})
+    return all(match >= 1. for match in matches)
+
+
+def _stem(name: str) -> tuple[str, str]:
+    stem, ext = os.path.splitext(name)
+    if not stem:  # dotfiles such as ".bashrc"
+        return name, ""
+    return stem, ext[1:].lower()
+
+
+def _bigrams(text: str) -> set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def _coverage(needle: str, haystack: str) -> float:
+    """The share of `needle` covered by its longest common run with `haystack`."""
+    if not needle or not haystack:
+        return 0.
+    if needle in haystack:
+        return 1.
+    match = SequenceMatcher(None, needle, haystack, autojunk=False).find_longest_match(0, len(needle), 0, len(haystack))
+    return match.size / len(needle)
+
+
+def _spellings(term: str) -> list[str]:
+    """`term`, followed by its spellings with the names of known applications replaced by their aliases."""
+    spellings = [term]
+    for name, aliases in _ALIASES.items():
+        if name in term:
+            spellings += [term.replace(name, alias) for alias in aliases]
+    return spellings
+
+
+def _pinyin(text: str) -> tuple[str, str]:
+    syllables = lazy_pinyin(text, errors="default")
+    initials = lazy_pinyin(text, style=Style.FIRST_LETTER, errors="default")
+    return "".join(syllables), "".join(initials)
+
+
+def intended_extensions(task: str) -> frozenset[str]:
+    """The extensions (and `FOLDER`) implied by words in the request, empty if none are."""
+    lowered = task.lower()
+    wanted = frozenset()
+    for word, extensions in INTENT_EXTENSIONS.items():
+        if word in lowered:
+            wanted |= extensions
+    return wanted
+
+
+class _Query:
+    """The request with everything candidates are compared against precomputed once."""
+
+    def __init__(self, task: str):
+        terms = [term for term in map(normalize, keywords(task)) if term]
+        # Words such as "pdf" or "报告" are matched by the file type, unless nothing else is left.
+        self.terms = [term for term in terms if term not in INTENT_EXTENSIONS] or terms
+        self.spellings = [_spellings(term) for term in self.terms]
+        # The longest keyword is taken to name the target, e.g. "项目2024报告" rather than "周一".
+        self.main = max(range(len(self.terms)), key=lambda position: len(self.terms[position]), default=None)
+        self.extensions = intended_extensions(task)
+        self.pinyin = [_pinyin(term) for term in self.terms] if lazy_pinyin else None
+
+
+def _term_matches(query: _Query, candidate: dict) -> tuple[list[float], float]:
+    """How much of every keyword the candidate's name covers, and how much of the name the keywords explain."""
+    stem, ext = _stem(candidate.get("name") or os.path.basename(candidate.get("path", "")))
+    stem = normalize(stem)
+    if not stem:
+        return [0.] * len(query.terms), 0.
+    sound = _pinyin(stem) if query.pinyin else None
+
+    matches, explained = [], 0.
+    for position, spellings in enumerate(query.spellings):
+        if spellings[0] == ext:
+            matches.append(1.)
+            continue
+        match = max(max(_coverage(spelling, stem), len(_bigrams(spelling) & _bigrams(stem)) / len(_bigrams(spelling)))
+                    for spelling in spellings)
+        explained = max(explained, *(_coverage(stem, spelling) for spelling in spellings))
+        if sound is not None:
+            syllables, initials = sound
+            match = max(match, _coverage(query.pinyin[position][0], syllables))
+            explained = max(explained, _coverage(syllables, query.pinyin[position][0]))
+            if len(initials) > 1 and initials.isascii() and initials == spellings[0]:
+                match = max(match, .9)
+        matches.append(match)
+    return matches, explained
+
+
+def score(query: _Query, candidate: dict) -> float:
+    """
+    **Score one candidate against a prepared query.**
+    Returns:
+        float: A score in [0, 1]; 1 means the name covers every keyword of the request,
+               consists of nothing else and its type matches what the request implies.
+    """
+    matches, explained = _term_matches(query, candidate)
+    matched = sum(matches) / len(matches) if matches else 0.
+
+    _, ext = _stem(candidate.get("name") or os.path.basename(candidate.get("path", "")))
+    if not query.extensions:
+        intent = .5
+    elif (ext or FOLDER) in query.extensions:
+        intent = 1.
+    else:
+        intent = 0.
+    return .6 * matched + .25 * explained + .15 * intent
+
+
+def _rank(query: _Query, candidates: list[dict] | None, boosts: dict[str, float] | None) -> list[tuple[float, dict]]:
+    boosts = boosts or {}
+    scored = [(score(query, candidate) + FRECENCY_WEIGHT * boosts.get(candidate.get("path"), 0.), candidate)
+              for candidate in candidates or ()]
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return scored
+
+
+def rank(task: str, candidates: list[dict] | None, boosts: dict[str, float] | None = None) -> list[tuple[float, dict]]:
+    """
+    **Rank candidates by how well they match the request, best first.**
+    Parameters:
+        task (str): The user's request.
+        candidates (list[dict] | None): Items with `name` and `path` keys.
+        boosts (dict[str, float] | None): Values in [0, 1] by path, e.g. `frecency.FrecencyStore.boosts`;
+                                          up to `FRECENCY_WEIGHT` is added to the score of those paths.
+    Returns:
+        list[tuple[float, dict]]: `(score, candidate)` pairs sorted by descending score.
+    """
+    return _rank(_Query(task), candidates, boosts)
+
+
+def shortlist(task: str, candidates: list[dict] | None, threshold: float = CONFIDENCE_THRESHOLD,
+              margin: float = CONFIDENCE_MARGIN, top_k: int = TOP_K,
+              boosts: dict[str, float] | None = None) -> tuple[dict | None, list[dict]]:
+    """
+    **Pick a confident match or the candidates worth showing to the judge.**
+    Returns:
+        tuple: The confident match (or None) and the `top_k` best candidates. A match is
+               confident when its name covers the main keyword of the request, it scores
+               at least `threshold` and beats the runner-up by `margin`.
+    """
+    query = _Query(task)
+    ranked = _rank(query, candidates, boosts)
+    if not ranked:
+        return None, []
+
+    best_score, best = ranked[0]
+    runner_up = ranked[1][0] if len(ranked) > 1 else 0.
+    confident = None
+    if best_score >= threshold and best_score - runner_up >= margin and query.main is not None:
+        # Familiarity or a matching type never make up for a name that misses the target.
+        if _term_matches(query, best)[0][query.main] >= 1.:
+            confident = best
+    return confident, [candidate for _, candidate in ranked[:top_k]]
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: capture_service.py
+Description:
+    This module grabs frames in a background thread, so the vision loop no longer
+    captures the screen and waits for it to settle on its critical path. Frames are
+    grabbed from the `screen_capture` backend at a fixed rate into a bounded ring buffer
+    of (timestamp, image, dHash), which caps memory at `buffer_size` frames. Consumers
+    ask for the newest frame grabbed after a given moment, typically the end of the last
+    operation, optionally one on which the screen had settled, i.e. that shows no change
+    from the frame before it by hash and by the tiled pixel diff of `frame_change`, since
+    the hash alone misses small changes. Grabbing is paused between a settled frame and
+    the next operation, e.g. while the model looks at the frame, and the service is only
+    used by the vision loop when `HER_CAPTURE_SERVICE=1`. With a
+    `screen_capture.SyntheticBackend` the service runs without a display:
+
+    python capture_service.py [--rate 10] [--seconds 2]
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+from PIL import Image
+from pydantic import BaseModel, Field
+
+import frame_change
+import screen_capture
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceSettings(BaseModel):
+    """The rate and memory bounds of background capture."""
+
+    enabled: bool = Field(os.environ.get("HER_CAPTURE_SERVICE", "0") == "1", description="Whether the vision loop captures in the background.")
+    rate: float = Field(10., description="The frames grabbed per second.")
+    buffer_size: int = Field(4, description="The number of frames kept; a 1920x1080 RGB frame takes about 6 MB.")
+
+
+class Frame(NamedTuple):
+    timestamp: float
+    image: Image.Image
+    hash: int
+    # Whether it shows no change from the frame grabbed before it.
+    steady: bool = False
+
+
+settings = ServiceSettings()
+
+
+class CaptureService:
+    """
+    **Grab frames in a background thread into a ring buffer.**
+    Timestamps are `time.monotonic()` values taken just before every grab, so a frame
+    newer than a moment cannot show the screen from before it. A paused service keeps
+    its thread but grabs nothing until it is resumed, or until a frame is waited for.
+    """
+
+    def __init__(self, backend: screen_capture.CaptureBackend | None = None, options: ServiceSettings | None = None):
+        self.options = options or settings
+        self._backend = backend
+        self._frames: deque[Frame] = deque(maxlen=self.options.buffer_size)
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._active = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stats = {"grabs": 0, "errors": 0, "waits": 0, "timeouts": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "CaptureService":
+        if not self.running:
+            self._stop.clear()
+            self._active.set()
+            self._thread = threading.Thread(target=self._loop, name="capture-service", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._active.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._condition:
+            self._frames.clear()
+
+    def pause(self) -> None:
+        """Stop grabbing until `resume`, e.g. once a settled frame was taken."""
+        self._active.clear()
+
+    def resume(self) -> None:
+        """Grab again, e.g. when an operation starts."""
+        self._active.set()
+
+    def __enter__(self) -> "CaptureService":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _loop(self) -> None:
+        # The backend is resolved in the thread, so backends set before `start` are used.
+        backend = self._backend or screen_capture.get_backend()
+        interval = 1. / self.options.rate
+        previous = None
+        while not self._stop.is_set():
+            if not self._active.is_set():
+                self._active.wait()
+                continue
+            started = time.monotonic()
+            try:
+                image = backend.grab()
+                frame_hash = frame_change.dhash(image)
+                # The pixel diff runs here rather than in `wait_for`, and only when the hashes agree.
+                steady = (previous is not None and frame_change.is_same(previous.hash, frame_hash)
+                          and not frame_change.changed_tiles(previous.image, image))
+                frame = previous = Frame(started, image, frame_hash, steady)
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Background capture failed")
+            else:
+                with self._condition:
+                    self._frames.append(frame)
+                    self.stats["grabs"] += 1
+                    self._condition.notify_all()
+            self._stop.wait(max(0., interval - (time.monotonic() - started)))
+
+    def _newest(self, after: float, settled: bool) -> Frame | None:
+        frames = list(self._frames)
+        for position in range(len(frames) - 1, -1, -1):
+            frame = frames[position]
+            if frame.timestamp <= after:
+                return None
+            if not settled:
+                return frame
+            # Settled: the frame before it was also grabbed after `after` and looks the same.
+            if position and frames[position - 1].timestamp > after and frame.steady:
+                return frame
+        return None
+
+    def latest(self, after: float = 0., settled: bool = False) -> Frame | None:
+        """The newest buffered frame grabbed after `after` (and settled, if asked), without waiting."""
+        with self._condition:
+            return self._newest(after, settled)
+
+    def wait_for(self, after: float = 0., settled: bool = False, timeout: float | None = None) -> Frame | None:
+        """
+        **The newest frame grabbed after `after`, waiting for it if it is not buffered yet.**
+        A paused service is resumed first.
+        Parameters:
+            after (float): A `time.monotonic()` value, e.g. the end of the last operation.
+            settled (bool): Whether the screen must have settled on the frame.
+            timeout (float | None): The longest wait, `frame_change.settings.settle_timeout` if None.
+        Returns:
+            Frame | None: The frame; when none settles in time, the newest frame grabbed after
+                          `after`, and None if there is not even one.
+        """
+        timeout = frame_change.settings.settle_timeout if timeout is None else timeout
+        self.resume()
+        with self._condition:
+            frame = self._newest(after, settled)
+            if frame is None:
+                self.stats["waits"] += 1
+                frame = self._condition.wait_for(lambda: self._newest(after, settled), timeout)
+            if frame is None:
+                self.stats["timeouts"] += 1
+                frame = self._newest(after, False)
+        return frame
+
+
+_service: CaptureService | None = None
+
+
+def get_service() -> CaptureService:
+    global _service
+    if _service is None:
+        _service = CaptureService()
+    return _service
+
+
+def set_service(service: CaptureService | None) -> None:
+    global _service
+    _service = service
+
+
+def main(argv: list[str] | None = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the capture service on synthetic frames and report its stats.")
+    parser.add_argument("--rate", type=float, default=settings.rate)
+    parser.add_argument("--seconds", type=float, default=2.)
+    args = parser.parse_args(argv)
+
+    backend = screen_capture.SyntheticBackend()
+    with CaptureService(backend, ServiceSettings(rate=args.rate)) as service:
+        marker = time.monotonic()
+        frame = service.wait_for(marker)
+        print(f"First frame after {frame.timestamp - marker:+.3f}s" if frame else "No frame")
+        time.sleep(args.seconds)
+        print(f"Buffered {len(service._frames)} frames, {service.stats}")
+
+
+if __name__ == "__main__":
+    main()
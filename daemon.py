@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: daemon.py
+Description:
+    This module keeps the assistant resident so commands skip the cold start. `serve`
+    warms the compiled graphs, the chat model and its connection pool, the file index
+    and the desktop layout once, then accepts tasks over a local HTTP endpoint into a
+    bounded queue drained by worker threads, and reports the status of every task until
+    it has been finished for `RETENTION` seconds. The client commands (`submit`,
+    `status`) only import the standard library, so they start in milliseconds.
+
+    python daemon.py serve [--port 8765] [--workers 1] [--queue-size 16]
+    python daemon.py submit "打开微信" [--graph operate] [--wait]
+    python daemon.py status <task id>
+"""
+import argparse
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+GRAPHS = ("open", "operate")
+FINISHED = ("done", "failed")
+# Finished tasks are reported for this long, and this many of them at most.
+RETENTION = 3600.
+MAX_FINISHED = 1000
+
+
+"""Server"""
+
+
+def _expire(tasks: dict[str, dict], now: float, retention: float = RETENTION, max_finished: int = MAX_FINISHED) -> int:
+    """
+    **Forget the finished tasks older than `retention` seconds, and the oldest past `max_finished`.**
+    Queued and running tasks are always kept. Returns the number of tasks forgotten.
+    """
+    finished = [task_id for task_id, record in tasks.items() if record["status"] in FINISHED]
+    finished.sort(key=lambda task_id: tasks[task_id]["finished"])
+    expired = finished[:max(0, len(finished) - max_finished)]
+    expired += [task_id for task_id in finished[len(expired):] if now - tasks[task_id]["finished"] > retention]
+    for task_id in expired:
+        del tasks[task_id]
+    return len(expired)
+
+
+def _run_task(graph: str, task: str):
+    if graph == "open":
+        import asyncio
+        import oa_version2
+        return asyncio.run(oa_version2.ainvoke({"task": task}))
+
+    import operation_assistant
+    states = operation_assistant.run(task)
+    return {"completed": states["completed"]}
+
+
+def _warm_up(logger) -> None:
+    import file_index
+    import model
+    import oa_version2
+    import operation_assistant
+    import tools
+
+    start = time.perf_counter()
+    oa_version2.get_graph()
+    oa_version2.get_async_graph()
+    operation_assistant.get_graph()
+    model.get_cached_llm()
+    file_index.get_index()
+    try:
+        tools.get_desktop_items("open")
+    except Exception as e:  # the desktop layout is only readable on Windows
+        logger.info("Desktop layout not loaded: %s", e)
+    logger.info("Warmed up in %.3fs", time.perf_counter() - start)
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 1, queue_size: int = 16) -> None:
+    """
+    **Run the daemon until interrupted.**
+    Parameters:
+        host (str): The interface to listen on, local only by default.
+        port (int): The port to listen on.
+        workers (int): The number of tasks run at once. Tasks of the operate graph drive
+                       the mouse and keyboard, so more than one is only safe for open tasks.
+        queue_size (int): The number of tasks waiting at most; further submissions are refused.
+    """
+    import logging
+    import queue
+    import threading
+    import uuid
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import log_pipeline
+    import model
+    import telemetry
+
+    logger = logging.getLogger("daemon")
+    _warm_up(logger)
+
+    tasks: dict[str, dict] = {}
+    pending: queue.Queue = queue.Queue(maxsize=queue_size)
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            task_id = pending.get()
+            with lock:
+                record = tasks[task_id]
+                record.update(status="running", started=time.time())
+            try:
+                # Every record logged for the task carries its id
+                with log_pipeline.context(task=record["task"], correlation_id=task_id):
+                    result = _run_task(record["graph"], record["task"])
+                update = {"status": "done", "result": result}
+            except Exception as e:
+                logger.exception("Task %s failed", task_id)
+                update = {"status": "failed", "error": repr(e)}
+            with lock:
+                record.update(update, finished=time.time())
+                _expire(tasks, record["finished"])
+            pending.task_done()
+
+    for index in range(workers):
+        threading.Thread(target=work, name=f"daemon-worker-{index}", daemon=True).start()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict) -> None:
+            payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/health":
+                with lock:
+                    counts = {}
+                    for record in tasks.values():
+                        counts[record["status"]] = counts.get(record["status"], 0) + 1
+                model_stats = getattr(model.get_llm(), "stats", None)
+                return self._reply(200, {"queued": pending.qsize(), "capacity": queue_size, "tasks": counts, "model": model_stats})
+            if self.path == "/metrics":
+                return self._reply(200, telemetry.snapshot())
+            if self.path.startswith("/tasks/"):
+                with lock:
+                    record = tasks.get(self.path.removeprefix("/tasks/"))
+                    record = dict(record) if record else None
+                return self._reply(200, record) if record else self._reply(404, {"error": "unknown task"})
+            self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/tasks":
+                return self._reply(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except json.JSONDecodeError:
+                return self._reply(400, {"error": "invalid JSON"})
+            graph, task = body.get("graph", "open"), body.get("task", "")
+            if graph not in GRAPHS or not task:
+                return self._reply(400, {"error": f"expected a task and a graph in {GRAPHS}"})
+
+            task_id = uuid.uuid4().hex[:12]
+            with lock:
+                tasks[task_id] = {"id": task_id, "graph": graph, "task": task, "status": "queued", "created": time.time()}
+            try:
+                pending.put_nowait(task_id)
+            except queue.Full:
+                with lock:
+                    del tasks[task_id]
+                return self._reply(503, {"error": "queue full, retry later"})
+            self._reply(202, {"id": task_id})
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logger.info("Listening on http://%s:%d", host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+"""Client"""
+def _request(url: str, body: dict | None = None) -> tuple[int, dict]:
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def submit(task: str, graph: str = "open", wait: bool = False, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> dict:
+    status, body = _request(f"http://{host}:{port}/tasks", {"task": task, "graph": graph})
+    if status != 202 or not wait:
+        return body
+    while (record := status_of(body["id"], host, port))["status"] not in FINISHED:
+        time.sleep(.2)
+    return record
+
+
+def status_of(task_id: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> dict:
+    return _request(f"http://{host}:{port}/tasks/{task_id}")[1]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run or talk to the resident assistant.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the daemon")
+    serve_parser.add_argument("--workers", type=int, default=1)
+    serve_parser.add_argument("--queue-size", type=int, default=16)
+
+    submit_parser = commands.add_parser("submit", help="submit a task")
+    submit_parser.add_argument("task")
+    submit_parser.add_argument("--graph", choices=GRAPHS, default="open")
+    submit_parser.add_argument("--wait", action="store_true", help="wait for the task to finish")
+
+    status_parser = commands.add_parser("status", help="show the status of a task")
+    status_parser.add_argument("id")
+
+    args = parser.parse_args(argv)
+    match args.command:
+        case "serve":
+            import log_pipeline
+            log_pipeline.setup()
+            serve(args.host, args.port, args.workers, args.queue_size)
+            return 0
+        case "submit":
+            result = submit(args.task, args.graph, args.wait, args.host, args.port)
+        case "status":
+            result = status_of(args.id, args.host, args.port)
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    return 0 if result.get("status") != "failed" and "error" not in result else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: desktop_blob.py
+Description:
+    This module decodes the desktop icon layout blob stored by Windows under
+    `Software\\Microsoft\\Windows\\Shell\\Bags\\1\\Desktop`. The blob is walked once
+    through a memoryview, so no field access copies the underlying bytes, and the
+    trailing position records are read with `struct.iter_unpack`. Decoded layouts are
+    cached by the hash of the blob, which lets an unchanged desktop skip parsing
+    entirely. A synthetic blob generator is included so the decoder can be exercised
+    and benchmarked on any platform.
+"""
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+COUNT_OFFSET = 0x18
+ITEMS_OFFSET = 0x1C
+ITEM_HEADER = struct.Struct("<III")
+# (unused, column, unused, row, index to the names list), stored backwards from the end.
+POSITION_RECORD = struct.Struct("<HHHHH")
+
+CACHE_SIZE = 8
+# Grid values are stored as bfloat16, so only the first 257 rows/columns are distinct.
+MAX_GRID_INDEX = 257
+
+_cache: OrderedDict[bytes, tuple[tuple[str, ...], tuple[tuple[int, int, int], ...]]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def decode(value: bytes) -> tuple[tuple[str, ...], tuple[tuple[int, int, int], ...]]:
+    """
+    **Decode a desktop layout blob in one pass.**
+    Parameters:
+        value (bytes): The raw registry value.
+    Returns:
+        tuple: The entry names in item order, and one `(row, column, index)` tuple of raw
+               grid values per item, where `index` refers to the names tuple.
+    """
+    view = memoryview(value)
+    (count,) = struct.unpack_from("<I", view, COUNT_OFFSET)
+
+    names = []
+    offset = ITEMS_OFFSET
+    for _ in range(count):
+        _, size, _ = ITEM_HEADER.unpack_from(view, offset)
+        start = offset + ITEM_HEADER.size
+        names.append(str(view[start:start + 2 * size - 8], "utf-16-le"))
+        offset = start + 2 * size - 4
+
+    tail = view[len(view) - POSITION_RECORD.size * count:]
+    positions = tuple((row, column, index) for _, column, _, row, index in POSITION_RECORD.iter_unpack(tail))
+    return tuple(names), positions
+
+
+def parse(value: bytes) -> tuple[tuple[str, ...], tuple[tuple[int, int, int], ...]]:
+    """
+    **Decode a desktop layout blob, reusing the result for a blob seen before.**
+    The cache is keyed on a BLAKE2 digest of the blob and keeps the `CACHE_SIZE` most
+    recently used layouts. The returned tuples are shared and must not be mutated.
+    """
+    key = hashlib.blake2b(value, digest_size=16).digest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    layout = decode(value)
+    with _cache_lock:
+        _cache[key] = layout
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return layout
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def generate_blob(names: list[str], grid: list[tuple[int, int]] | None = None, rows_per_column: int = 32) -> bytes:
+    """
+    **Build a synthetic desktop layout blob.**
+    Parameters:
+        names (list[str]): The entry names.
+        grid (list[tuple[int, int]] | None): The 1-based `(row, column)` of every entry.
+            Defaults to filling columns top to bottom, `rows_per_column` icons each.
+    Returns:
+        bytes: A blob that `decode` and `tools._read_reg_value` accept.
+    Raises:
+        ValueError: If a row or column exceeds `MAX_GRID_INDEX`.
+    """
+    from tools import generate_mapping
+
+    if grid is None:
+        grid = [(i % rows_per_column + 1, i // rows_per_column + 1) for i in range(len(names))]
+    largest = max([2, *(max(cell) for cell in grid)])
+    if largest > MAX_GRID_INDEX:
+        raise ValueError(f"Grid index {largest} exceeds {MAX_GRID_INDEX}, use more rows per column.")
+    raw_values = {n: raw for raw, n in generate_mapping(largest).items()}
+
+    chunks = [bytes(COUNT_OFFSET), struct.pack("<I", len(names))]
+    for name in names:
+        encoded = name.encode("utf-16-le")
+        size = (len(encoded) + 8) // 2
+        chunks.append(ITEM_HEADER.pack(0, size, 0))
+        chunks.append(encoded)
+        chunks.append(bytes(4))
+
+    # Records are read backwards from the end of the blob, item 0 being the last one.
+    records = [POSITION_RECORD.pack(0, raw_values[column], 0, raw_values[row], index) for index, (row, column) in enumerate(grid)]
+    chunks.extend(reversed(records))
+    return b"".join(chunks)
+
+
+if __name__ == "__main__":
+    for count in (100, 1000, 5000):
+        blob = generate_blob([f"项目报告 {i}.docx" for i in range(count)])
+
+        start = time.perf_counter()
+        decode(blob)
+        decoded = time.perf_counter() - start
+
+        parse(blob)
+        start = time.perf_counter()
+        parse(blob)
+        cached = time.perf_counter() - start
+
+        print(f"{count:>5} icons, {len(blob):>7} bytes: decode {decoded * 1e3:.2f} ms, cached {cached * 1e3:.3f} ms")
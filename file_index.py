@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: file_index.py
+Description:
+    This module provides a cross-platform, persistent file-name index used as a local
+    replacement for the Everything service. Entries are crawled from a set of root
+    directories, stored in an SQLite database and loaded into an in-memory trigram,
+    prefix and extension index, so regex, extension and category queries are answered
+    without any external process. The index refreshes incrementally by comparing the
+    modification time of every crawled directory with the stored one, which lets an
+    unchanged tree be revisited with one stat call per directory.
+"""
+import bisect
+import heapq
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+import regex_engine
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".her", "file_index.sqlite3")
+# A refresh applies its changes to the index every this many changed directories.
+COMMIT_EVERY = 1000
+DEFAULT_EXCLUDES = frozenset((".git", ".svn", ".hg", "node_modules", "__pycache__", ".cache", "$RECYCLE.BIN", "System Volume Information"))
+
+# Extensions of every category understood by `tools.get_by_everytools_search`.
+CATEGORY_EXTENSIONS = {
+    "audio": frozenset(("mp3", "wav", "flac", "aac", "ogg", "wma", "m4a", "ape")),
+    "video": frozenset(("mp4", "mkv", "avi", "mov", "wmv", "flv", "webm", "m4v", "rmvb")),
+    "pic": frozenset(("jpg", "jpeg", "png", "gif", "bmp", "webp", "tif", "tiff", "ico", "svg", "heic")),
+    "doc": frozenset(("doc", "docx", "pdf", "txt", "odt", "rtf", "xls", "xlsx", "ppt", "pptx", "md", "csv", "wps")),
+    "exe": frozenset(("exe", "bat", "cmd", "msi", "lnk", "com", "app", "sh")),
+    "zip": frozenset(("zip", "rar", "7z", "tar", "gz", "bz2", "xz", "iso")),
+}
+
+
+def default_roots() -> list[str]:
+    """
+    **Return the directories indexed by default.**
+    The `HER_INDEX_ROOTS` environment variable (separated by `os.pathsep`) overrides the
+    default, which is the user's home directory plus the Windows start menu folders.
+    """
+    configured = os.environ.get("HER_INDEX_ROOTS")
+    if configured:
+        return [root for root in configured.split(os.pathsep) if root]
+
+    roots = [os.path.expanduser("~")]
+    for base in (os.environ.get("PROGRAMDATA"), os.environ.get("APPDATA")):
+        if base:
+            roots.append(os.path.join(base, "Microsoft", "Windows", "Start Menu", "Programs"))
+    return [root for root in roots if os.path.isdir(root)]
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _extension(name: str) -> str:
+    _, dot, ext = name.rpartition(".")
+    return ext.lower() if dot else ""
+
+
+def _literal_runs(parsed) -> list[str]:
+    runs, current = [], []
+    for opcode, argument in parsed:
+        if opcode is sre_parse.LITERAL:
+            current.append(chr(argument).lower())
+        elif current:
+            runs.append("".join(current))
+            current = []
+    if current:
+        runs.append("".join(current))
+    return runs
+
+
+def _required_literals(pattern: str) -> tuple[str, list[list[str]]]:
+    """
+    Extract the literal runs every match of `pattern` must contain.
+    Returns the anchored prefix (empty if the pattern is not anchored) and, for every
+    top-level alternative of the pattern, the runs found at its top level, lower-cased.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except (re.error, RecursionError):
+        return "", [[]]
+
+    if len(parsed) == 1 and parsed[0][0] is sre_parse.BRANCH:
+        return "", [_literal_runs(alternative) for alternative in parsed[0][1][1]]
+
+    runs = _literal_runs(parsed)
+    anchored = len(parsed) > 1 and parsed[0] == (sre_parse.AT, sre_parse.AT_BEGINNING) and parsed[1][0] is sre_parse.LITERAL
+    return (runs[0] if anchored else ""), [runs]
+
+
+class FileIndex:
+    """An on-disk file-name store with an in-memory trigram, prefix and extension index."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, roots: list[str] | None = None, excludes=DEFAULT_EXCLUDES):
+        self.db_path = db_path
+        self.roots = [os.path.abspath(root) for root in (roots if roots is not None else default_roots())]
+        self.excludes = frozenset(excludes)
+
+        self._lock = threading.RLock()
+        # Serializes refreshes, which read the store while they walk the filesystem unlocked.
+        self._refresh_lock = threading.RLock()
+        self._ready = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+
+        self._reset_memory()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (path TEXT PRIMARY KEY, parent TEXT NOT NULL, name TEXT NOT NULL, is_dir INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+            CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, mtime REAL NOT NULL);
+        """)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index covers the filesystem, i.e. it was loaded or crawled at least once."""
+        return self._ready.is_set()
+
+    # In-memory index maintenance
+    def _reset_memory(self) -> None:
+        # id -> (name, path, is_dir); deleted ids are set to None and never reused.
+        self._entries: list[tuple[str, str, bool] | None] = []
+        self._ids: dict[str, int] = {}
+        self._trigrams: dict[str, set[int]] = {}
+        self._extensions: dict[str, set[int]] = {}
+        self._folders: set[int] = set()
+        self._sorted_names: list[tuple[str, int]] = []
+        self._sorted_dirty = False
+        # Regex engines over a snapshot of the names (False) or paths (True) of `_entries`.
+        # Replaced engines are not closed: a search may still be using one, and it frees
+        # its shared memory once the last reference is gone.
+        self._engines: dict[bool, regex_engine.RegexEngine] = {}
+
+    def _add(self, name: str, path: str, is_dir: bool) -> None:
+        if path in self._ids:
+            return
+        entry_id = len(self._entries)
+        self._entries.append((name, path, is_dir))
+        self._ids[path] = entry_id
+
+        lowered = name.lower()
+        for trigram in _trigrams(lowered):
+            self._trigrams.setdefault(trigram, set()).add(entry_id)
+        if is_dir:
+            self._folders.add(entry_id)
+        else:
+            self._extensions.setdefault(_extension(name), set()).add(entry_id)
+        self._sorted_dirty = True
+
+    def _remove(self, path: str) -> None:
+        entry_id = self._ids.pop(path, None)
+        if entry_id is None:
+            return
+        name, _, is_dir = self._entries[entry_id]
+        self._entries[entry_id] = None
+
+        for trigram in _trigrams(name.lower()):
+            self._trigrams[trigram].discard(entry_id)
+        if is_dir:
+            self._folders.discard(entry_id)
+        else:
+            self._extensions[_extension(name)].discard(entry_id)
+        self._sorted_dirty = True
+
+    def load(self) -> int:
+        """
+        **Load the on-disk store into memory.**
+        Returns:
+            int: The number of entries loaded.
+        """
+        with self._refresh_lock, self._lock:
+            for path, name, is_dir in self._db.execute("SELECT path, name, is_dir FROM entries"):
+                self._add(name, path, bool(is_dir))
+        logger.info("Loaded %d entries from %s", len(self), self.db_path)
+        if len(self):
+            self._ready.set()
+        return len(self)
+
+    # Crawling
+    def _scan_directory(self, directory: str) -> list[tuple[str, str, bool]] | None:
+        try:
+            with os.scandir(directory) as iterator:
+                return [
+                    (entry.name, entry.path, entry.is_dir(follow_symlinks=False))
+                    for entry in iterator
+                    if entry.name not in self.excludes
+                ]
+        except OSError:
+            return None
+
+    def refresh(self) -> tuple[int, int]:
+        """
+        **Bring the index up to date with the filesystem.**
+        Directories whose modification time matches the stored one are not listed again;
+        only their known sub-directories are visited. The first call on an empty store
+        performs a full crawl. The filesystem is walked without holding the index lock,
+        which is only taken to apply every `COMMIT_EVERY` changed directories, so searches
+        go on meanwhile and see a first crawl fill in.
+        Returns:
+            tuple[int, int]: The number of entries added and removed.
+        """
+        added = removed = 0
+        with self._refresh_lock:
+            known_mtimes = dict(self._db.execute("SELECT path, mtime FROM directories"))
+            visited = set()
+            pending = list(self.roots)
+            changes = []
+
+            while pending:
+                directory = pending.pop()
+                if directory in visited:
+                    continue
+                visited.add(directory)
+                try:
+                    mtime = os.stat(directory).st_mtime
+                except OSError:
+                    continue
+
+                if known_mtimes.get(directory) == mtime:
+                    pending.extend(row[0] for row in self._db.execute(
+                        "SELECT path FROM entries WHERE parent = ? AND is_dir = 1", (directory,)))
+                    continue
+
+                children = self._scan_directory(directory)
+                if children is None:
+                    continue
+                stored = {row[0] for row in self._db.execute("SELECT path FROM entries WHERE parent = ?", (directory,))}
+                current = {path for _, path, _ in children}
+                new_rows = [(path, directory, name, int(is_dir)) for name, path, is_dir in children if path not in stored]
+                changes.append((directory, mtime, stored - current, new_rows))
+                pending.extend(path for _, path, is_dir in children if is_dir)
+
+                if len(changes) >= COMMIT_EVERY:
+                    counts = self._apply(changes)
+                    added, removed, changes = added + counts[0], removed + counts[1], []
+            counts = self._apply(changes)
+            added, removed = added + counts[0], removed + counts[1]
+        self._ready.set()
+        logger.info("Index refreshed: %d added, %d removed, %d total", added, removed, len(self))
+        return added, removed
+
+    def _apply(self, changes: list) -> tuple[int, int]:
+        """Write the changes of crawled directories to the store and memory at once."""
+        added = removed = 0
+        with self._lock:
+            for directory, mtime, gone, new_rows in changes:
+                for path in gone:
+                    removed += self._forget(path)
+                self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", new_rows)
+                for path, _, name, is_dir in new_rows:
+                    self._add(name, path, bool(is_dir))
+                added += len(new_rows)
+                self._db.execute("INSERT OR REPLACE INTO directories VALUES (?, ?)", (directory, mtime))
+            self._db.commit()
+        return added, removed
+
+    def _forget(self, path: str) -> int:
+        """Remove `path` and, for directories, everything below it from the store and memory."""
+        prefix = path.rstrip(os.sep) + os.sep
+        rows = self._db.execute(
+            "SELECT path FROM entries WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix)).fetchall()
+        for (gone,) in rows:
+            self._remove(gone)
+        self._db.execute("DELETE FROM entries WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+        self._db.execute("DELETE FROM directories WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+        return len(rows)
+
+    def build(self) -> int:
+        """
+        **Rebuild the index from scratch.**
+        Returns:
+            int: The number of entries indexed.
+        """
+        with self._refresh_lock:
+            with self._lock:
+                self._db.executescript("DELETE FROM entries; DELETE FROM directories;")
+                self._reset_memory()
+            self.refresh()
+        return len(self)
+
+    def start_watching(self, interval: float = 60.0) -> None:
+        """Refresh the index every `interval` seconds on a daemon thread."""
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop.clear()
+
+        def _loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("Index refresh failed")
+
+        self._watcher = threading.Thread(target=_loop, name="file-index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+
+    # Queries
+    def _live(self, ids):
+        for entry_id in ids:
+            entry = self._entries[entry_id]
+            if entry is not None:
+                yield entry
+
+    def _all_ids(self):
+        return range(len(self._entries))
+
+    def _literal_candidates(self, literals: list[str]):
+        """Intersect the posting lists of every trigram of every literal; None means no filter."""
+        candidates = None
+        for literal in literals:
+            for trigram in _trigrams(literal):
+                postings = self._trigrams.get(trigram, set())
+                candidates = set(postings) if candidates is None else candidates & postings
+                if not candidates:
+                    return set()
+        return candidates
+
+    def _prefix_candidates(self, prefix: str) -> list[int]:
+        if self._sorted_dirty:
+            self._sorted_names = sorted(
+                (entry[0].lower(), entry_id) for entry_id, entry in enumerate(self._entries) if entry is not None)
+            self._sorted_dirty = False
+        start = bisect.bisect_left(self._sorted_names, (prefix, -1))
+        end = bisect.bisect_left(self._sorted_names, (prefix + "\U0010ffff", -1))
+        return [entry_id for _, entry_id in self._sorted_names[start:end]]
+
+    def _engine(self, on_path: bool) -> regex_engine.RegexEngine:
+        """
+        The regex engine over the names (or paths) of the index. Ids are never reused, so
+        an engine stays valid as entries are added and removed: removed ones are skipped by
+        `_live` and the ones added since are matched as extra strings, until there are more
+        of them than a shard. Replacing an engine only copies the strings; the worker
+        processes are shared by every engine.
+        """
+        engine = self._engines.get(on_path)
+        if engine is None or len(self._entries) - len(engine) > regex_engine.settings.shard_size:
+            field = 1 if on_path else 0
+            engine = regex_engine.RegexEngine([entry[field] if entry is not None else "" for entry in self._entries])
+            self._engines[on_path] = engine
+        return engine
+
+    def _plan_regex(self, pattern: str):
+        """The engine, the ids it has to match `pattern` against, the extra strings and whether all ids are candidates."""
+        on_path = "\\\\" in pattern or "/" in pattern
+        prefix, alternatives = _required_literals(pattern)
+        if on_path:
+            ids = self._all_ids()
+        elif prefix:
+            ids = self._prefix_candidates(prefix)
+        else:
+            ids = set()
+            for literals in alternatives:
+                candidates = self._literal_candidates([literal for literal in literals if len(literal) >= 3])
+                if candidates is None:
+                    ids = self._all_ids()
+                    break
+                ids |= candidates
+
+        engine = self._engine(on_path)
+        known = len(engine)
+        full_scan = isinstance(ids, range)
+        if full_scan:
+            positions, added = range(known), range(known, len(self._entries))
+        else:
+            ids = sorted(ids)
+            split = bisect.bisect_left(ids, known)
+            positions, added = ids[:split], ids[split:]
+        field = 1 if on_path else 0
+        extra = [(entry_id, self._entries[entry_id][field]) for entry_id in added if self._entries[entry_id] is not None]
+        return engine, positions, extra, full_scan
+
+    def _search_regex(self, pattern: str, max_results: int) -> list[tuple[str, str, bool]]:
+        try:
+            regex_engine.compile_pattern(pattern)
+        except regex_engine.UnsafePattern as e:
+            logger.warning("Rejected regex %r: %s", pattern, e)
+            return []
+
+        with self._lock:
+            engine, positions, extra, full_scan = self._plan_regex(pattern)
+            entries = self._entries
+        # Matched without the lock, in worker processes stopped at the deadline, so a slow
+        # pattern delays neither refreshes nor other searches. A full scan stops at the first
+        # `max_results` matches rather than the alphabetically smallest.
+        limit = max_results if full_scan else max(1, len(positions) + len(extra))
+        matches = (entries[entry_id] for entry_id in engine.search(pattern, max_results=limit, positions=positions, extra=extra))
+        return heapq.nsmallest(max_results, filter(None, matches), key=lambda entry: (entry[0].lower(), entry[1]))
+
+    def _match_terms(self, keywords: str, ids=None):
+        terms = [term.lower() for term in keywords.split()]
+        if ids is None:
+            ids = self._literal_candidates([term for term in terms if len(term) >= 3 and os.sep not in term])
+            ids = self._all_ids() if ids is None else ids
+
+        for name, path, is_dir in self._live(ids):
+            lowered_name, lowered_path = name.lower(), path.lower()
+            if all(term in (lowered_path if os.sep in term else lowered_name) for term in terms):
+                yield name, path, is_dir
+
+    def search(self, keywords: str, max_results: int = 10, search_type: str = "regex", ext: str | None = None) -> list[dict]:
+        """
+        **Search the index.**
+        The parameters mirror `tools.get_by_everytools_search`: `search_type` is one of
+        'regex', 'audio', 'video', 'pic', 'doc', 'exe', 'folder', 'zip' or 'ext', and any
+        other value falls back to a plain whitespace-separated term search.
+        Returns:
+            list[dict]: Up to `max_results` dictionaries with `name` and `path` keys, sorted by name.
+        """
+        keywords = keywords or ""
+        if search_type == "regex" and keywords:
+            return [{"name": name, "path": path} for name, path, _ in self._search_regex(keywords, max_results)]
+        with self._lock:
+            match search_type:
+                case "regex":
+                    matches = self._live(self._all_ids())
+                case "folder":
+                    matches = self._match_terms(keywords, self._folders)
+                case category if category in CATEGORY_EXTENSIONS:
+                    ids = set().union(*(self._extensions.get(e, ()) for e in CATEGORY_EXTENSIONS[category]))
+                    matches = self._match_terms(keywords, ids)
+                case "ext" if ext:
+                    wanted = {e.strip(".").lower() for e in re.split(r"[;,|\s]+", keywords) if e}
+                    ids = set().union(*(self._extensions.get(e, ()) for e in wanted))
+                    matches = self._live(ids)
+                case _:
+                    matches = self._match_terms(keywords)
+
+            found = heapq.nsmallest(max_results, matches, key=lambda entry: (entry[0].lower(), entry[1]))
+        return [{"name": name, "path": path} for name, path, _ in found]
+
+
+_index: FileIndex | None = None
+_index_lock = threading.Lock()
+
+
+def _build_in_background(index: FileIndex) -> None:
+    try:
+        index.refresh()
+    except Exception:
+        logger.exception("Building the file index failed")
+
+
+def get_index() -> FileIndex:
+    """
+    **Return the shared index, loading it on first use.**
+    An empty store is crawled on a background thread instead of the caller's; the index
+    is not `ready` until then, and fills in meanwhile.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = FileIndex()
+            if not index.load():
+                threading.Thread(target=_build_in_background, args=(index,), name="file-index-build", daemon=True).start()
+            _index = index
+    return _index
+
+
+def set_index(index: FileIndex | None) -> None:
+    """Replace the shared index, e.g. with a synthetic one; None loads the default again on next use."""
+    global _index
+    with _index_lock:
+        _index = index
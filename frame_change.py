@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: frame_change.py
+Description:
+    This module detects whether the screen changed between two frames, so the vision
+    loop can wait for the UI to settle after an operation and avoid asking the model
+    about a frame it has already analyzed. Frames are compared with a difference hash
+    (dHash), which tolerates compression noise and tiny animations, and with a tiled
+    grayscale pixel diff that also reports where the change happened. The hash alone
+    misses small changes, e.g. typing a line flips a couple of bits, so a frame counts
+    as unchanged only when the pixel diff agrees.
+"""
+import logging
+import time
+from typing import Callable
+
+from PIL import Image, ImageChops, ImageStat
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeSettings(BaseModel):
+    """Thresholds used to decide whether two frames are effectively identical."""
+
+    hash_size: int = Field(16, description="The side of the dHash grid, the hash has hash_size ** 2 bits.")
+    hash_threshold: int = Field(6, description="Frames whose hashes differ in at most this many bits are identical.")
+    tile_grid: tuple[int, int] = Field((8, 8), description="The number of (columns, rows) compared by the tiled diff.")
+    tile_threshold: float = Field(4., description="The mean grayscale difference (0-255) above which a tile counts as changed.")
+    pixel_delta: int = Field(32, description="The grayscale difference (0-255) above which a pixel counts as changed.")
+    changed_pixels: int = Field(48, description="A tile with more changed pixels counts as changed, a blinking caret has fewer.")
+    settle_interval: float = Field(.15, description="The delay in seconds between frames while waiting for the screen to settle.")
+    settle_timeout: float = Field(1.5, description="The longest wait in seconds for the screen to settle.")
+    max_reuses: int = Field(1, description="How many times in a row an analysis may be reused for an unchanged frame.")
+
+
+settings = ChangeSettings()
+stats = {"analyses": 0, "llm_calls_avoided": 0, "settle_waits": 0}
+
+
+def dhash(image: Image.Image, hash_size: int | None = None) -> int:
+    """
+    **Compute the difference hash of an image.**
+    Every bit tells whether a pixel of the downscaled grayscale image is brighter than
+    its right neighbour.
+    """
+    hash_size = hash_size or settings.hash_size
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    # One byte per pixel in mode "L".
+    pixels = small.tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def is_same(first: int | None, second: int | None, threshold: int | None = None) -> bool:
+    """Whether two hashes belong to effectively identical frames."""
+    if first is None or second is None:
+        return False
+    threshold = settings.hash_threshold if threshold is None else threshold
+    return (first ^ second).bit_count() <= threshold
+
+
+def changed_tiles(previous: Image.Image, current: Image.Image, grid: tuple[int, int] | None = None,
+                  threshold: float | None = None) -> list[tuple[int, int, int, int]]:
+    """
+    **Find the tiles that differ between two frames of the same size.**
+    A tile changed when its mean grayscale difference exceeds `threshold`, or when more
+    than `settings.changed_pixels` of its pixels changed by over `settings.pixel_delta`,
+    so a small change such as a line typed into a text box is not averaged away. Frames
+    are compared at full resolution for that reason.
+    Returns:
+        list[tuple[int, int, int, int]]: The `(left, top, width, height)` of every changed
+                                         tile, in the pixel coordinates of `current`.
+    """
+    columns, rows = grid or settings.tile_grid
+    threshold = settings.tile_threshold if threshold is None else threshold
+    if previous.size != current.size:
+        return [(0, 0, *current.size)]
+
+    difference = ImageChops.difference(previous.convert("L"), current.convert("L"))
+    if difference.getextrema()[1] <= min(threshold, settings.pixel_delta):
+        return []
+    # 1 for every pixel that changed noticeably, so the sum of a tile counts them.
+    changed = difference.point([0] * (settings.pixel_delta + 1) + [1] * (255 - settings.pixel_delta))
+
+    tiles = []
+    for row in range(rows):
+        for column in range(columns):
+            box = (column * current.width // columns, row * current.height // rows,
+                   (column + 1) * current.width // columns, (row + 1) * current.height // rows)
+            if (ImageStat.Stat(changed.crop(box)).sum[0] > settings.changed_pixels
+                    or ImageStat.Stat(difference.crop(box)).mean[0] > threshold):
+                tiles.append((box[0], box[1], box[2] - box[0], box[3] - box[1]))
+    return tiles
+
+
+def wait_until_stable(grab: Callable[[], Image.Image], previous: Image.Image | None = None) -> Image.Image:
+    """
+    **Grab frames until two consecutive ones show no changed tile.**
+    Gives up after `settings.settle_timeout` and returns the latest frame.
+    """
+    deadline = time.monotonic() + settings.settle_timeout
+    current = grab()
+    while time.monotonic() < deadline:
+        if previous is not None and not changed_tiles(previous, current):
+            break
+        time.sleep(settings.settle_interval)
+        previous, current = current, grab()
+    else:
+        logger.debug("Screen did not settle within %.2fs", settings.settle_timeout)
+    stats["settle_waits"] += 1
+    return current
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: frecency.py
+Description:
+    This module remembers which target every request was resolved to, so a repeated
+    request opens its usual target without text improvement, search or judging. Every
+    successful open adds a visit to the (normalized request, path) pair; visits decay
+    exponentially with a configurable half-life, so frequently and recently opened
+    targets rank first. A request is answered directly only when its best target has
+    enough recent visits and clearly dominates the others, and only if the path still
+    exists; missing paths are forgotten. The decayed visits of every path, whatever the
+    request, also boost matching candidates in `candidate_ranker`.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import candidate_ranker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".her", "frecency.sqlite3")
+HALF_LIFE = 14 * 24 * 3600.
+# A request opens its target directly past this many decayed visits, i.e. twice lately...
+CONFIDENCE = 1.5
+# ...if the target holds this share of the visits of the request.
+DOMINANCE = .75
+MAX_ENTRIES = 4096
+
+
+class FrecencyStore:
+    """A bounded SQLite store of decayed visit counts per (normalized request, path)."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, half_life: float = HALF_LIFE, max_entries: int = MAX_ENTRIES):
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self.enabled = os.environ.get("HER_FRECENCY", "1") != "0"
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0, "forgotten": 0}
+
+        self._lock = threading.Lock()
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS visits (task TEXT NOT NULL, path TEXT NOT NULL, score REAL NOT NULL, updated REAL NOT NULL, PRIMARY KEY (task, path));
+            CREATE INDEX IF NOT EXISTS visits_path ON visits (path);
+        """)
+
+    def _decayed(self, score: float, updated: float, now: float) -> float:
+        return score * 0.5 ** (max(0., now - updated) / self.half_life)
+
+    def record(self, task: str, path: str) -> None:
+        """Add a visit of `path` for `task`, evicting the least recently visited pairs past `max_entries`."""
+        key = candidate_ranker.normalize(task)
+        if not self.enabled or not key or not path:
+            return
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT score, updated FROM visits WHERE task = ? AND path = ?", (key, path)).fetchone()
+            score = (self._decayed(*row, now) if row else 0.) + 1.
+            self._db.execute("INSERT OR REPLACE INTO visits VALUES (?, ?, ?, ?)", (key, path, score, now))
+            self._db.execute("DELETE FROM visits WHERE rowid NOT IN (SELECT rowid FROM visits ORDER BY updated DESC LIMIT ?)", (self.max_entries,))
+            self._db.commit()
+            self.stats["recorded"] += 1
+
+    def forget(self, path: str) -> None:
+        with self._lock:
+            self.stats["forgotten"] += self._db.execute("DELETE FROM visits WHERE path = ?", (path,)).rowcount
+            self._db.commit()
+
+    def ranked(self, task: str) -> list[tuple[float, str]]:
+        """
+        **The targets `task` was resolved to before, most frecent first.**
+        Returns:
+            list[tuple[float, str]]: `(decayed visits, path)` pairs of paths that still exist.
+        """
+        if not self.enabled:
+            return []
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute("SELECT score, updated, path FROM visits WHERE task = ?", (candidate_ranker.normalize(task),)).fetchall()
+        ranked = []
+        for score, updated, path in rows:
+            if not os.path.exists(path):
+                logger.info("Forgetting %s, which no longer exists", path)
+                self.forget(path)
+                continue
+            ranked.append((self._decayed(score, updated, now), path))
+        ranked.sort(reverse=True)
+        return ranked
+
+    def lookup(self, task: str, confidence: float = CONFIDENCE, dominance: float = DOMINANCE) -> str | None:
+        """
+        **The usual target of a repeated request, if it is a confident one.**
+        Parameters:
+            task (str): The request, normalized before the lookup.
+            confidence (float): The decayed visits the best target needs at least.
+            dominance (float): The share of the request's visits the best target needs at least.
+        Returns:
+            str | None: The path to open, or None when the request should be resolved normally.
+        """
+        ranked = self.ranked(task)
+        if ranked and ranked[0][0] >= confidence and ranked[0][0] >= dominance * sum(score for score, _ in ranked):
+            self.stats["hits"] += 1
+            return ranked[0][1]
+        self.stats["misses"] += 1
+        return None
+
+    def boosts(self, paths: list[str]) -> dict[str, float]:
+        """
+        **How familiar every path is, across all requests.**
+        Returns:
+            dict[str, float]: A value in [0, 1) for each path visited before, growing with its decayed visits.
+        """
+        paths = list(dict.fromkeys(path for path in paths if path))
+        if not self.enabled or not paths:
+            return {}
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(f"SELECT path, score, updated FROM visits WHERE path IN ({','.join('?' * len(paths))})", paths).fetchall()
+        totals: dict[str, float] = {}
+        for path, score, updated in rows:
+            totals[path] = totals.get(path, 0.) + self._decayed(score, updated, now)
+        return {path: total / (total + 1.) for path, total in totals.items()}
+
+
+_store: FrecencyStore | None = None
+
+
+def get_store() -> FrecencyStore:
+    global _store
+    if _store is None:
+        _store = FrecencyStore()
+    return _store
+
+
+def set_store(store: FrecencyStore | None) -> None:
+    global _store
+    _store = store
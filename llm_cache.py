@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: llm_cache.py
+Description:
+    This module provides a two-tier response cache for chat model calls. Responses are
+    looked up in an in-memory LRU first and in a persistent SQLite tier second; the disk
+    tier expires entries after a TTL and evicts the least recently used ones once it
+    grows past a size bound. Keys are a hash of the normalized messages, the model name
+    and the structured-output schema, so the same voice command asked twice is answered
+    without a model round trip. `CachedLLM` wraps any object exposing `invoke` and
+    `with_structured_output`, which makes a stub model a drop-in for offline runs.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".her", "llm_cache.sqlite3")
+MEMORY_ENTRIES = 256
+DISK_MAX_BYTES = 64 * 1024 * 1024
+TTL = 7 * 24 * 3600.
+
+
+def _normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _message_payload(message) -> list:
+    content = message.content
+    if isinstance(content, str):
+        content = _normalize(content)
+    return [message.type, content]
+
+
+def make_key(messages: list, model_name: str, schema=None) -> str:
+    """
+    **Hash a call into a cache key.**
+    Parameters:
+        messages (list): The messages sent to the model.
+        model_name (str): The name of the model answering the call.
+        schema: The structured-output schema, or None for a plain chat call.
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    payload = {
+        "model": model_name,
+        "schema": f"{schema.__module__}.{schema.__qualname__}" if schema is not None else None,
+        "messages": [_message_payload(message) for message in messages],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """An in-memory LRU in front of a TTL- and size-bounded SQLite store."""
+
+    def __init__(self, db_path: str | None = DEFAULT_DB_PATH, memory_entries: int = MEMORY_ENTRIES,
+                 disk_max_bytes: int = DISK_MAX_BYTES, ttl: float = TTL):
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self.enabled = os.environ.get("HER_LLM_CACHE", "1") != "0"
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            if os.path.dirname(db_path):
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)""")
+            self._db.commit()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                created, value = self._memory[key]
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] < self.ttl:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[1], row[0])
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is None:
+                return
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, value, now, now, len(value.encode("utf-8"))))
+            self._evict(now)
+            self._db.commit()
+
+    def _remember(self, key: str, created: float, value: str) -> None:
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.disk_max_bytes:
+            return
+        # Drop the least recently used rows until the store is back under the bound.
+        excess = total - self.disk_max_bytes
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+
+def _dump(response, schema) -> str:
+    if schema is None:
+        return json.dumps({"content": response.content}, ensure_ascii=False)
+    if hasattr(response, "model_dump"):
+        return json.dumps(response.model_dump(mode="json"), ensure_ascii=False)
+    return json.dumps(response, ensure_ascii=False)
+
+
+def _load(value: str, schema):
+    data = json.loads(value)
+    if schema is None:
+        return AIMessage(content=data["content"])
+    if hasattr(schema, "model_validate"):
+        return schema.model_validate(data)
+    return data
+
+
+class CachedLLM:
+    """
+    **A chat model wrapper answering repeated calls from a `ResponseCache`.**
+    Only `invoke`, `ainvoke` and `with_structured_output` are used, so `llm` may be any
+    stub exposing them. Set `cache.enabled = False` (or `HER_LLM_CACHE=0`) to bypass the cache.
+    """
+
+    def __init__(self, llm, cache: ResponseCache | None = None, model_name: str | None = None, schema=None, _structured=None):
+        self.llm = llm
+        self.cache = cache if cache is not None else ResponseCache()
+        self.model_name = model_name or getattr(llm, "model_name", None) or type(llm).__name__
+        self.schema = schema
+        self._runnable = _structured if _structured is not None else llm
+
+    def with_structured_output(self, schema, **kwargs) -> "CachedLLM":
+        return CachedLLM(self.llm, self.cache, self.model_name, schema, self.llm.with_structured_output(schema, **kwargs))
+
+    def _key(self, messages: list) -> str | None:
+        """The cache key of a call, or None when the cache is bypassed."""
+        if not self.cache.enabled:
+            self.cache.stats["bypassed"] += 1
+            return None
+        return make_key(messages, self.model_name, self.schema)
+
+    def invoke(self, messages: list, **kwargs):
+        key = self._key(messages)
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            logger.debug("LLM cache hit %s", key[:12])
+            telemetry.record(llm_cache_hits=1)
+            return _load(cached, self.schema)
+
+        with telemetry.llm_call(kwargs) as kwargs:
+            response = self._runnable.invoke(messages, **kwargs)
+        if key is not None:
+            self.cache.put(key, _dump(response, self.schema))
+        return response
+
+    async def ainvoke(self, messages: list, **kwargs):
+        """The asynchronous `invoke`, awaiting the wrapped model's `ainvoke` on a miss."""
+        key = self._key(messages)
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            logger.debug("LLM cache hit %s", key[:12])
+            telemetry.record(llm_cache_hits=1)
+            return _load(cached, self.schema)
+
+        with telemetry.llm_call(kwargs) as kwargs:
+            response = await self._runnable.ainvoke(messages, **kwargs)
+        if key is not None:
+            self.cache.put(key, _dump(response, self.schema))
+        return response
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: log_pipeline.py
+Description:
+    This module is the one logging setup shared by every entry point, replacing the
+    handlers modules used to attach at import time. Records go into a bounded queue
+    in the calling thread and are written by a background listener, to the console
+    and as JSON Lines to a file, so log I/O never blocks an operation or a graph step.
+    When the queue is full, records are dropped and counted rather than waited on.
+    Messages are formatted by the writer, not the caller, so log calls must pass
+    arguments %-style (`logger.debug("Text: %s", text)`), which also makes disabled
+    levels free. Every record carries the task and correlation id of the `context` it
+    is logged in, and a message template repeated more than `burst` times within
+    `window` seconds is suppressed until the window ends; the next record that gets
+    through reports how many were dropped.
+
+    Modules keep using `logging.getLogger(__name__)`; entry points call `setup()`.
+"""
+import atexit
+import contextlib
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+
+from pydantic import BaseModel, Field
+
+CONSOLE_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(task_label)s%(message)s"
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".her", "logs", "her.jsonl")
+
+
+class LogSettings(BaseModel):
+    """Where records go and how many of them."""
+
+    level: str = Field(os.environ.get("HER_LOG_LEVEL", "INFO"), description="The lowest level logged.")
+    console: bool = Field(True, description="Whether records are written to stderr.")
+    path: str | None = Field(os.environ.get("HER_LOG_PATH", DEFAULT_PATH) or None, description="The JSON Lines file, None for none.")
+    max_bytes: int = Field(10 * 1024 * 1024, description="The size at which the file is rotated.")
+    backups: int = Field(3, description="The number of rotated files kept.")
+    queue_size: int = Field(10_000, description="The records waiting to be written at most; more are dropped.")
+    burst: int = Field(20, description="How many times a message template is logged per window.")
+    window: float = Field(10., description="The rate limiting window in seconds.")
+
+
+settings = LogSettings()
+stats = {"dropped": 0, "suppressed": 0}
+
+_task: contextvars.ContextVar[str] = contextvars.ContextVar("log_task", default="")
+_correlation_id: contextvars.ContextVar[str] = contextvars.ContextVar("log_correlation_id", default="")
+
+
+@contextlib.contextmanager
+def context(task: str | None = None, correlation_id: str | None = None):
+    """
+    **Tag every record logged inside with a task and a correlation id.**
+    A correlation id already set by an enclosing context (e.g. the daemon's task id) is
+    kept unless one is given; otherwise a new one is generated.
+    """
+    task_token = _task.set(task) if task is not None else None
+    correlation_token = _correlation_id.set(correlation_id or _correlation_id.get() or uuid.uuid4().hex[:12])
+    try:
+        yield _correlation_id.get()
+    finally:
+        _correlation_id.reset(correlation_token)
+        if task_token is not None:
+            _task.reset(task_token)
+
+
+class _ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.task = _task.get()
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+class _RateLimit(logging.Filter):
+    """Let each (logger, level, template) through `burst` times per `window`, counting the rest."""
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._counts: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            # [window start, records let through, records suppressed]
+            count = self._counts.get(key)
+            if count is None or now - count[0] >= self.window:
+                if len(self._counts) > 4096:
+                    self._counts.clear()
+                record.suppressed = count[2] if count else 0
+                self._counts[key] = [now, 1, 0]
+                return True
+            if count[1] < self.burst:
+                count[1] += 1
+                record.suppressed = 0
+                return True
+            count[2] += 1
+            stats["suppressed"] += 1
+            return False
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records unformatted and without ever waiting."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info:
+            # Tracebacks are rendered now, while their frames are guaranteed to be current.
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            stats["dropped"] += 1
+
+
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "task", "correlation_id", "suppressed", "task_label"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the context fields and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "task": getattr(record, "task", ""),
+            "correlation_id": getattr(record, "correlation_id", ""),
+            "thread": record.threadName,
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RESERVED)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _ConsoleFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        record.task_label = f"[{record.correlation_id}] " if getattr(record, "correlation_id", "") else ""
+        message = super().format(record)
+        if getattr(record, "suppressed", 0):
+            message += f" ({record.suppressed} similar messages suppressed)"
+        return message
+
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: _QueueHandler | None = None
+_setup_lock = threading.Lock()
+
+
+def setup(options: LogSettings | None = None) -> None:
+    """
+    **Route every logger through the queue to the console and the JSON Lines file.**
+    Idempotent; calling it again with other options replaces the previous setup.
+    """
+    global _listener, _handler
+    options = options or settings
+    with _setup_lock:
+        shutdown()
+        handlers = []
+        if options.console:
+            console = logging.StreamHandler()
+            console.setFormatter(_ConsoleFormatter(CONSOLE_FORMAT))
+            handlers.append(console)
+        if options.path:
+            os.makedirs(os.path.dirname(options.path) or ".", exist_ok=True)
+            file = logging.handlers.RotatingFileHandler(options.path, maxBytes=options.max_bytes, backupCount=options.backups, encoding="utf-8")
+            file.setFormatter(JsonFormatter())
+            handlers.append(file)
+
+        _handler = _QueueHandler(queue.Queue(options.queue_size))
+        _handler.addFilter(_ContextFilter())
+        _handler.addFilter(_RateLimit(options.burst, options.window))
+        root = logging.getLogger()
+        root.setLevel(options.level.upper())
+        root.addHandler(_handler)
+        _listener = logging.handlers.QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown() -> None:
+    """Write the records still queued and detach the pipeline."""
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -1,9 +1,52 @@
-import environments
-from langchain_openai import ChatOpenAI
+"""
+The shared chat model. It is built on first use, so importing this module stays cheap:
+`model.llm` and `model.cached_llm` are resolved lazily, and `set_llm` swaps in any other
+model (e.g. a stub) for both. The endpoint is reached through a `model_gateway`, whose
+deadlines, hedging and concurrency limit are set by `gateway_settings` before first use.
+"""
+import threading
 
 configure = {
     "model": "gpt-4o-2024-11-20",
     "base_url": "https://vip.apiyi.com/v1"
 }
 
-llm = ChatOpenAI(**configure)
+gateway_settings = None
+
+_lock = threading.Lock()
+_llm = None
+_cached_llm = None
+
+def get_llm():
+    global _llm
+    with _lock:
+        if _llm is None:
+            import environments
+            import model_gateway
+            _llm = model_gateway.build(configure, gateway_settings)
+    return _llm
+
+def get_cached_llm():
+    global _cached_llm
+    llm = get_llm()
+    with _lock:
+        if _cached_llm is None:
+            from llm_cache import CachedLLM
+            _cached_llm = CachedLLM(llm, model_name=configure["model"])
+    return _cached_llm
+
+def set_llm(llm, model_name: str | None = None) -> None:
+    """Replace the shared model, keeping the response cache."""
+    global _llm, _cached_llm
+    from llm_cache import CachedLLM
+    with _lock:
+        cache = _cached_llm.cache if _cached_llm is not None else None
+        _llm = llm
+        _cached_llm = CachedLLM(llm, cache, model_name=model_name)
+
+def __getattr__(name: str):
+    if name == "llm":
+        return get_llm()
+    if name == "cached_llm":
+        return get_cached_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: model_gateway.py
+Description:
+    This module puts a gateway between the graphs and the chat model endpoint, so one
+    slow response from the proxy no longer stalls a whole task. All calls share
+    keep-alive HTTP connection pools (one per event loop for asynchronous calls), run
+    under a per-call deadline and pass a global concurrency limiter that makes callers
+    wait for a slot (and fail fast once the wait is too long) instead of piling requests
+    on the endpoint. A call still running after
+    `hedge_after` seconds is duplicated and the first answer wins. Transient failures are
+    retried with exponential backoff and jitter within the deadline. `StubServer` speaks
+    the chat completions protocol with configurable latency and failures, so the gateway
+    can be exercised without the real endpoint:
+
+    python model_gateway.py [--calls 50] [--slow 0.2] [--fail 0.1]
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from pydantic import BaseModel, Field
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = frozenset((408, 409, 429, 500, 502, 503, 504))
+
+
+class GatewaySettings(BaseModel):
+    """Deadlines, hedging, concurrency and retries of model calls."""
+
+    deadline: float = Field(30., description="The longest a call may take in seconds, retries and hedges included.")
+    hedge_after: float | None = Field(4., description="Seconds after which a still running call is duplicated, None to never hedge.")
+    max_concurrency: int = Field(8, description="The number of requests in flight at most, hedges included.")
+    queue_timeout: float = Field(10., description="The longest a call waits for a free slot before it is rejected.")
+    max_retries: int = Field(2, description="How many times a transient failure is retried.")
+    backoff: float = Field(.5, description="The first retry delay in seconds, doubled on every retry.")
+    max_backoff: float = Field(8., description="The longest retry delay in seconds.")
+    max_connections: int = Field(16, description="The size of the shared HTTP connection pool.")
+    keepalive_expiry: float = Field(60., description="How long an idle pooled connection is kept open, in seconds.")
+
+
+class GatewayBusy(RuntimeError):
+    """Raised when no concurrency slot frees up within `queue_timeout`."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call has no answer within its deadline."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error from the model client is worth retrying: timeouts, connection errors, 429 and 5xx."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+_clients: tuple | None = None
+_clients_lock = threading.Lock()
+
+
+def _per_loop_transport(**options):
+    """
+    An `httpx` async transport keeping one connection pool per event loop. Pooled
+    connections belong to the loop that opened them, so a pool shared across loops, e.g.
+    one `asyncio.run` per daemon task, fails with "Event loop is closed" on the next loop.
+    """
+    import httpx
+
+    class PerLoopTransport(httpx.AsyncBaseTransport):
+        def __init__(self):
+            # A pool is dropped along with its loop.
+            self._transports: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+            self._lock = threading.Lock()
+
+        def _transport(self) -> httpx.AsyncHTTPTransport:
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                transport = self._transports.get(loop)
+                if transport is None:
+                    transport = self._transports[loop] = httpx.AsyncHTTPTransport(**options)
+            return transport
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            return await self._transport().handle_async_request(request)
+
+        async def aclose(self) -> None:
+            with self._lock:
+                transport = self._transports.pop(asyncio.get_running_loop(), None)
+            if transport is not None:
+                await transport.aclose()
+
+    return PerLoopTransport()
+
+
+def http_clients(settings: GatewaySettings) -> tuple:
+    """The shared synchronous and asynchronous `httpx` clients, created on first use."""
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            import httpx
+
+            limits = httpx.Limits(max_connections=settings.max_connections, max_keepalive_connections=settings.max_connections,
+                                  keepalive_expiry=settings.keepalive_expiry)
+            timeout = httpx.Timeout(settings.deadline, connect=min(5., settings.deadline))
+            _clients = (httpx.Client(limits=limits, timeout=timeout),
+                        httpx.AsyncClient(timeout=timeout, transport=_per_loop_transport(limits=limits)))
+    return _clients
+
+
+class _Shared:
+    """The state every gateway derived from one model shares: slots, threads and metrics."""
+
+    def __init__(self, settings: GatewaySettings):
+        self.settings = settings
+        self.slots = threading.BoundedSemaphore(settings.max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=2 * settings.max_concurrency, thread_name_prefix="model")
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "retries": 0, "failures": 0,
+                      "deadline_exceeded": 0, "rejected": 0, "peak_in_flight": 0}
+
+    def count(self, key: str, amount: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += amount
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self.slots.acquire(blocking, self.settings.queue_timeout if blocking else None):
+            return False
+        with self.lock:
+            self.in_flight += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+        return True
+
+    def release(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    async def aacquire(self) -> bool:
+        """
+        `acquire` without blocking the event loop. The waiting thread cannot be interrupted,
+        so when the caller is cancelled the slot it gets is released instead of leaked.
+        """
+        lock, state = threading.Lock(), {"cancelled": False, "acquired": False}
+
+        def acquire() -> bool:
+            acquired = self.acquire()
+            with lock:
+                if acquired and state["cancelled"]:
+                    self.release()
+                    return False
+                state["acquired"] = acquired
+            return acquired
+
+        try:
+            return await asyncio.to_thread(acquire)
+        except asyncio.CancelledError:
+            with lock:
+                state["cancelled"] = True
+                if state["acquired"]:
+                    self.release()
+            raise
+
+
+class ModelGateway:
+    """
+    **A chat model wrapper adding deadlines, hedging, a concurrency limit and retries.**
+    Only `invoke`, `ainvoke` and `with_structured_output` of the wrapped model are used;
+    its own retries should be disabled (`max_retries=0`) since the gateway retries.
+    """
+
+    def __init__(self, llm, settings: GatewaySettings | None = None, _shared: _Shared | None = None):
+        self.llm = llm
+        self.model_name = getattr(llm, "model_name", None) or type(llm).__name__
+        self._shared = _shared or _Shared(settings or GatewaySettings())
+        self.settings = self._shared.settings
+
+    @property
+    def stats(self) -> dict:
+        return self._shared.stats
+
+    def with_structured_output(self, schema, **kwargs) -> "ModelGateway":
+        gateway = ModelGateway(self.llm.with_structured_output(schema, **kwargs), _shared=self._shared)
+        gateway.model_name = self.model_name
+        return gateway
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.settings.max_backoff, self.settings.backoff * 2 ** attempt)
+        return delay * random.uniform(.5, 1.)
+
+    def _failed(self, error: BaseException, attempt: int, deadline: float) -> float:
+        """The delay before the next attempt, or raise `error` when it should not be retried."""
+        delay = self._backoff(attempt)
+        if attempt >= self.settings.max_retries or not is_retryable(error) or time.monotonic() + delay >= deadline:
+            self._shared.count("failures")
+            raise error
+        self._shared.count("retries")
+        telemetry.record(llm_retries=1)
+        logger.warning("Model call failed (%s), retry %d in %.2fs", type(error).__name__, attempt + 1, delay)
+        return delay
+
+    # Synchronous calls
+    def _attempt(self, messages: list, deadline: float, kwargs: dict):
+        """One attempt, hedged once it is slower than `hedge_after`."""
+        shared = self._shared
+        context = contextvars.copy_context()
+        futures = [shared.executor.submit(context.copy().run, self.llm.invoke, messages, **kwargs)]
+        hedge, hedged = None, self.settings.hedge_after is None
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    shared.count("deadline_exceeded")
+                    raise DeadlineExceeded(f"No answer within {self.settings.deadline:.1f}s.")
+                timeout = remaining if hedged else min(remaining, self.settings.hedge_after)
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    futures.remove(future)
+                    if future.exception() is None:
+                        if future is hedge:
+                            shared.count("hedge_wins")
+                        return future.result()
+                    if not futures:
+                        raise future.exception()
+
+                if not done and not hedged:
+                    hedged = True
+                    # The hedge takes a slot of its own; skip it rather than wait for one.
+                    if shared.acquire(blocking=False):
+                        shared.count("hedges")
+                        telemetry.record(llm_hedges=1)
+                        hedge = shared.executor.submit(context.copy().run, self.llm.invoke, messages, **kwargs)
+                        hedge.add_done_callback(lambda _: shared.release())
+                        futures.append(hedge)
+        finally:
+            # A running thread cannot be stopped, its answer is simply dropped.
+            for future in futures:
+                future.cancel()
+
+    def invoke(self, messages: list, **kwargs):
+        shared = self._shared
+        shared.count("calls")
+        if not shared.acquire():
+            shared.count("rejected")
+            raise GatewayBusy(f"No model slot free within {self.settings.queue_timeout:.1f}s.")
+        try:
+            deadline = time.monotonic() + self.settings.deadline
+            attempt = 0
+            while True:
+                try:
+                    return self._attempt(messages, deadline, kwargs)
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    time.sleep(self._failed(e, attempt, deadline))
+                    attempt += 1
+        finally:
+            shared.release()
+
+    # Asynchronous calls
+    async def _aattempt(self, messages: list, deadline: float, kwargs: dict):
+        shared = self._shared
+        tasks = [asyncio.ensure_future(self.llm.ainvoke(messages, **kwargs))]
+        hedge, hedged = None, self.settings.hedge_after is None
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    shared.count("deadline_exceeded")
+                    raise DeadlineExceeded(f"No answer within {self.settings.deadline:.1f}s.")
+                timeout = remaining if hedged else min(remaining, self.settings.hedge_after)
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        if task is hedge:
+                            shared.count("hedge_wins")
+                        return task.result()
+                    if not tasks:
+                        raise task.exception()
+
+                if not done and not hedged:
+                    hedged = True
+                    if shared.acquire(blocking=False):
+                        shared.count("hedges")
+                        telemetry.record(llm_hedges=1)
+                        hedge = asyncio.ensure_future(self.llm.ainvoke(messages, **kwargs))
+                        hedge.add_done_callback(lambda _: shared.release())
+                        tasks.append(hedge)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def ainvoke(self, messages: list, **kwargs):
+        shared = self._shared
+        shared.count("calls")
+        if not await shared.aacquire():
+            shared.count("rejected")
+            raise GatewayBusy(f"No model slot free within {self.settings.queue_timeout:.1f}s.")
+        try:
+            deadline = time.monotonic() + self.settings.deadline
+            attempt = 0
+            while True:
+                try:
+                    return await self._aattempt(messages, deadline, kwargs)
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    await asyncio.sleep(self._failed(e, attempt, deadline))
+                    attempt += 1
+        finally:
+            shared.release()
+
+
+"""Stub endpoint"""
+class StubServer:
+    """
+    **A local chat completions endpoint answering slowly or failing on demand.**
+    Every request sleeps `latency` seconds, or `slow_latency` with probability `slow`,
+    and fails with HTTP 503 with probability `fail`. The answer echoes the last message.
+    """
+
+    def __init__(self, latency: float = .05, slow: float = 0., slow_latency: float = 2., fail: float = 0., seed: int = 0, port: int = 0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.requests = 0
+        generator = random.Random(seed)
+        lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections open like the real endpoint, so pooling is exercised.
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with lock:
+                    server.requests += 1
+                    failing, slow_call = generator.random() < fail, generator.random() < slow
+                time.sleep(slow_latency if slow_call else latency)
+                if failing:
+                    return self._reply(503, {"error": {"message": "stub failure", "type": "server_error"}})
+                content = str((body.get("messages") or [{}])[-1].get("content", ""))
+                self._reply(200, {
+                    "id": f"stub-{server.requests}", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(content), "completion_tokens": len(content), "total_tokens": 2 * len(content)},
+                })
+
+            def _reply(self, status: int, body: dict) -> None:
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-model", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def build(configure: dict, settings: GatewaySettings | None = None) -> ModelGateway:
+    """
+    **Create the chat model behind a gateway.**
+    Parameters:
+        configure (dict): The `ChatOpenAI` arguments, e.g. `model` and `base_url`.
+        settings (GatewaySettings | None): The gateway settings, the defaults if None.
+    """
+    from langchain_openai import ChatOpenAI
+
+    settings = settings or GatewaySettings()
+    client, async_client = http_clients(settings)
+    llm = ChatOpenAI(**configure, http_client=client, http_async_client=async_client, timeout=settings.deadline, max_retries=0)
+    return ModelGateway(llm, settings)
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor as Pool
+
+    from langchain_core.messages import HumanMessage
+
+    parser = argparse.ArgumentParser(description="Exercise the gateway against a local stub endpoint.")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16, help="the number of callers")
+    parser.add_argument("--slow", type=float, default=.2, help="the share of slow responses")
+    parser.add_argument("--fail", type=float, default=.1, help="the share of failing responses")
+    parser.add_argument("--hedge-after", type=float, default=.5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    with StubServer(latency=.05, slow=args.slow, slow_latency=3., fail=args.fail) as server:
+        gateway = build({"model": "stub", "base_url": server.base_url, "api_key": "stub"},
+                        GatewaySettings(hedge_after=args.hedge_after, deadline=10., backoff=.05))
+
+        def call(index: int) -> float:
+            start = time.perf_counter()
+            gateway.invoke([HumanMessage(f"ping {index}")])
+            return time.perf_counter() - start
+
+        with Pool(args.concurrency) as pool:
+            latencies = sorted(pool.map(call, range(args.calls)))
+        print(f"p50 {latencies[len(latencies) // 2]:.3f}s, p99 {latencies[int(len(latencies) * .99)]:.3f}s, "
+              f"max {latencies[-1]:.3f}s, server requests {server.requests}")
+        print(gateway.stats)
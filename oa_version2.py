@@ -1,25 +1,34 @@
-import os
+import time
 import tools
+import speech
+import asyncio
 import logging
-
-from model import llm
+import functools
+import contextvars
+import file_index
+import frecency
+import candidate_ranker
+import search_coordinator
+import telemetry
+import prompt_builder
+import log_pipeline
+
+import model
 from typing import TypedDict
 
 from langgraph.graph import END, START, StateGraph
 from langchain_core.messages import SystemMessage, HumanMessage
 
-# Configure logger
+# Records are written off-thread by log_pipeline, set up by the entry point
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-handler = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+coordinator = None
 
 # Get the desktop items
 def init(*args, **kwargs):
     global step_mapping
     global desktop_items
+    global coordinator
 
     global JUDGE_INSTRUCTIONS, IMPROVE_INSTRUCTION
 
@@ -27,18 +36,22 @@ def init(*args, **kwargs):
 
     desktop_items = tools.get_desktop_items("open")
 
+    # Every source is searched at once: the keywords of the task first, the judge's regex next
+    if coordinator is None:
+        coordinator = search_coordinator.SearchCoordinator(search_coordinator.default_sources())
+
     step_mapping = dict((
-        (0, lambda *x, **y: desktop_items),
-        (1, tools.get_by_everytools_search),
-        (2, tools.get_by_windows_search),
+        (0, coordinator.search),
+        (1, coordinator.search),
+        (2, lambda regex, task: tools.get_by_windows_search(regex)),
     ))
 
-    JUDGE_INSTRUCTIONS = """你是一个 AI 助手，负责判断用户请求的文件或文件夹是否在可疑列表中。任务如下：{task}。
+    JUDGE_INSTRUCTIONS = """你是一个 AI 助手，负责判断用户请求的文件或文件夹是否在可疑列表中。任务和可疑列表在用户消息中给出，可疑列表中每个候选以编号开头。
 
     对于每个请求，请按照以下步骤操作：
 
     1. **检查是否可疑：**
-    - 如果请求的文件或文件夹在可疑列表中，将变量 `satisfied` 设置为 `True`，并提供该文件或文件夹的 **确切路径**。
+    - 如果请求的文件或文件夹在可疑列表中，将变量 `satisfied` 设置为 `True`，并在 `target_path` 中提供该候选的 **编号**。
     - 如果请求的文件或文件夹 **不在** 可疑列表中，将 `satisfied` 设置为 `False`，并提供一个 **灵活的正则表达式**，该表达式可用于搜索该文件或文件夹。正则表达式应足够宽泛，以捕捉名称或路径中的变体，以匹配用户的请求，考虑到可能的措辞或命名规范的差异。
     - 请注意，用户提供的可能是目标文件或文件夹的常见变体，因此进行检查时要保持适当的灵活性，格外注意用户暗示的文件类型。
 
@@ -88,6 +101,7 @@ class InputState(TypedDict):
 
 class OuputState(TypedDict):
     satisfied: bool
+    target_path: str
 
 class OverallState(TypedDict):
     task: str
@@ -96,44 +110,93 @@ class OverallState(TypedDict):
     target_path: str
     current_step: int 
     suspicious: list[str]
+    prefetched: str
+    request: str
 
 class JudgeState(TypedDict):
     regex: str = ""
     satisfied: bool = False
     target_path: str = ""
 
+def _speculate(text: str) -> dict | None:
+    match, _ = candidate_ranker.shortlist(text, tools.get_desktop_items("open"))
+    return match
+
 def voice_to_text(state: OverallState) -> OverallState:
+    if state.get("task"):
+        # The task was given directly, e.g. by the daemon
+        return {}
     logger.info("Converting voice to text")
+    recognizer = speech.get_recognizer()
+    if recognizer is not None:
+        # Search the desktop on stable partial transcripts while the user is still speaking
+        speculation = speech.SpeculativeTask(_speculate)
+        try:
+            text, match = speech.listen(recognizer, speculation=speculation)
+        finally:
+            speculation.close()
+        logger.debug("Recognized text: %s, speculation: %s", text, speculation.stats)
+        return {"task": text, "prefetched": match["path"] if match else ""}
+
     while text:= tools.recognize_speech_from_microphone():
         if text != None:
             break
-    logger.debug(f"Recognized text: {text}")
+    logger.debug("Recognized text: %s", text)
     return {"task": text}
 
+def _recall(state: OverallState) -> OverallState | None:
+    """Skip improvement, search and judging when the request usually opens the same target."""
+    path = frecency.get_store().lookup(state["task"])
+    if path is None:
+        return None
+    logger.info("Recalled %s for a repeated request", path)
+    return {"prefetched": path}
+
 def text_improvement(state: OverallState) -> OverallState:
+    if state.get("prefetched"):
+        return {}
+    if recalled := _recall(state):
+        return recalled
     logger.info("Improving text")
-    improved = llm.invoke([SystemMessage(IMPROVE_INSTRUCTION)] + [HumanMessage(state["task"])])
-    logger.debug(f"Improved text: {improved.content}")
-    return {"task": improved}
+    improved = model.cached_llm.invoke([SystemMessage(IMPROVE_INSTRUCTION)] + [HumanMessage(state["task"])])
+    logger.debug("Improved text: %s", improved.content)
+    # The request as said is kept, it is what frecency recalls targets by
+    return {"task": improved.content, "request": state["task"]}
 
-def judge(state: OverallState) -> OverallState:
-    logger.info("Judging the task")
+def _search(state: OverallState) -> tuple[int, list, dict | None]:
+    """Run the search of the current step and rank the results; returns the next step, the shortlist and a confident match."""
     step = state["current_step"]
-    results = step_mapping[step](state["regex"])
-    state["current_step"] = step + 1
-    state["suspicious"] = results
+    if state.get("prefetched"):
+        return step + 1, [], {"path": state["prefetched"]}
+    results = step_mapping[step](state["regex"], state["task"])
 
-    system_messsage = JUDGE_INSTRUCTIONS.format(task=state['task'])
-    prompt = f"The suspicious files are {state['suspicious']}."
+    # Rank locally first, a clear winner needs no model call; targets opened often before rank higher
+    boosts = frecency.get_store().boosts([result["path"] for result in results or ()])
+    match, suspicious = candidate_ranker.shortlist(state["task"], results, boosts=boosts)
+    return step + 1, suspicious, match
 
-    judger = llm.with_structured_output(JudgeState)
-    judge = judger.invoke([SystemMessage(system_messsage)] + [HumanMessage(prompt)])
-    
-    info = "Judge result:\n"
-    for key, value in judge.items():
-        info += f"|{key}: {value}| "
-    logger.debug(info)
-    return {"satisfied": judge["satisfied"], "regex": judge["regex"], "target_path": judge["target_path"], "current_step": state["current_step"], "suspicious": state["suspicious"]}
+def _judge_messages(state: OverallState, suspicious: list) -> list:
+    # The instructions stay identical across calls so the provider can cache them
+    return prompt_builder.judge_messages(JUDGE_INSTRUCTIONS, state["task"], suspicious)
+
+def _judge_result(state: OverallState, step: int, suspicious: list, match: dict | None, judge: JudgeState | None) -> OverallState:
+    if match is not None:
+        logger.debug("Local ranker matched %s", match["path"])
+        return {"satisfied": True, "regex": state["regex"], "target_path": match["path"], "current_step": step, "suspicious": suspicious}
+
+    logger.debug("Judge result: %s", judge)
+    target_path = prompt_builder.resolve(judge["target_path"], suspicious)
+    return {"satisfied": judge["satisfied"], "regex": judge["regex"], "target_path": target_path, "current_step": step, "suspicious": suspicious}
+
+def judge(state: OverallState) -> OverallState:
+    logger.info("Judging the task")
+    step, suspicious, match = _search(state)
+    if match is not None:
+        return _judge_result(state, step, suspicious, match, None)
+
+    judger = model.cached_llm.with_structured_output(JudgeState)
+    judge = judger.invoke(_judge_messages(state, suspicious))
+    return _judge_result(state, step, suspicious, None, judge)
 
 def if_satisfied(state: OverallState) -> str:
     logger.info("Checking if satisfied")
@@ -146,26 +209,130 @@ def if_satisfied(state: OverallState) -> str:
     return "judge"
 
 def perfomr_task(state: OverallState) -> OuputState:
-    logger.info(f"Performing task: opening {state['target_path']}")
-    os.startfile(state["target_path"])
+    logger.info("Performing task: opening %s", state["target_path"])
+    tools.open_object(state["target_path"])
+    frecency.get_store().record(state.get("request") or state["task"], state["target_path"])
     return {"satisfied": True}
 
-graph = StateGraph(OverallState, input=InputState, output=OuputState)
+"""Asynchronous nodes, initialization and index warm-up run while the microphone listens"""
+node_timings: dict[str, float] = {}
+# The timings of the run in progress, kept apart so concurrent runs (see batch.py) do not mix.
+_run_timings: contextvars.ContextVar[dict[str, float]] = contextvars.ContextVar("run_timings")
+
+def _timed(name: str):
+    def decorator(node):
+        @functools.wraps(node)
+        async def wrapper(state):
+            start = time.perf_counter()
+            try:
+                return await node(state)
+            finally:
+                _run_timings.get(node_timings)[name] = time.perf_counter() - start
+        return wrapper
+    return decorator
+
+@_timed("init")
+async def ainit(state: OverallState) -> OverallState:
+    update, _ = await asyncio.gather(asyncio.to_thread(init, state), asyncio.to_thread(file_index.get_index))
+    return update
+
+@_timed("voice_to_text")
+async def avoice_to_text(state: OverallState) -> OverallState:
+    return await asyncio.to_thread(voice_to_text, state)
+
+@_timed("text_improvement")
+async def atext_improvement(state: OverallState) -> OverallState:
+    if state.get("prefetched"):
+        return {}
+    if recalled := await asyncio.to_thread(_recall, state):
+        return recalled
+    logger.info("Improving text")
+    improved = await model.cached_llm.ainvoke([SystemMessage(IMPROVE_INSTRUCTION)] + [HumanMessage(state["task"])])
+    logger.debug("Improved text: %s", improved.content)
+    return {"task": improved.content, "request": state["task"]}
 
-graph.add_node("init", init)
-graph.add_node("judge", judge)
-graph.add_node("perform_task", perfomr_task)
-graph.add_node("voice_to_text", voice_to_text)
-graph.add_node("text_improvement", text_improvement)
+@_timed("judge")
+async def ajudge(state: OverallState) -> OverallState:
+    logger.info("Judging the task")
+    step, suspicious, match = await asyncio.to_thread(_search, state)
+    if match is not None:
+        return _judge_result(state, step, suspicious, match, None)
 
-graph.add_edge(START, "init")
-graph.add_edge("init", "voice_to_text")
-graph.add_edge("voice_to_text", "text_improvement")
-graph.add_edge("text_improvement", "judge")
-graph.add_conditional_edges("judge", if_satisfied)
+    judger = model.cached_llm.with_structured_output(JudgeState)
+    judge = await judger.ainvoke(_judge_messages(state, suspicious))
+    return _judge_result(state, step, suspicious, None, judge)
 
-graph = graph.compile()
+@_timed("perform_task")
+async def aperform_task(state: OverallState) -> OuputState:
+    return await asyncio.to_thread(perfomr_task, state)
 
-states = graph.invoke({
-    "task": "请帮我打开项目2报告",
-})
+async def ainvoke(inputs: InputState) -> OuputState:
+    """
+    **Run the asynchronous graph and report how much the overlapping saved.**
+    `init` and `voice_to_text` start together, so the user does not wait for the
+    desktop enumeration and index loading after they finish speaking.
+    """
+    global node_timings
+    timings = {}
+    token = _run_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        with log_pipeline.context(task=inputs.get("task", "")), telemetry.span("open", task=inputs.get("task", "")):
+            states = await get_async_graph().ainvoke(inputs)
+    finally:
+        _run_timings.reset(token)
+    total = time.perf_counter() - start
+    node_timings = timings
+
+    overlapped = node_timings.get("init", 0.) + node_timings.get("voice_to_text", 0.)
+    concurrent = max(node_timings.get("init", 0.), node_timings.get("voice_to_text", 0.))
+    logger.info("Nodes: %s", ", ".join(f"{name} {elapsed:.3f}s" for name, elapsed in node_timings.items()))
+    logger.info("Finished in %.3fs, overlapping init with voice capture saved %.3fs", total, overlapped - concurrent)
+    return states
+
+@functools.cache
+def get_async_graph():
+    async_graph = StateGraph(OverallState, input=InputState, output=OuputState)
+
+    async_graph.add_node("init", telemetry.traced("init", ainit))
+    async_graph.add_node("judge", telemetry.traced("judge", ajudge))
+    async_graph.add_node("perform_task", telemetry.traced("perform_task", aperform_task))
+    async_graph.add_node("voice_to_text", telemetry.traced("voice_to_text", avoice_to_text))
+    async_graph.add_node("text_improvement", telemetry.traced("text_improvement", atext_improvement))
+
+    async_graph.add_edge(START, "init")
+    async_graph.add_edge(START, "voice_to_text")
+    async_graph.add_edge(["init", "voice_to_text"], "text_improvement")
+    async_graph.add_edge("text_improvement", "judge")
+    async_graph.add_conditional_edges("judge", if_satisfied)
+
+    return async_graph.compile()
+
+@functools.cache
+def get_graph():
+    graph = StateGraph(OverallState, input=InputState, output=OuputState)
+
+    graph.add_node("init", telemetry.traced("init", init))
+    graph.add_node("judge", telemetry.traced("judge", judge))
+    graph.add_node("perform_task", telemetry.traced("perform_task", perfomr_task))
+    graph.add_node("voice_to_text", telemetry.traced("voice_to_text", voice_to_text))
+    graph.add_node("text_improvement", telemetry.traced("text_improvement", text_improvement))
+
+    graph.add_edge(START, "init")
+    graph.add_edge("init", "voice_to_text")
+    graph.add_edge("voice_to_text", "text_improvement")
+    graph.add_edge("text_improvement", "judge")
+    graph.add_conditional_edges("judge", if_satisfied)
+
+    return graph.compile()
+
+def main():
+    import sys
+
+    log_pipeline.setup()
+    # Listen to the microphone unless the task is given on the command line
+    task = " ".join(sys.argv[1:])
+    return asyncio.run(ainvoke({"task": task} if task else {}))
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,35 @@
-import base64
-from typing import Literal
-from pydantic import BaseModel, Field, FilePath
-from pc_operator import Operation, simulate_operation
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+from pc_operator import Operation, execute_plan
+from screen_capture import EncodedFrame
 
 from langgraph.graph import START, StateGraph, END
 # from langgraph.prebuilt import ToolNode, tools_condition
 
-from langchain_core.messages import SystemMessage, HumanMessage
-
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+import candidate_ranker
+import capture_service
+import frame_change
+import log_pipeline
 import pc_operator as po
-import pyautogui as pg
-from model import llm
+import roi
+import screen_capture
+import model
+import plan_cache
+import prompt_builder
+import telemetry
+import tools
+
+logger = logging.getLogger(__name__)
 
 GRAPH_VERSION = "1.0.0"
-WINDOW_RESOLUTION = pg.size()
 
-analyze_instructions = """You are an AI tasked with analyzing a screenshot taken in Windows with the resolution of {resolution} to determine if a given task has been completed. Your responsibilities are:
+analyze_instructions = """You are an AI tasked with analyzing a screenshot taken in Windows, whose resolution is given with the request, to determine if a given task has been completed. Your responsibilities are:
 
 1. Analyze the screenshot to determine whether the task can be completed.
 2. Analyze the screenshot to determine whether the task has already been completed.
@@ -25,19 +39,23 @@ analyze_instructions = """You are an AI tasked with analyzing a screenshot taken
 Remeber, you should be very careful about the coordinates of the operations, as they are based on the resolution of the screenshot.
 """
 
-def encode_image(image_path: str) -> str:
-    with open(image_path, "rb") as image_file:
-        encoded_image = base64.b64encode(image_file.read()).decode("utf-8")
-    return encoded_image
-
-
 """Define the state classes"""
 class OverallState(BaseModel):
     operations: list[Operation] = Field([], description="The list of operations to be performed.")
-    screenshot: FilePath = Field("", description="The path to the screenshot.")
+    screenshot: Optional[EncodedFrame] = Field(None, description="The latest screenshot, encoded in memory.")
     task: str = Field("", description="The task to be performed.")
     completed: bool = Field(False, description="The status of the task.")
     completable: bool = Field(True, description="Whether the task can be completed.")
+    frame_hash: Optional[int] = Field(None, description="The perceptual hash of the latest screenshot.")
+    analyzed_hash: Optional[int] = Field(None, description="The perceptual hash of the last screenshot sent to the model.")
+    analyzed_operations: list[Operation] = Field([], description="The operations returned by the last analysis.")
+    reuses: int = Field(0, description="How many times in a row the last analysis has been reused.")
+    unchanged: bool = Field(False, description="Whether the latest screenshot shows no pixel change from the one analyzed last.")
+    last_coord: Optional[list[int]] = Field(None, description="The screen coordinate of the last pointer operation.")
+    plan: Optional[list[dict]] = Field(None, description="The plan recorded for the task, while it is being replayed.")
+    replaying: bool = Field(True, description="Whether the recorded plan still matches the screen.")
+    recorded_steps: list[dict] = Field([], description="The steps taken so far, recorded as a plan once the task completes.")
+    operated_at: float = Field(0., description="The `time.monotonic()` at which the last operations finished.")
 
 class AnalyzeState(BaseModel):
     operations: list[Operation] = Field([], description="The list of operations to be performed.")
@@ -51,25 +69,155 @@ class OutputState(BaseModel):
     completed: bool = Field(False, description="The status of the task.")
 
 
+region_tracker = roi.RegionTracker()
+# How long the desktop fast path waits before it checks the opened item changed the screen.
+VERIFY_DELAY = 2.
+
+
 """Define the relevant nodes"""
-def capture_screen(state: InputState) -> OverallState:
-    shotname = po.screenshot()
-    return {"screenshot": shotname, }
+def _desktop_match(task: str) -> dict | None:
+    """The desktop item a plain "open X" request names, with its `name`, `path` and `coordinate`."""
+    try:
+        items = tools.get_desktop_items("click")
+    except Exception as e:  # the desktop layout is only readable on Windows
+        logger.debug("Desktop layout unavailable: %s", e)
+        return None
+    desktop = os.path.join(os.path.expanduser("~"), "Desktop")
+    candidates = [{"name": item["entry_name"], "path": os.path.join(desktop, item["entry_name"]), "coordinate": item["coordinate"]}
+                  for item in items]
+    match, _ = candidate_ranker.shortlist(task, candidates)
+    if match is None or not candidate_ranker.is_open_request(task, match["name"]):
+        return None
+    return match
+
+def open_from_desktop(state: OverallState) -> OverallState:
+    """
+    Open a desktop item named by the task without the vision loop. Once the item was handed
+    to the shell, the task is done: a slow application may not show yet, and going on with
+    the vision loop could open it a second time. One delayed screenshot is taken in the
+    background to log whether the screen changed.
+    """
+    match = _desktop_match(state.task)
+    if match is None:
+        return {}
+
+    backend = screen_capture.get_backend()
+    before = backend.grab()
+    last_coord = state.last_coord
+    # Opening the file does not depend on the desktop being visible, the icon position does.
+    if os.path.exists(match["path"]):
+        try:
+            tools.open_object(match["path"])
+        except OSError as e:
+            logger.info("Opening %s from the desktop failed (%s), falling back to the vision loop", match["name"], e)
+            return {}
+    elif match["coordinate"] is not None:
+        last_coord = list(match["coordinate"])
+        try:
+            execute_plan([Operation(operation="double_click", coord=last_coord)])
+        except ValueError:
+            return {}
+    else:
+        return {}
+
+    telemetry.record(desktop_fast_path=1)
+    # The check runs in the context of the task, so its records carry the task's id.
+    verification = threading.Timer(VERIFY_DELAY, contextvars.copy_context().run, (_verify_opened, match["name"], backend, before))
+    verification.daemon = True
+    verification.start()
+    return {"completed": True, "last_coord": last_coord}
+
+def _verify_opened(name: str, backend: screen_capture.CaptureBackend, before) -> None:
+    if frame_change.changed_tiles(before, backend.grab()):
+        logger.info("Opened %s from the desktop", name)
+    else:
+        telemetry.record(desktop_unverified=1)
+        logger.warning("Opened %s from the desktop, but the screen has not changed after %.1fs", name, VERIFY_DELAY)
+
+def after_desktop(state: OverallState) -> Literal["capture_screen", END]: # type: ignore
+    return END if state.completed else "capture_screen"
+
+def capture_screen(state: OverallState) -> OverallState:
+    backend = screen_capture.get_backend()
+    first = state.frame_hash is None
+    if first:
+        region_tracker.reset()
+    # Every capture but the first follows an operation, let the screen settle first.
+    service = capture_service.get_service()
+    frame = service.wait_for(state.operated_at, settled=not first) if service.running else None
+    # Nothing to grab until the next operation, while the model looks at this frame.
+    service.pause()
+    if frame is not None:
+        image, frame_hash = frame.image, frame.hash
+    else:
+        image = backend.grab() if first else frame_change.wait_until_stable(backend.grab)
+        frame_hash = frame_change.dhash(image)
+    # The hash misses small changes such as typed text, confirm a match pixel by pixel.
+    previous = region_tracker.previous
+    unchanged = (previous is not None and frame_change.is_same(frame_hash, state.analyzed_hash)
+                 and not frame_change.changed_tiles(previous, image))
+    region = region_tracker.region(image, tuple(backend.size()), state.last_coord)
+    frame = screen_capture.capture(image=image, region=region)
+    return {"screenshot": frame, "frame_hash": frame_hash, "unchanged": unchanged}
+
+def _step(state: OverallState, operations: list[Operation], completed: bool = False) -> list[dict]:
+    """The steps taken so far, followed by the one decided on the current frame."""
+    step = {"hash": state.frame_hash, "operations": [operation.model_dump() for operation in operations], "completed": completed}
+    return state.recorded_steps + [step]
 
 def analyze_screenshot(state: OverallState) -> OverallState:
+    resolution = tuple(screen_capture.get_backend().size())
+    update = {}
+    # Replay the plan recorded for this task while every frame matches the recorded one.
+    if state.replaying:
+        cache = plan_cache.get_cache()
+        plan = state.plan if state.plan is not None else cache.get(state.task, resolution)
+        step = plan_cache.replay_step(plan, len(state.recorded_steps), state.frame_hash)
+        if step is not None:
+            cache.stats["replayed_steps"] += 1
+            telemetry.record(plan_replays=1)
+            return {"operations": [Operation.model_validate(operation) for operation in step["operations"]],
+                    "completed": step["completed"], "plan": plan, "recorded_steps": state.recorded_steps + [step]}
+        if plan:
+            cache.stats["mismatches"] += 1
+            logger.info("The screen left the recorded plan at step %d", len(state.recorded_steps))
+        update = {"replaying": False, "plan": None}
+
+    # The model has already answered for this frame, reuse its answer. Operations such as
+    # clicks or typing may have worked without a visible change, so only harmless ones are
+    # repeated; otherwise the model looks at the frame again.
+    reusable = all(operation.operation in po.IDEMPOTENT_OPERATIONS for operation in state.analyzed_operations)
+    if state.unchanged and reusable and state.reuses < frame_change.settings.max_reuses:
+        frame_change.stats["llm_calls_avoided"] += 1
+        telemetry.record(vision_reuses=1)
+        return {**update, "operations": state.analyzed_operations, "reuses": state.reuses + 1,
+                "recorded_steps": _step(state, state.analyzed_operations)}
+
+    frame_change.stats["analyses"] += 1
     prompt = f"Please analyze this screenshot to determine if the task '{state.task}' has been completed."
-    img = encode_image(state.screenshot)
-    human_message = HumanMessage(content=[
-        {"type": "text", "text": prompt},
-        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img}"}},
-    ])
+    frame = state.screenshot
+    if frame.box[:2] != (0, 0) or (frame.box[2], frame.box[3]) != resolution:
+        prompt += " The screenshot only shows part of the screen, give coordinates relative to the screenshot itself."
+    # The model answers in the coordinates of the (possibly downscaled) image it is shown.
+    prompt += f" The resolution of the screenshot is {frame.width}x{frame.height}."
+    messages = prompt_builder.analyze_messages(analyze_instructions, prompt, frame.data_url)
+    structured_llm = model.llm.with_structured_output(AnalyzeState)
 
-    system_messages = analyze_instructions.format(resolution=WINDOW_RESOLUTION)
-    structured_llm = llm.with_structured_output(AnalyzeState)
+    telemetry.record(image_bytes=frame.size_bytes)
+    with telemetry.llm_call({}) as kwargs:
+        analysis = structured_llm.invoke(messages, **kwargs)
 
-    analysis = structured_llm.invoke([SystemMessage(system_messages)] + [human_message])
+    # Map the coordinates back to the screen resolution before they are executed.
+    for operation in analysis.operations:
+        operation.coord = frame.to_screen(*operation.coord)
 
-    return {"operations": analysis.operations, "completed": analysis.completed, "completable": analysis.completable}
+    recorded_steps = _step(state, analysis.operations, analysis.completed)
+    if analysis.completed:
+        plan_cache.get_cache().put(state.task, resolution, recorded_steps)
+
+    return {**update, "operations": analysis.operations, "completed": analysis.completed, "completable": analysis.completable,
+            "analyzed_hash": state.frame_hash, "analyzed_operations": analysis.operations, "reuses": 0,
+            "recorded_steps": recorded_steps}
 
 def judge_if_completed(state: OverallState) -> Literal["operate", END]: # type: ignore
     if state.completed or not state.completable:
@@ -77,28 +225,63 @@ def judge_if_completed(state: OverallState) -> Literal["operate", END]: # type:
     return "operate"
 
 def operate(state: OverallState) -> OverallState:
+    last_coord = state.last_coord
+    operated_at = state.operated_at
     if state.operations:
-        for operation in state.operations:
-            simulate_operation(operation)
+        # Frames are grabbed again from now on, so the screen is seen settling after the operations.
+        capture_service.get_service().resume()
+        try:
+            execute_plan(state.operations)
+        except ValueError:
+            # Off-screen coordinates, nothing was executed; the next analysis starts over.
+            return {"operations": ()}
+        operated_at = time.monotonic()
+        pointer = [operation.coord for operation in state.operations if operation.operation in po.POINTER_OPERATIONS]
+        last_coord = pointer[-1] if pointer else last_coord
     
     # clear the operations after execution
-    return {"operations": ()}
+    return {"operations": (), "last_coord": last_coord, "operated_at": operated_at}
 
 
 """Build the graph"""
-workflow = StateGraph(OverallState, input=InputState, output=OutputState)
+@functools.cache
+def get_graph():
+    workflow = StateGraph(OverallState, input=InputState, output=OutputState)
+
+    workflow.add_node("open_from_desktop", telemetry.traced("open_from_desktop", open_from_desktop))
+    workflow.add_node("capture_screen", telemetry.traced("capture_screen", capture_screen))
+    workflow.add_node("analyze_screenshot", telemetry.traced("analyze_screenshot", analyze_screenshot))
+    workflow.add_node("operate", telemetry.traced("operate", operate))
+
+    workflow.add_edge(START, "open_from_desktop")
+    workflow.add_conditional_edges("open_from_desktop", after_desktop)
+    workflow.add_edge("capture_screen", "analyze_screenshot")
+    workflow.add_conditional_edges("analyze_screenshot", judge_if_completed)
+    workflow.add_edge("operate", "capture_screen")
+
+    return workflow.compile()
 
-workflow.add_node("capture_screen", capture_screen)
-workflow.add_node("analyze_screenshot", analyze_screenshot)
-workflow.add_node("operate", operate)
+def run(task: str) -> dict:
+    """Run the graph for `task`, traced as one span when telemetry is enabled, capturing frames in the background meanwhile."""
+    service = capture_service.get_service()
+    started = capture_service.settings.enabled and not service.running
+    if started:
+        service.start()
+    try:
+        with log_pipeline.context(task=task), telemetry.span("operate", task=task):
+            return get_graph().invoke({"task": task})
+    finally:
+        if started:
+            service.stop()
 
-workflow.add_edge(START, "capture_screen")
-workflow.add_edge("capture_screen", "analyze_screenshot")
-workflow.add_conditional_edges("analyze_screenshot", judge_if_completed)
-workflow.add_edge("operate", "capture_screen")
+def main():
+    import sys
 
-graph = workflow.compile()
+    log_pipeline.setup()
+    states = run(" ".join(sys.argv[1:]) or "打开微信")
+    print(f"Vision calls: {frame_change.stats['analyses']}, avoided: {frame_change.stats['llm_calls_avoided']}, "
+          f"replayed: {plan_cache.get_cache().stats['replayed_steps']}")
+    return states
 
-states = graph.invoke({
-    "task": "打开微信",
-})
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -10,28 +10,34 @@ Description:
     details and a simulate_operation function to execute the operations. The module includes 
     support for clicking, scrolling, writing input, pressing keys, and moving the cursor, 
     along with comprehensive logging and validation to ensure reliable and controlled 
-    automation tasks.
+    automation tasks. Whole lists of operations are run as one plan by execute_plan, which
+    coalesces and validates them up front and dispatches them to a pluggable input backend
+    (pyautogui, xdotool or a recording mock) with configurable pacing.
 """
+import functools
 import logging
-from typing import Literal
-import pyautogui as pg
+import shutil
+import subprocess
+import time
+from typing import Literal, Protocol
 from pydantic import BaseModel, Field, field_validator
 
 SUPPORTED_OPERATIONS = ("nop", "click", "double_click", "scroll", "write_input", "press_keys", "move")
+POINTER_OPERATIONS = ("click", "double_click", "move")
+# Operations that do no harm when repeated on a screen they have already acted on.
+IDEMPOTENT_OPERATIONS = ("nop", "move")
 
-# Create a logger for this module
+# Records are written off-thread by log_pipeline, set up by the entry point
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-file_handler = logging.FileHandler("pc_operator.log")
-file_handler.setFormatter(formatter)
-
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+@functools.lru_cache(maxsize=1)
+def _keyboard_keys() -> frozenset[str] | None:
+    """The keys pyautogui can press, or None when pyautogui cannot be loaded (e.g. without a display)."""
+    try:
+        import pyautogui as pg
+    except Exception:
+        return None
+    return frozenset(pg.KEYBOARD_KEYS)
 
 class Operation(BaseModel):
     """Simulate keyboard and mouse operations."""
@@ -42,68 +48,266 @@ class Operation(BaseModel):
     duration: float = Field(0., description="The duration of the operation in seconds.")
     operation: Literal[*SUPPORTED_OPERATIONS] = Field("nop", description="The operation to be performed.")
     content: str = Field("", description="The content to be written when the operation is 'write_input'.")
-    keys: list[str] = Field("", description="The keys to be pressed", examples=[["ctrl", "alt", "shift", "esc"], ["c",]])
+    keys: list[str] = Field(default_factory=list, description="The keys to be pressed", examples=[["ctrl", "alt", "shift", "esc"], ["c",]])
 
     @field_validator("operation")
     def check_operation(cls, value: str):
         if value not in SUPPORTED_OPERATIONS:
-            logger.error(f"Unsupported operation: {value}, program terminated.")
+            logger.error("Unsupported operation: %s, program terminated.", value)
             raise ValueError(f"Operation '{value}' not supported.")
         return value
 
     @field_validator("keys")
     def check_keys(cls, value: list[str]):
+        keyboard_keys = _keyboard_keys()
         for key in value:
-            if key not in pg.KEYBOARD_KEYS:
-                logger.error(f"Unsupported key: {key}, program terminated.")
+            if keyboard_keys is not None and key not in keyboard_keys:
+                logger.error("Unsupported key: %s, program terminated.", key)
                 raise ValueError(f"Key '{key}' not supported.")
         return value
 
 
-def simulate_operation(operation: Operation) -> None:
+class InputBackend(Protocol):
+    """The primitive input actions an executor dispatches operations to."""
+
+    def size(self) -> tuple[int, int]: ...
+
+    def move(self, x: int, y: int, duration: float) -> None: ...
+
+    def click(self, x: int, y: int, duration: float, clicks: int) -> None: ...
+
+    def scroll(self, clicks: int) -> None: ...
+
+    def write(self, content: str) -> None: ...
+
+    def press(self, keys: list[str]) -> None: ...
+
+
+class PyAutoGUIBackend:
+    """Drive the input with pyautogui, without its global per-call `PAUSE`; pacing is up to the executor."""
+
+    def __init__(self):
+        import pyautogui
+        self._pg = pyautogui
+
+    def size(self) -> tuple[int, int]:
+        return tuple(self._pg.size())
+
+    def move(self, x: int, y: int, duration: float) -> None:
+        self._pg.moveTo(x, y, duration=duration, _pause=False)
+
+    def click(self, x: int, y: int, duration: float, clicks: int) -> None:
+        self._pg.click(x, y, clicks=clicks, interval=0.05 if clicks > 1 else 0., duration=duration, _pause=False)
+
+    def scroll(self, clicks: int) -> None:
+        self._pg.scroll(clicks, _pause=False)
+
+    def write(self, content: str) -> None:
+        self._pg.write(content, _pause=False)
+
+    def press(self, keys: list[str]) -> None:
+        self._pg.press(keys, _pause=False)
+
+
+class XdotoolBackend:
+    """Drive the input of an X11 session through the `xdotool` command."""
+
+    BUTTON_SCROLL_UP, BUTTON_SCROLL_DOWN = "4", "5"
+    # pyautogui key names that differ in xdotool (X keysyms).
+    KEY_NAMES = {"enter": "Return", "return": "Return", "esc": "Escape", "escape": "Escape", "tab": "Tab",
+                 "backspace": "BackSpace", "delete": "Delete", "win": "super", "winleft": "super", "space": "space",
+                 "up": "Up", "down": "Down", "left": "Left", "right": "Right", "home": "Home", "end": "End"}
+
+    def __init__(self, executable: str = "xdotool"):
+        self._xdotool = shutil.which(executable)
+        if self._xdotool is None:
+            raise RuntimeError(f"{executable} not found.")
+
+    def _run(self, *arguments: str) -> str:
+        return subprocess.run([self._xdotool, *arguments], check=True, capture_output=True, text=True).stdout
+
+    def size(self) -> tuple[int, int]:
+        width, height = self._run("getdisplaygeometry").split()
+        return int(width), int(height)
+
+    def move(self, x: int, y: int, duration: float) -> None:
+        self._run("mousemove", str(x), str(y))
+
+    def click(self, x: int, y: int, duration: float, clicks: int) -> None:
+        self._run("mousemove", str(x), str(y), "click", "--repeat", str(clicks), "1")
+
+    def scroll(self, clicks: int) -> None:
+        button = self.BUTTON_SCROLL_UP if clicks > 0 else self.BUTTON_SCROLL_DOWN
+        self._run("click", "--repeat", str(abs(clicks)), button)
+
+    def write(self, content: str) -> None:
+        self._run("type", "--", content)
+
+    def press(self, keys: list[str]) -> None:
+        for key in keys:
+            self._run("key", self.KEY_NAMES.get(key, key))
+
+
+class RecordingBackend:
+    """Record the actions instead of performing them, for tests and dry runs."""
+
+    def __init__(self, resolution: tuple[int, int] = (1920, 1080)):
+        self.resolution = resolution
+        self.actions: list[tuple] = []
+
+    def size(self) -> tuple[int, int]:
+        return self.resolution
+
+    def move(self, x: int, y: int, duration: float) -> None:
+        self.actions.append(("move", x, y))
+
+    def click(self, x: int, y: int, duration: float, clicks: int) -> None:
+        self.actions.append(("click", x, y, clicks))
+
+    def scroll(self, clicks: int) -> None:
+        self.actions.append(("scroll", clicks))
+
+    def write(self, content: str) -> None:
+        self.actions.append(("write", content))
+
+    def press(self, keys: list[str]) -> None:
+        self.actions.append(("press", tuple(keys)))
+
+
+class ExecutorSettings(BaseModel):
+    """Pacing of an executed plan."""
+
+    pause: float = Field(0.05, description="The pause in seconds after every action.")
+    max_duration: float = Field(0.25, description="The upper bound in seconds of any pointer movement duration.")
+    coalesce: bool = Field(True, description="Whether redundant operations are removed before execution.")
+
+
+class OperationTiming(BaseModel):
+    """How long one executed operation took."""
+
+    operation: str
+    coord: list[int]
+    elapsed: float = Field(..., description="The execution time in seconds, pacing excluded.")
+
+
+settings = ExecutorSettings()
+_backend: InputBackend | None = None
+
+
+def get_backend() -> InputBackend:
+    global _backend
+    if _backend is None:
+        _backend = PyAutoGUIBackend()
+    return _backend
+
+
+def set_backend(backend: InputBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def coalesce(operations: list[Operation]) -> list[Operation]:
     """
-    **Simulate the given operation.**  
-    This function takes an Operation object and simulates the specified operation by performing actions such as clicks,
-    scrolls, writing input, and key presses. It logs the execution details and returns True upon successful completion.
-    Parameters:
-        operation (Operation): The operation to simulate, containing details such as operation type, coordinates,
-                               duration, scroll clicks, content, keys, etc.
+    **Remove operations without an effect of their own.**
+    No-ops are dropped, and so is a move directly followed by another pointer
+    operation at the same coordinate, which moves the pointer there itself. A move
+    elsewhere is kept, since the path of the pointer may matter, e.g. to open a menu
+    on hover before clicking one of its items.
+    """
+    operations = [operation for operation in operations if operation.operation != "nop"]
+    return [
+        operation for operation, following in zip(operations, operations[1:] + [None])
+        if not (operation.operation == "move" and following is not None
+                and following.operation in POINTER_OPERATIONS and following.coord == operation.coord)
+    ]
+
+
+def validate(operations: list[Operation], size: tuple[int, int]) -> None:
+    """
+    **Check every pointer operation lies on the screen.**
     Raises:
-        ValueError: If an unexpected operation type is encountered.
+        ValueError: Listing every operation whose coordinate is off the screen.
     """
-    oper_type = operation.operation
-    logger.info(f"Simulating operation: {oper_type}")
+    width, height = size
+    invalid = [
+        f"{operation.operation} at {operation.coord}" for operation in operations
+        if operation.operation in POINTER_OPERATIONS
+        and not (0 <= operation.coord[0] < width and 0 <= operation.coord[1] < height)
+    ]
+    if invalid:
+        logger.error("Operations outside the %sx%s screen: %s", width, height, invalid)
+        raise ValueError(f"Operations outside the {width}x{height} screen: {', '.join(invalid)}.")
 
-    #TODO Validate if the relevant fields are filled and legal.
-    # Assign the operation to the corresponding function.
-    match oper_type:
+
+def _dispatch(backend: InputBackend, operation: Operation, max_duration: float | None = None) -> None:
+    duration = operation.duration if max_duration is None else min(operation.duration, max_duration)
+    match operation.operation:
         case "nop":
-            logger.debug("No operation performed.")
             pass
         case "click":
-            logger.debug(f"Performing click at {operation.coord} with duration {operation.duration}.")
-            pg.click(*operation.coord, duration=operation.duration)
+            backend.click(*operation.coord, duration=duration, clicks=1)
         case "double_click":
-            logger.debug(f"Performing double click at {operation.coord} with duration {operation.duration}.")
-            pg.doubleClick(*operation.coord, duration=operation.duration)
+            backend.click(*operation.coord, duration=duration, clicks=2)
         case "scroll":
-            logger.debug(f"Scrolling {'up' if operation.scroll_clicks > 0 else 'down'} by {abs(operation.scroll_clicks)} clicks.")
-            pg.scroll(operation.scroll_clicks)
+            backend.scroll(operation.scroll_clicks)
         case "write_input":
-            logger.debug(f"Writing input: {operation.content}.")
-            pg.write(operation.content)
+            backend.write(operation.content)
         case "press_keys":
-            logger.debug(f"Pressing keys: {operation.keys}.")
-            pg.press(operation.keys)
+            backend.press(operation.keys)
         case "move":
-            logger.debug(f"Moving to {operation.coord} with duration {operation.duration}.")
-            pg.moveTo(*operation.coord, duration=operation.duration)
+            backend.move(*operation.coord, duration=duration)
         case _:
             #! This should not happen.
             logger.error("Unexpected execution, program terminated.")
             raise ValueError("Unexpected execution.")
-        
-    logger.info(f"Operation {oper_type} completed.")
+
+
+def execute_plan(operations: list[Operation], backend: InputBackend | None = None,
+                 options: ExecutorSettings | None = None) -> list[OperationTiming]:
+    """
+    **Execute a whole list of operations as one plan.**
+    The plan is coalesced and validated against the screen bounds before anything runs,
+    then dispatched to the backend with `options.pause` seconds between actions.
+    Parameters:
+        operations (list[Operation]): The operations to execute, in order.
+        backend (InputBackend | None): The input backend, the module default if None.
+        options (ExecutorSettings | None): The pacing options, the module `settings` if None.
+    Returns:
+        list[OperationTiming]: The timing of every executed operation.
+    Raises:
+        ValueError: If an operation lies outside the screen.
+    """
+    backend = backend or get_backend()
+    options = options or settings
+    plan = coalesce(list(operations)) if options.coalesce else list(operations)
+    validate(plan, backend.size())
+
+    timings = []
+    for position, operation in enumerate(plan):
+        if position and options.pause:
+            time.sleep(options.pause)
+        start = time.perf_counter()
+        _dispatch(backend, operation, options.max_duration)
+        timings.append(OperationTiming(operation=operation.operation, coord=list(operation.coord), elapsed=time.perf_counter() - start))
+
+    logger.info("Executed %d of %d operations in %.3fs", len(plan), len(operations), sum(timing.elapsed for timing in timings))
+    return timings
+
+
+def simulate_operation(operation: Operation) -> None:
+    """
+    **Simulate the given operation.**  
+    This function takes an Operation object and simulates the specified operation by performing actions such as clicks,
+    scrolls, writing input, and key presses on the default input backend.
+    Parameters:
+        operation (Operation): The operation to simulate, containing details such as operation type, coordinates,
+                               duration, scroll clicks, content, keys, etc.
+    Raises:
+        ValueError: If an unexpected operation type is encountered.
+    """
+    logger.info("Simulating operation: %s", operation.operation)
+    _dispatch(get_backend(), operation)
+    logger.info("Operation %s completed.", operation.operation)
 
 def screenshot(filename: str = "screenshot.png") -> str:
     """
@@ -112,12 +316,16 @@ def screenshot(filename: str = "screenshot.png") -> str:
     Returns:
         str: The filename of the saved screenshot.
     """
+    import pyautogui as pg
+
     logger.info("Taking screenshot.")
     pg.screenshot(filename)
-    logger.info(f"Screenshot saved as {filename}.")
+    logger.info("Screenshot saved as %s.", filename)
 
     return filename
 
 if __name__ == "__main__":
+    import log_pipeline
+    log_pipeline.setup()
     simulate_operation(Operation(coord=[120, 340], operation="double_click", duration=0.5))
     # print("This module is not meant to be executed.")
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: plan_cache.py
+Description:
+    This module records the operations that completed a task in the vision loop, so a
+    repeated task starting from the same screen replays them without asking the model.
+    A plan is a list of steps, each the dHash of the frame the step was decided on and
+    the operations executed from it; the last step marks the frame on which the task was
+    seen completed. Replay checks every new frame against the recorded one and hands back
+    to the model on the first mismatch. Plans are keyed by the normalized task, stored in
+    SQLite with least-recently-used eviction, and dropped when the screen resolution
+    differs from the one they were recorded at, since their coordinates no longer apply.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import candidate_ranker
+import frame_change
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".her", "plan_cache.sqlite3")
+MAX_PLANS = 256
+
+
+class PlanCache:
+    """A bounded SQLite store of recorded plans, one per normalized task."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_plans: int = MAX_PLANS):
+        self.max_plans = max_plans
+        self.enabled = os.environ.get("HER_PLAN_CACHE", "1") != "0"
+        self.stats = {"replayed_steps": 0, "mismatches": 0, "stored": 0, "invalidated": 0}
+
+        self._lock = threading.Lock()
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS plans (
+            task TEXT PRIMARY KEY, resolution TEXT NOT NULL, steps TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)""")
+        self._db.commit()
+
+    @staticmethod
+    def _resolution(resolution: tuple[int, int]) -> str:
+        return f"{resolution[0]}x{resolution[1]}"
+
+    def get(self, task: str, resolution: tuple[int, int]) -> list[dict] | None:
+        """
+        **Look up the plan recorded for a task.**
+        Parameters:
+            task (str): The task, normalized before the lookup.
+            resolution (tuple[int, int]): The current screen resolution.
+        Returns:
+            list[dict] | None: The steps, each with `hash`, `operations` (dumped `Operation`s)
+                               and `completed`; None when there is no usable plan.
+        """
+        if not self.enabled:
+            return None
+        key = candidate_ranker.normalize(task)
+        with self._lock:
+            row = self._db.execute("SELECT resolution, steps FROM plans WHERE task = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] != self._resolution(resolution):
+                self._db.execute("DELETE FROM plans WHERE task = ?", (key,))
+                self._db.commit()
+                self.stats["invalidated"] += 1
+                logger.info("Dropped the plan for %r recorded at %s", task, row[0])
+                return None
+            self._db.execute("UPDATE plans SET accessed = ? WHERE task = ?", (time.time(), key))
+            self._db.commit()
+        return json.loads(row[1])
+
+    def put(self, task: str, resolution: tuple[int, int], steps: list[dict]) -> None:
+        """Record the steps that completed `task`, evicting the least recently used plans past `max_plans`."""
+        if not self.enabled or not steps:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO plans VALUES (?, ?, ?, ?, ?)",
+                             (candidate_ranker.normalize(task), self._resolution(resolution), json.dumps(steps, ensure_ascii=False), now, now))
+            self._db.execute("DELETE FROM plans WHERE task NOT IN (SELECT task FROM plans ORDER BY accessed DESC LIMIT ?)", (self.max_plans,))
+            self._db.commit()
+            self.stats["stored"] += 1
+
+    def invalidate(self, resolution: tuple[int, int] | None = None) -> int:
+        """Drop every plan, or only those recorded at another resolution than `resolution`."""
+        with self._lock:
+            if resolution is None:
+                removed = self._db.execute("DELETE FROM plans").rowcount
+            else:
+                removed = self._db.execute("DELETE FROM plans WHERE resolution != ?", (self._resolution(resolution),)).rowcount
+            self._db.commit()
+            self.stats["invalidated"] += removed
+        return removed
+
+
+def replay_step(plan: list[dict] | None, position: int, frame_hash: int | None) -> dict | None:
+    """
+    **The recorded step to replay at `position`, if the frame matches the recorded one.**
+    Returns None when there is no such step or the screen differs.
+    """
+    if plan is None or position >= len(plan):
+        return None
+    step = plan[position]
+    if not frame_change.is_same(step["hash"], frame_hash):
+        return None
+    return step
+
+
+_cache: PlanCache | None = None
+
+
+def get_cache() -> PlanCache:
+    global _cache
+    if _cache is None:
+        _cache = PlanCache()
+    return _cache
+
+
+def set_cache(cache: PlanCache | None) -> None:
+    global _cache
+    _cache = cache
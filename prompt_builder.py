@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: prompt_builder.py
+Description:
+    This module builds the judge and screenshot analysis prompts so they cost fewer
+    tokens and keep a byte-identical prefix across calls, which the provider can cache.
+    The instructions always come first and never contain request data; the task, the
+    candidates and the screen size follow in the last message. Candidates are listed
+    compactly: every directory is written once under a short alias and every file is a
+    numbered line, so the model answers with a number that `resolve` maps back to the
+    path. Candidates that do not fit the token budget are dropped from the end, and the
+    size of every prompt is logged and recorded with `telemetry`.
+"""
+import functools
+import logging
+import ntpath
+import string
+import threading
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel, Field
+
+import telemetry
+
+try:
+    import tiktoken
+except ImportError:  # token counts are estimated without it
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+
+class PromptSettings(BaseModel):
+    """Budgets of the variable part of the prompts."""
+
+    candidate_tokens: int = Field(1200, description="The token budget of the candidate list.")
+    max_candidates: int = Field(50, description="The number of candidates listed at most.")
+    encoding: str = Field("o200k_base", description="The tiktoken encoding used to count tokens, when tiktoken is installed.")
+
+
+settings = PromptSettings()
+_encoder = None
+_loader: threading.Thread | None = None
+_loader_lock = threading.Lock()
+
+
+def _load_encoder() -> None:
+    global _encoder
+    try:
+        _encoder = tiktoken.get_encoding(settings.encoding)
+    except Exception as e:  # the encoding is downloaded on first use, which fails offline
+        logger.warning("Estimating token counts, the %s encoding is unavailable: %s", settings.encoding, e)
+
+
+def count_tokens(text: str) -> int:
+    """
+    **Count the tokens of a text.**
+    Exact with tiktoken; otherwise one token per CJK character and per four other characters.
+    The tiktoken encoding may have to be downloaded, so it is loaded once in the background
+    and counts are estimated until it is ready, or for good if it cannot be loaded.
+    """
+    global _loader
+    if tiktoken is not None and _encoder is None:
+        with _loader_lock:
+            if _loader is None:
+                _loader = threading.Thread(target=_load_encoder, name="tiktoken-load", daemon=True)
+                _loader.start()
+    if _encoder is not None:
+        return len(_encoder.encode(text))
+    wide = sum(1 for character in text if ord(character) > 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _alias(number: int) -> str:
+    letters = string.ascii_uppercase
+    alias = ""
+    number += 1
+    while number:
+        number, remainder = divmod(number - 1, len(letters))
+        alias = letters[remainder] + alias
+    return alias
+
+
+def encode_candidates(candidates: list[dict], budget: int | None = None) -> tuple[str, int]:
+    """
+    **List candidates compactly within a token budget.**
+    Parameters:
+        candidates (list[dict]): Items with `name` and `path` keys, best first.
+        budget (int | None): The token budget, `settings.candidate_tokens` if None.
+    Returns:
+        tuple[str, int]: The listing and the number of candidates it holds; candidate `i`
+                         (from 1) of the listing is `candidates[i - 1]`.
+    """
+    budget = settings.candidate_tokens if budget is None else budget
+    directories: dict[str, str] = {}
+    directory_lines, candidate_lines = [], []
+    used = 0
+    for number, candidate in enumerate(candidates[:settings.max_candidates], start=1):
+        # Windows paths use either separator, ntpath understands both.
+        directory, name = ntpath.split(candidate["path"])
+        new_directory = directory not in directories
+        alias = directories.get(directory) or _alias(len(directories))
+        lines = [f"{alias}={directory}"] if new_directory else []
+        lines.append(f"{number} {alias} {name}")
+        cost = sum(count_tokens(line) + 1 for line in lines)
+        if used + cost > budget:
+            logger.debug("Listed %d of %d candidates within %d tokens", number - 1, len(candidates), budget)
+            break
+        used += cost
+        if new_directory:
+            directories[directory] = alias
+            directory_lines.append(lines[0])
+        candidate_lines.append(lines[-1])
+
+    if not candidate_lines:
+        return "(none)", 0
+    listing = "Directories:\n" + "\n".join(directory_lines) + "\nCandidates (number directory name):\n" + "\n".join(candidate_lines)
+    return listing, len(candidate_lines)
+
+
+def resolve(target: str, candidates: list[dict]) -> str:
+    """Map the candidate number the model answered back to its path; anything else is returned unchanged."""
+    target = (target or "").strip()
+    if target.isdigit() and 1 <= int(target) <= len(candidates):
+        return candidates[int(target) - 1]["path"]
+    return target
+
+
+@functools.lru_cache(maxsize=16)
+def _static_tokens(instructions: str) -> int:
+    return count_tokens(instructions)
+
+
+def _report(kind: str, instructions: str, variable: str) -> None:
+    prefix, suffix = _static_tokens(instructions), count_tokens(variable)
+    logger.debug("%s prompt: %d static + %d variable tokens", kind, prefix, suffix)
+    telemetry.record(prompt_static_tokens=prefix, prompt_variable_tokens=suffix)
+
+
+def judge_messages(instructions: str, task: str, candidates: list[dict]) -> list:
+    """
+    **The judge prompt: the static instructions, then the task and the candidate listing.**
+    Answers naming a candidate by number are mapped back with `resolve`.
+    """
+    listing, _ = encode_candidates(candidates)
+    variable = f"Task: {task}\n{listing}"
+    _report("Judge", instructions, variable)
+    return [SystemMessage(instructions), HumanMessage(variable)]
+
+
+def analyze_messages(instructions: str, text: str, image_url: str) -> list:
+    """The screenshot analysis prompt: the static instructions, then the request text and the image."""
+    _report("Analyze", instructions, text)
+    return [SystemMessage(instructions), HumanMessage(content=[
+        {"type": "text", "text": text},
+        {"type": "image_url", "image_url": {"url": image_url}},
+    ])]
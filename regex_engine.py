@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: regex_engine.py
+Description:
+    This module evaluates the regular expressions the judge model writes safely and
+    within a time bound. Patterns are first simplified (redundant `.*` at either end do
+    nothing in a search) and then validated: overly long patterns, backreferences and
+    constructs prone to catastrophic backtracking, such as a repeat inside a repeat,
+    overlapping alternatives inside a repeat or repeats in a row that consume the same
+    characters, are rejected with `UnsafePattern` so the caller can fall back to a
+    keyword search. `RegexEngine` matches a pattern against a list of names or paths:
+    small queries in the calling process, large ones split into shards across a shared
+    pool of worker processes that read the list from shared memory. It yields the
+    matching positions as they are found, stops at `max_results` and gives up at a hard
+    deadline, terminating workers that are still busy.
+"""
+import array
+import atexit
+import functools
+import itertools
+import logging
+import multiprocessing
+import os
+import re
+import struct
+import threading
+import time
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterator, Sequence
+
+from pydantic import BaseModel, Field
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+
+class EngineSettings(BaseModel):
+    """Limits of pattern evaluation."""
+
+    max_length: int = Field(256, description="The longest pattern accepted, in characters.")
+    deadline: float = Field(2., description="The longest a query may run in seconds.")
+    processes: int = Field(min(4, os.cpu_count() or 1), ge=1, description="The number of worker processes.")
+    shard_size: int = Field(50_000, description="The number of strings matched per task.")
+    inline_limit: int = Field(50_000, description="Queries over at most this many strings are matched in the calling process.")
+    inline_length: int = Field(260, description="Longer strings are always matched in a worker, since one match cannot be interrupted.")
+
+
+settings = EngineSettings()
+stats = {"rejected": 0, "rewritten": 0, "deadline_hits": 0}
+
+
+class UnsafePattern(ValueError):
+    """Raised for a pattern that is invalid or may backtrack catastrophically."""
+
+
+"""Validation"""
+# Only bare `.*`: a lazy `.*?` or possessive `.*+` keeps its modifier, which cannot stand alone.
+_LEADING = re.compile(r"^\^?(?:\.\*(?![?+]))+")
+_TRAILING = re.compile(r"(?<!\\)(?:\.\*)+\$?$")
+_REPEATED = re.compile(r"(?<!\\)(?:\.\*(?![?+])){2,}")
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+# Constructs that cannot backtrack into themselves, from Python 3.11.
+_POSSESSIVE_REPEAT = getattr(sre_constants, "POSSESSIVE_REPEAT", None)
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+
+
+def sanitize(pattern: str) -> str:
+    """Drop the `.*` a search does not need, e.g. "^.*微信.*$" -> "微信"."""
+    simplified = _REPEATED.sub(".*", _TRAILING.sub("", _LEADING.sub("", pattern)))
+    if simplified != pattern:
+        stats["rewritten"] += 1
+        logger.debug("Rewrote regex %r as %r", pattern, simplified)
+    return simplified
+
+
+# Characters every class is tried against when comparing what two items can consume,
+# besides the literals of the pattern itself.
+_PROBES = "aZ09_ \t\n-.,/\\:@中é"
+# Unbounded repeats in a row that can consume the same characters make matching
+# polynomial in the name length, with this degree at most.
+MAX_RUN = 2
+
+
+def _first_literal(alternative) -> int | None:
+    if len(alternative) and alternative[0][0] is sre_constants.LITERAL:
+        return alternative[0][1]
+    return None
+
+
+def _unbounded(high: int) -> bool:
+    return high == sre_constants.MAXREPEAT or high > 64
+
+
+def _in_category(category, character: str) -> bool:
+    constants = sre_constants
+    if category is constants.CATEGORY_DIGIT:
+        return character.isdecimal()
+    if category is constants.CATEGORY_NOT_DIGIT:
+        return not character.isdecimal()
+    if category is constants.CATEGORY_SPACE:
+        return character.isspace()
+    if category is constants.CATEGORY_NOT_SPACE:
+        return not character.isspace()
+    if category is constants.CATEGORY_WORD:
+        return character.isalnum() or character == "_"
+    if category is constants.CATEGORY_NOT_WORD:
+        return not (character.isalnum() or character == "_")
+    return True  # unknown categories are assumed to overlap everything
+
+
+def _matches(opcode, argument, character: str) -> bool:
+    """Whether a single-character item matches `character`, case-insensitively."""
+    variants = {character, character.lower(), character.upper()}
+    if opcode is sre_constants.LITERAL:
+        return chr(argument) in variants
+    if opcode is sre_constants.NOT_LITERAL:
+        return chr(argument) not in variants
+    if opcode is sre_constants.ANY:
+        return character != "\n"
+    if opcode is sre_constants.IN:
+        negate = bool(argument) and argument[0][0] is sre_constants.NEGATE
+        hit = False
+        for item, value in argument:
+            if item is sre_constants.RANGE:
+                hit = any(value[0] <= ord(variant) <= value[1] for variant in variants)
+            elif item is sre_constants.CATEGORY:
+                hit = _in_category(value, character)
+            elif item is not sre_constants.NEGATE:
+                hit = _matches(item, value, character)
+            if hit:
+                break
+        return hit != negate
+    return False
+
+
+def _probes(parsed) -> set[str]:
+    """The literals of a parsed pattern, range bounds included."""
+    found = set()
+    for opcode, argument in parsed:
+        if opcode in (sre_constants.LITERAL, sre_constants.NOT_LITERAL):
+            found.add(chr(argument))
+        elif opcode is sre_constants.IN:
+            for item, value in argument:
+                if item is sre_constants.RANGE:
+                    found.update((chr(value[0]), chr(value[1])))
+                elif item is sre_constants.LITERAL:
+                    found.add(chr(value))
+        elif opcode in _REPEATS or opcode is _POSSESSIVE_REPEAT:
+            found |= _probes(argument[2])
+        elif opcode is sre_constants.SUBPATTERN:
+            found |= _probes(argument[-1])
+        elif opcode is _ATOMIC_GROUP:
+            found |= _probes(argument)
+        elif opcode is sre_constants.BRANCH:
+            for alternative in argument[1]:
+                found |= _probes(alternative)
+    return found
+
+
+def _consumed(parsed, probes: str) -> frozenset[str]:
+    """The probe characters `parsed` may consume."""
+    found = set()
+    for opcode, argument in parsed:
+        if opcode in (sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.ANY, sre_constants.IN):
+            found.update(character for character in probes if _matches(opcode, argument, character))
+        elif opcode in _REPEATS or opcode is _POSSESSIVE_REPEAT:
+            found |= _consumed(argument[2], probes)
+        elif opcode is sre_constants.SUBPATTERN:
+            found |= _consumed(argument[-1], probes)
+        elif opcode is _ATOMIC_GROUP:
+            found |= _consumed(argument, probes)
+        elif opcode is sre_constants.BRANCH:
+            for alternative in argument[1]:
+                found |= _consumed(alternative, probes)
+    return frozenset(found)
+
+
+def _flatten(parsed):
+    """The items of a sequence, with plain groups opened up."""
+    for opcode, argument in parsed:
+        if opcode is sre_constants.SUBPATTERN:
+            yield from _flatten(argument[-1])
+        else:
+            yield opcode, argument
+
+
+def _check_sequence(parsed, probes: str) -> None:
+    """
+    Reject more than `MAX_RUN` unbounded repeats in a row that can consume the same
+    characters, e.g. "\\w*\\w*\\w*z", which backtracks through every way to split a name.
+    """
+    run, length = None, 0
+    for opcode, argument in _flatten(parsed):
+        if opcode in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            continue  # zero width
+        if opcode in _REPEATS and _unbounded(argument[1]):
+            consumed = _consumed([(opcode, argument)], probes)
+            if run is not None and run & consumed:
+                run, length = run | consumed, length + 1
+                if length > MAX_RUN:
+                    raise UnsafePattern("Repeats in a row of the same characters can backtrack catastrophically.")
+            else:
+                run, length = consumed, 1
+        elif not (opcode in _REPEATS and argument[0] == 0):
+            # Optional items may match nothing, so only others end a run.
+            run, length = None, 0
+
+
+def _check(parsed, enclosing: str | None, probes: str) -> None:
+    """
+    Walk the parsed pattern; `enclosing` tells whether a repeat of more than one
+    iteration encloses it, "bounded" or "unbounded".
+    """
+    _check_sequence(parsed, probes)
+    for opcode, argument in parsed:
+        if opcode in _REPEATS:
+            low, high, body = argument
+            unbounded = _unbounded(high)
+            # A fixed count such as {3} matches one way only.
+            if enclosing == "unbounded" and high > 1 and low != high:
+                raise UnsafePattern("A repeat inside a repeat can backtrack catastrophically.")
+            if enclosing == "bounded" and unbounded:
+                raise UnsafePattern("An unbounded repeat inside a counted repeat can backtrack catastrophically.")
+            if unbounded or enclosing == "unbounded":
+                inner = "unbounded"
+            else:
+                inner = enclosing or ("bounded" if high > 1 else None)
+            _check(body, inner, probes)
+        elif opcode is _POSSESSIVE_REPEAT:
+            _check(argument[2], None, probes)
+        elif opcode is _ATOMIC_GROUP:
+            _check(argument, None, probes)
+        elif opcode is sre_constants.SUBPATTERN:
+            _check(argument[-1], enclosing, probes)
+        elif opcode is sre_constants.BRANCH:
+            alternatives = argument[1]
+            if enclosing == "unbounded":
+                firsts = [_first_literal(alternative) for alternative in alternatives]
+                if None in firsts or len(set(firsts)) < len(firsts):
+                    raise UnsafePattern("Overlapping alternatives inside a repeat can backtrack catastrophically.")
+            for alternative in alternatives:
+                _check(alternative, enclosing, probes)
+        elif opcode in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _check(argument[1], enclosing, probes)
+        elif opcode in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            raise UnsafePattern("Backreferences are not supported.")
+
+
+@functools.lru_cache(maxsize=128)
+def compile_pattern(pattern: str) -> re.Pattern:
+    """
+    **Simplify, validate and compile a generated pattern, case-insensitively.**
+    Raises:
+        UnsafePattern: If the pattern is too long, invalid or prone to catastrophic backtracking.
+    """
+    pattern = sanitize(pattern)
+    try:
+        if len(pattern) > settings.max_length:
+            raise UnsafePattern(f"The pattern is longer than {settings.max_length} characters.")
+        try:
+            parsed = sre_parse.parse(pattern, re.IGNORECASE)
+        except (re.error, RecursionError) as e:
+            raise UnsafePattern(f"Invalid pattern: {e}") from None
+        _check(parsed, None, "".join(_probes(parsed) | set(_PROBES)))
+    except UnsafePattern:
+        stats["rejected"] += 1
+        raise
+    return re.compile(pattern, re.IGNORECASE)
+
+
+"""Sharded matching"""
+class _SharedCorpus:
+    """
+    A list of strings in one shared memory block: the number of strings, their offsets
+    and their UTF-8 bytes. Workers map it by name instead of receiving the list.
+    """
+
+    def __init__(self, corpus: list[str]):
+        data = [text.encode("utf-8", "surrogatepass") for text in corpus]
+        offsets = array.array("Q", itertools.accumulate(map(len, data), initial=0))
+        header = struct.pack("<Q", len(corpus))
+        start = len(header) + offsets.itemsize * len(offsets)
+        self.memory = shared_memory.SharedMemory(create=True, size=start + offsets[-1] or 1)
+        self.memory.buf[:start] = header + offsets.tobytes()
+        self.memory.buf[start:start + offsets[-1]] = b"".join(data)
+        self.name = self.memory.name
+
+    @staticmethod
+    def release(memory: shared_memory.SharedMemory) -> None:
+        memory.close()
+        memory.unlink()
+
+
+# In workers: the blocks mapped so far, by name, as (memory, offsets, start of the strings).
+_attached: dict[str, tuple] = {}
+MAX_ATTACHED = 4
+
+
+def _attach(name: str) -> tuple:
+    corpus = _attached.get(name)
+    if corpus is None:
+        if len(_attached) >= MAX_ATTACHED:
+            memory, offsets, _ = _attached.pop(next(iter(_attached)))
+            offsets.release()
+            memory.close()
+        memory = shared_memory.SharedMemory(name=name)
+        count = struct.unpack_from("<Q", memory.buf)[0]
+        start = 8 + 8 * (count + 1)
+        corpus = _attached[name] = (memory, memory.buf[8:start].cast("Q"), start)
+    return corpus
+
+
+def _shared_strings(name: str, positions: Sequence[int]) -> Iterator[tuple[int, str]]:
+    memory, offsets, start = _attach(name)
+    for position in positions:
+        yield position, str(memory.buf[start + offsets[position]:start + offsets[position + 1]], "utf-8", "surrogatepass")
+
+
+def _match_shard(task: tuple[str | None, str, Sequence[int], list[tuple[int, str]], int]) -> list[int]:
+    name, pattern, positions, extra, limit = task
+    search = compile_pattern(pattern).search
+    strings = _shared_strings(name, positions) if positions else ()
+    found = []
+    for position, text in itertools.chain(strings, extra):
+        if search(text):
+            found.append(position)
+            if len(found) >= limit:
+                break
+    return found
+
+
+# One pool serves every engine; it is only replaced when busy workers are terminated.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if os.name == "posix":
+                # Workers must share the resource tracker of this process, or one of their
+                # own would unlink the blocks they mapped when they exit.
+                resource_tracker.ensure_running()
+            _pool = multiprocessing.get_context().Pool(settings.processes)
+        return _pool
+
+
+@atexit.register
+def _terminate_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool = None
+
+
+class RegexEngine:
+    """
+    **Match patterns against a fixed list of strings under a deadline.**
+    Up to `settings.inline_limit` strings are matched in the calling process, checking
+    the deadline between strings; strings longer than `settings.inline_length`, whose
+    match alone could outlast it, always go to a worker. Larger queries are split into
+    shards matched by a pool of worker processes shared by every engine. The list is
+    copied once into shared memory, when a query first needs the workers, so a query
+    only sends the pattern and the positions to match. A worker still busy at the
+    deadline is terminated along with the pool, which is started afresh on the next query.
+    """
+
+    def __init__(self, corpus: list[str]):
+        self.corpus = corpus
+        self._shared: _SharedCorpus | None = None
+        self._finalizer = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.corpus)
+
+    def _shared_name(self) -> str:
+        with self._lock:
+            if self._shared is None:
+                self._shared = _SharedCorpus(self.corpus)
+                self._finalizer = weakref.finalize(self, _SharedCorpus.release, self._shared.memory)
+            return self._shared.name
+
+    def close(self) -> None:
+        """Free the shared copy of the list; the next query that needs the workers copies it again."""
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+            self._shared, self._finalizer = None, None
+
+    def _search_inline(self, search, positions: Sequence[int], extra: list[tuple[int, str]], max_results: int,
+                       deadline: float, deferred: list[tuple[int, str]]) -> Iterator[int]:
+        strings = itertools.chain(((position, self.corpus[position]) for position in positions), extra)
+        found = 0
+        for count, (position, text) in enumerate(strings):
+            if not count % 256 and time.monotonic() > deadline:
+                raise TimeoutError
+            if len(text) > settings.inline_length:
+                deferred.append((position, text))
+            elif search(text):
+                yield position
+                found += 1
+                if found >= max_results:
+                    return
+
+    def _shards(self, pattern: str, positions: Sequence[int], extra: list[tuple[int, str]], max_results: int) -> list[tuple]:
+        size = settings.shard_size
+        name = self._shared_name() if len(positions) else None
+        shards = [(name, pattern, positions[start:start + size], [], max_results) for start in range(0, len(positions), size)]
+        shards += [(None, pattern, (), extra[start:start + size], max_results) for start in range(0, len(extra), size)]
+        return shards
+
+    def _search_sharded(self, shards: list[tuple], max_results: int, deadline: float) -> Iterator[int]:
+        results = _get_pool().imap_unordered(_match_shard, shards)
+        found = 0
+        for _ in shards:
+            try:
+                positions = results.next(timeout=max(0., deadline - time.monotonic()))
+            except multiprocessing.TimeoutError:
+                # Busy workers cannot be interrupted; start afresh on the next query.
+                _terminate_pool()
+                raise TimeoutError from None
+            for position in positions[:max_results - found]:
+                yield position
+            found += min(len(positions), max_results - found)
+            if found >= max_results:
+                return
+
+    def search(self, pattern: str, max_results: int = 50, timeout: float | None = None,
+               positions: Sequence[int] | None = None, extra: list[tuple[int, str]] = ()) -> Iterator[int]:
+        """
+        **Yield the positions of the strings matching `pattern`, as they are found.**
+        Parameters:
+            pattern (str): A pattern, validated with `compile_pattern`.
+            max_results (int): The search stops after this many matches.
+            timeout (float | None): The deadline in seconds, `settings.deadline` if None.
+            positions (Sequence[int] | None): The positions of the list to match, all if None.
+            extra (list[tuple[int, str]]): `(position, string)` pairs matched as well, e.g.
+                                           strings added after the engine was created.
+        Raises:
+            UnsafePattern: If the pattern is rejected; nothing is yielded then.
+        """
+        search = compile_pattern(pattern).search
+        positions = range(len(self.corpus)) if positions is None else positions
+        extra = list(extra)
+        deadline = time.monotonic() + (settings.deadline if timeout is None else timeout)
+        try:
+            if len(positions) + len(extra) <= settings.inline_limit:
+                deferred = []
+                found = 0
+                for position in self._search_inline(search, positions, extra, max_results, deadline, deferred):
+                    yield position
+                    found += 1
+                positions, extra, max_results = (), deferred, max_results - found
+                if max_results <= 0:
+                    return
+            shards = self._shards(pattern, positions, extra, max_results)
+            if shards:
+                yield from self._search_sharded(shards, max_results, deadline)
+        except TimeoutError:
+            stats["deadline_hits"] += 1
+            logger.warning("Regex %r hit the %.1fs deadline, the results are partial", pattern, settings.deadline if timeout is None else timeout)
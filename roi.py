@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: roi.py
+Description:
+    This module chooses the region of interest sent to the vision model on large
+    screens. The region comes from the tiles that changed since the previous frame, the
+    bounds of the focused window or the surroundings of the last operation, in that
+    order. It is padded, clamped to the screen and dropped in favour of the full frame
+    when it would cover most of the screen anyway. A cropped frame is encoded at native
+    detail, and `EncodedFrame.to_screen` maps the model's coordinates back.
+"""
+import logging
+
+from PIL import Image
+from pydantic import BaseModel, Field
+
+import frame_change
+
+logger = logging.getLogger(__name__)
+
+Box = tuple[int, int, int, int]
+
+
+class RoiSettings(BaseModel):
+    """When and how the region of interest is cropped."""
+
+    enabled: bool = Field(True, description="Whether ROI cropping is used at all.")
+    min_screen_width: int = Field(2560, description="Screens narrower than this are always sent in full.")
+    padding: float = Field(.08, description="The padding added around the region, as a share of the screen size.")
+    min_share: float = Field(.25, description="The smallest region, as a share of the screen width and height.")
+    max_area: float = Field(.6, description="Regions covering more than this share of the screen fall back to the full frame.")
+    operation_share: float = Field(.4, description="The size of the region around the last operation, as a share of the screen.")
+
+
+settings = RoiSettings()
+
+
+def _focused_window() -> Box | None:
+    try:
+        import pygetwindow
+        window = pygetwindow.getActiveWindow()
+    except Exception:  # unavailable off Windows or without a focused window
+        return None
+    if window is None or window.width <= 0 or window.height <= 0:
+        return None
+    return window.left, window.top, window.width, window.height
+
+
+def _union(boxes: list[Box]) -> Box:
+    left = min(box[0] for box in boxes)
+    top = min(box[1] for box in boxes)
+    right = max(box[0] + box[2] for box in boxes)
+    bottom = max(box[1] + box[3] for box in boxes)
+    return left, top, right - left, bottom - top
+
+
+def _fit(box: Box, screen: tuple[int, int]) -> Box | None:
+    """Pad, enlarge and clamp `box` to the screen; None when the full screen is better."""
+    width, height = screen
+    pad_x, pad_y = round(width * settings.padding), round(height * settings.padding)
+    left, top = box[0] - pad_x, box[1] - pad_y
+    right, bottom = box[0] + box[2] + pad_x, box[1] + box[3] + pad_y
+
+    min_width, min_height = round(width * settings.min_share), round(height * settings.min_share)
+    if right - left < min_width:
+        center = (left + right) // 2
+        left, right = center - min_width // 2, center + min_width // 2
+    if bottom - top < min_height:
+        center = (top + bottom) // 2
+        top, bottom = center - min_height // 2, center + min_height // 2
+
+    # Shift rather than shrink a region hanging over an edge.
+    left, right = (0, right - left) if left < 0 else (left, right)
+    top, bottom = (0, bottom - top) if top < 0 else (top, bottom)
+    left, right = (left - (right - width), width) if right > width else (left, right)
+    top, bottom = (top - (bottom - height), height) if bottom > height else (top, bottom)
+    left, top = max(0, left), max(0, top)
+
+    if (right - left) * (bottom - top) > settings.max_area * width * height:
+        return None
+    return left, top, right - left, bottom - top
+
+
+class RegionTracker:
+    """Remembers the previous frame to locate changes between captures."""
+
+    def __init__(self):
+        self.previous: Image.Image | None = None
+
+    def reset(self) -> None:
+        self.previous = None
+
+    def region(self, image: Image.Image, screen: tuple[int, int], last_coord: list[int] | None = None) -> Box | None:
+        """
+        **Choose the screen region worth analyzing.**
+        Parameters:
+            image (Image.Image): The current frame.
+            screen (tuple[int, int]): The logical screen size, which `image` may exceed on scaled displays.
+            last_coord (list[int] | None): The screen coordinate of the last pointer operation.
+        Returns:
+            Box | None: The `(left, top, width, height)` region in screen coordinates, or None for the full frame.
+        """
+        previous, self.previous = self.previous, image
+        if not settings.enabled or screen[0] < settings.min_screen_width:
+            return None
+
+        candidate = None
+        if previous is not None:
+            tiles = frame_change.changed_tiles(previous, image)
+            if tiles:
+                scale_x, scale_y = screen[0] / image.width, screen[1] / image.height
+                left, top, width, height = _union(tiles)
+                candidate = (round(left * scale_x), round(top * scale_y), round(width * scale_x), round(height * scale_y))
+        if candidate is None:
+            candidate = _focused_window()
+        if candidate is None and last_coord is not None:
+            width, height = round(screen[0] * settings.operation_share), round(screen[1] * settings.operation_share)
+            candidate = (last_coord[0] - width // 2, last_coord[1] - height // 2, width, height)
+        if candidate is None:
+            return None
+
+        region = _fit(candidate, screen)
+        logger.debug("Region of interest: %s", region or "full screen")
+        return region
+
+
+def crop(image: Image.Image, region: Box, screen: tuple[int, int]) -> Image.Image:
+    """Crop the screen `region` out of `image`, whose pixels may not match the logical screen size."""
+    scale_x, scale_y = image.width / screen[0], image.height / screen[1]
+    left, top, width, height = region
+    return image.crop((round(left * scale_x), round(top * scale_y), round((left + width) * scale_x), round((top + height) * scale_y)))
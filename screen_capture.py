@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: screen_capture.py
+Description:
+    This module provides the in-memory capture-to-payload path used by the vision loop.
+    Frames are grabbed through a pluggable backend (pyautogui, mss or a synthetic source
+    for headless testing), optionally downscaled, converted to grayscale and encoded as
+    JPEG, WebP or PNG straight into a base64 payload, without writing to disk. Every
+    encoded frame remembers the screen region it shows, so coordinates the model returns
+    for the image are mapped back to absolute screen positions.
+"""
+import base64
+import io
+import itertools
+import logging
+import threading
+from typing import Callable, Iterable, Literal, Protocol
+
+from PIL import Image, ImageDraw
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureSettings(BaseModel):
+    """How frames are turned into model payloads."""
+
+    max_width: int = Field(1280, description="Frames wider than this are downscaled, 0 keeps the native size.")
+    max_height: int = Field(1280, description="Frames taller than this are downscaled, 0 keeps the native size.")
+    format: Literal["JPEG", "WEBP", "PNG"] = Field("JPEG", description="The encoding of the payload.")
+    quality: int = Field(75, description="The JPEG/WebP quality, from 1 to 100.")
+    grayscale: bool = Field(False, description="Whether to drop the colour channels.")
+
+
+class EncodedFrame(BaseModel):
+    """An encoded image and the screen region it shows."""
+
+    data: str = Field(..., description="The base64-encoded image.")
+    mime: str = Field(..., description="The MIME type of the image.")
+    width: int = Field(..., description="The width of the encoded image.")
+    height: int = Field(..., description="The height of the encoded image.")
+    box: tuple[int, int, int, int] = Field(..., description="The (left, top, width, height) screen region shown.")
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{self.data}"
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.data) * 3 // 4
+
+    def to_screen(self, x: int, y: int) -> list[int]:
+        """Map a coordinate on the encoded image to an absolute screen coordinate."""
+        left, top, width, height = self.box
+        return [round(left + x * width / self.width), round(top + y * height / self.height)]
+
+
+class CaptureBackend(Protocol):
+    def grab(self) -> Image.Image: ...
+
+    def size(self) -> tuple[int, int]: ...
+
+
+class PyAutoGUIBackend:
+    """Capture with pyautogui, which returns the screenshot as an in-memory PIL image."""
+
+    def __init__(self):
+        import pyautogui
+        self._pg = pyautogui
+
+    def grab(self) -> Image.Image:
+        return self._pg.screenshot()
+
+    def size(self) -> tuple[int, int]:
+        return tuple(self._pg.size())
+
+
+class MSSBackend:
+    """Capture the primary monitor with mss, noticeably faster than pyautogui on Windows."""
+
+    def __init__(self, monitor: int = 1):
+        import mss
+        self._new = mss.mss
+        # mss handles only work in the thread that created them, e.g. the capture service thread.
+        self._local = threading.local()
+        self._monitor = self._handle().monitors[monitor]
+
+    def _handle(self):
+        if not hasattr(self._local, "mss"):
+            self._local.mss = self._new()
+        return self._local.mss
+
+    def grab(self) -> Image.Image:
+        shot = self._handle().grab(self._monitor)
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+    def size(self) -> tuple[int, int]:
+        return self._monitor["width"], self._monitor["height"]
+
+
+class SyntheticBackend:
+    """
+    **Serve frames without a display.**
+    Frames come from `frames` (images or a callable returning one), cycling forever;
+    by default a numbered test pattern of `resolution` is drawn for every grab.
+    """
+
+    def __init__(self, frames: Iterable[Image.Image] | Callable[[], Image.Image] | None = None, resolution: tuple[int, int] = (1920, 1080)):
+        self.resolution = resolution
+        self.grabs = 0
+        if callable(frames):
+            self._next = frames
+        elif frames is not None:
+            iterator = itertools.cycle(list(frames))
+            self._next = lambda: next(iterator)
+        else:
+            self._next = self._pattern
+
+    def _pattern(self) -> Image.Image:
+        image = Image.new("RGB", self.resolution, (40, 90, 160))
+        ImageDraw.Draw(image).text((20, 20), f"frame {self.grabs}", fill=(255, 255, 255))
+        return image
+
+    def grab(self) -> Image.Image:
+        self.grabs += 1
+        return self._next()
+
+    def size(self) -> tuple[int, int]:
+        return self.resolution
+
+
+settings = CaptureSettings()
+_backend: CaptureBackend | None = None
+
+
+def get_backend() -> CaptureBackend:
+    global _backend
+    if _backend is None:
+        _backend = PyAutoGUIBackend()
+    return _backend
+
+
+def set_backend(backend: CaptureBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def encode_frame(image: Image.Image, options: CaptureSettings | None = None, box: tuple[int, int, int, int] | None = None) -> EncodedFrame:
+    """
+    **Downscale and encode an image into a model payload.**
+    Parameters:
+        image (Image.Image): The captured frame.
+        options (CaptureSettings | None): The encoding options, the module `settings` by default.
+        box (tuple | None): The screen region `image` shows, the whole image at the origin by default.
+    Returns:
+        EncodedFrame: The payload and its mapping back to the screen.
+    """
+    options = options or settings
+    box = box or (0, 0, *image.size)
+
+    scale = 1.
+    if options.max_width:
+        scale = min(scale, options.max_width / image.width)
+    if options.max_height:
+        scale = min(scale, options.max_height / image.height)
+    if scale < 1.:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR, reducing_gap=2.)
+
+    if options.grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if options.format == "PNG":
+        image.save(buffer, format="PNG", optimize=False)
+    else:
+        image.save(buffer, format=options.format, quality=options.quality)
+
+    return EncodedFrame(
+        data=base64.b64encode(buffer.getvalue()).decode("ascii"),
+        mime=f"image/{options.format.lower()}",
+        width=image.width,
+        height=image.height,
+        box=box,
+    )
+
+
+def capture(options: CaptureSettings | None = None, image: Image.Image | None = None,
+            region: tuple[int, int, int, int] | None = None) -> EncodedFrame:
+    """
+    **Capture the screen and encode it in memory.**
+    Parameters:
+        options (CaptureSettings | None): The encoding options, the module `settings` by default.
+        image (Image.Image | None): A frame already grabbed from the backend, grabbed now by default.
+        region (tuple | None): The `(left, top, width, height)` screen region to keep, the whole screen by default.
+    Returns:
+        EncodedFrame: The encoded frame of the region.
+    """
+    backend = get_backend()
+    image = image if image is not None else backend.grab()
+    # The box uses the logical screen size, which differs from the image size on scaled displays.
+    screen = tuple(backend.size())
+    if region is not None:
+        import roi
+        image = roi.crop(image, region, screen)
+    frame = encode_frame(image, options, box=region or (0, 0, *screen))
+    logger.debug("Captured %sx%s frame, sent as %sx%s %s (%d bytes)", image.width, image.height, frame.width, frame.height, frame.mime, frame.size_bytes)
+    return frame
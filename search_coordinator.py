@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: search_coordinator.py
+Description:
+    This module fans a search out to every registered source at once, instead of trying
+    the desktop, the file index and Everything one judge step at a time. Every source
+    runs on a daemon thread of its own with its own timeout; the results that arrive in
+    time are merged, deduplicated by normalized path and ranked against the request, so
+    a single judge call sees candidates from all sources. A running call cannot be
+    interrupted, so a source that timed out is abandoned to finish on its own and is
+    skipped until it does, which keeps a hung source from holding more than one thread.
+    Sources are plain objects with a `search` method, including in-memory stand-ins for
+    offline testing.
+"""
+import importlib.util
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from typing import Callable, Protocol
+
+import candidate_ranker
+import regex_engine
+import tools
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 2.
+MAX_RESULTS = 50
+
+
+class SearchSource(Protocol):
+    name: str
+    timeout: float
+
+    def search(self, pattern: str, max_results: int) -> list[tools.Item]:
+        """Return up to `max_results` items whose name matches the regex `pattern`."""
+
+
+class DesktopSource:
+    """The desktop items; the whole desktop is small, so the pattern is ignored."""
+
+    name = "desktop"
+
+    def __init__(self, items: Callable[[], list[tools.Item]] = lambda: tools.get_desktop_items("open"), timeout: float = DEFAULT_TIMEOUT):
+        self.items = items
+        self.timeout = timeout
+
+    def search(self, pattern: str, max_results: int) -> list[tools.Item]:
+        return list(self.items())
+
+
+class FileIndexSource:
+    """The local `file_index`."""
+
+    name = "file_index"
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+
+    def search(self, pattern: str, max_results: int) -> list[tools.Item]:
+        return tools.get_by_index_search(pattern, max_results=max_results)
+
+
+class EverythingSource:
+    """The Everything service, on Windows machines where `everytools` is installed."""
+
+    name = "everything"
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec("everytools") is not None
+
+    def search(self, pattern: str, max_results: int) -> list[tools.Item]:
+        return tools.get_by_everytools_search(pattern, max_results=max_results)
+
+
+class StaticSource:
+    """A fixed list of items filtered in memory, optionally slowed down, for offline tests."""
+
+    def __init__(self, items: list[tools.Item], name: str = "static", delay: float = 0., timeout: float = DEFAULT_TIMEOUT):
+        self.items = items
+        self.name = name
+        self.delay = delay
+        self.timeout = timeout
+
+    def search(self, pattern: str, max_results: int) -> list[tools.Item]:
+        if self.delay:
+            time.sleep(self.delay)
+        compiled = regex_engine.compile_pattern(pattern)
+        return [item for item in self.items if compiled.search(item["name"])][:max_results]
+
+
+def normalize_path(path: str) -> str:
+    return os.path.normcase(os.path.normpath(path))
+
+
+class SearchCoordinator:
+    """
+    **Query every source concurrently and merge the results.**
+    """
+
+    def __init__(self, sources: list[SearchSource]):
+        self.sources = list(sources)
+        # "abandoned" counts the calls still running past their timeout.
+        self.stats = {source.name: {"results": 0, "timeouts": 0, "errors": 0, "abandoned": 0, "skipped": 0} for source in self.sources}
+        self._lock = threading.Lock()
+        self._running: set[object] = set()
+        # The calls abandoned at their timeout and still running, with their source.
+        self._abandoned: dict[object, SearchSource] = {}
+
+    def _run(self, source: SearchSource, call: object, pattern: str, max_results: int, results: queue.Queue) -> None:
+        try:
+            results.put((call, source.search(pattern, max_results), None))
+        except Exception as e:
+            results.put((call, None, e))
+        finally:
+            with self._lock:
+                self._running.discard(call)
+                if self._abandoned.pop(call, None) is not None:
+                    self.stats[source.name]["abandoned"] -= 1
+
+    def _start(self, pattern: str, max_results: int, results: queue.Queue) -> dict[object, tuple[SearchSource, float]]:
+        """Start a call of every source that is not still running an abandoned one; returns the calls and their deadlines."""
+        start = time.monotonic()
+        calls = {}
+        for source in self.sources:
+            call = object()
+            with self._lock:
+                if any(hung is source for hung in self._abandoned.values()):
+                    self.stats[source.name]["skipped"] += 1
+                    logger.warning("Search source %s still runs a search that timed out, skipped", source.name)
+                    continue
+                self._running.add(call)
+            calls[call] = (source, start + source.timeout)
+            threading.Thread(target=self._run, args=(source, call, pattern, max_results, results),
+                             name=f"search-{source.name}", daemon=True).start()
+        return calls
+
+    def search(self, pattern: str, task: str = "", max_results: int = MAX_RESULTS) -> list[tools.Item]:
+        """
+        **Search every source with `pattern` and rank the merged results against `task`.**
+        Parameters:
+            pattern (str): The regex to search for. When empty, one is built from the
+                           keywords of `task`.
+            task (str): The user's request, used for ranking.
+            max_results (int): The maximum number of results asked from every source.
+        Returns:
+            list[tools.Item]: The merged candidates, deduplicated by path, best first.
+        """
+        if pattern:
+            # The pattern is written by the model: simplify it and refuse any that may
+            # backtrack catastrophically before a source spends its timeout on it.
+            pattern = regex_engine.sanitize(pattern)
+            try:
+                regex_engine.compile_pattern(pattern)
+            except regex_engine.UnsafePattern as e:
+                logger.warning("Searching by keywords instead of regex %r: %s", pattern, e)
+                pattern = ""
+        if not pattern:
+            pattern = "|".join(map(re.escape, candidate_ranker.keywords(task)))
+
+        start = time.monotonic()
+        # A queue per search, so late results of abandoned calls never mix with later searches.
+        results = queue.Queue()
+        pending = self._start(pattern, max_results, results)
+        batches = []
+
+        while pending:
+            try:
+                call, found, error = results.get(timeout=max(0., min(deadline for _, deadline in pending.values()) - time.monotonic()))
+            except queue.Empty:
+                now = time.monotonic()
+                for call in [call for call, (_, deadline) in pending.items() if deadline <= now]:
+                    source, _ = pending.pop(call)
+                    with self._lock:
+                        if call in self._running:
+                            self._abandoned[call] = source
+                            self.stats[source.name]["abandoned"] += 1
+                    self.stats[source.name]["timeouts"] += 1
+                    logger.warning("Search source %s timed out after %.2fs", source.name, source.timeout)
+                continue
+
+            if call not in pending:  # finished after its timeout
+                continue
+            source, _ = pending.pop(call)
+            if error is not None:
+                self.stats[source.name]["errors"] += 1
+                logger.error("Search source %s failed", source.name, exc_info=error)
+                continue
+            self.stats[source.name]["results"] += len(found or ())
+            batches.append(found or [])
+
+        merged, seen = [], set()
+        for found in batches:
+            for item in found:
+                key = normalize_path(item["path"])
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(item)
+
+        logger.info("Searched %d sources in %.3fs, %d unique results", len(self.sources), time.monotonic() - start, len(merged))
+        if not task:
+            return merged
+        return [item for _, item in candidate_ranker.rank(task, merged)]
+
+
+def default_sources() -> list[SearchSource]:
+    sources = [DesktopSource(), FileIndexSource()]
+    if EverythingSource.available():
+        sources.append(EverythingSource())
+    return sources
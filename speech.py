@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: speech.py
+Description:
+    This module provides streaming speech recognition. Audio comes from a source (the
+    microphone or a WAV file for tests) in short PCM chunks, an energy-based voice
+    activity detector ends the utterance after a stretch of silence, and a pluggable
+    recognizer turns the audio into partial and final transcripts: Vosk runs offline and
+    streams partials, Google is the online fallback, and a scripted recognizer replays a
+    known transcript for tests. `SpeculativeTask` starts work on a partial transcript
+    once it stops changing, and reuses or cancels it when the final transcript arrives.
+"""
+import functools
+import json
+import logging
+import math
+import os
+import time
+import wave
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, NamedTuple, Protocol
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CHUNK_MS = 30
+
+
+class Transcript(NamedTuple):
+    text: str
+    final: bool
+    stable: bool
+
+
+"""Audio sources"""
+class AudioSource(Protocol):
+    sample_rate: int
+
+    def chunks(self) -> Iterator[bytes]: ...
+
+
+class MicrophoneSource:
+    """16-bit mono audio from the default input device, through PyAudio."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, chunk_ms: int = CHUNK_MS):
+        self.sample_rate = sample_rate
+        self.frames_per_chunk = sample_rate * chunk_ms // 1000
+
+    def chunks(self) -> Iterator[bytes]:
+        import pyaudio
+
+        audio = pyaudio.PyAudio()
+        stream = audio.open(format=pyaudio.paInt16, channels=1, rate=self.sample_rate, input=True, frames_per_buffer=self.frames_per_chunk)
+        try:
+            while True:
+                yield stream.read(self.frames_per_chunk, exception_on_overflow=False)
+        finally:
+            stream.stop_stream()
+            stream.close()
+            audio.terminate()
+
+
+class WaveFileSource:
+    """16-bit mono audio from a WAV file, optionally paced like a live microphone."""
+
+    def __init__(self, path: str, chunk_ms: int = CHUNK_MS, realtime: bool = False):
+        self.path = path
+        self.chunk_ms = chunk_ms
+        self.realtime = realtime
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise ValueError(f"{path} is not 16-bit mono audio.")
+            self.sample_rate = wav.getframerate()
+
+    def chunks(self) -> Iterator[bytes]:
+        frames_per_chunk = self.sample_rate * self.chunk_ms // 1000
+        with wave.open(self.path, "rb") as wav:
+            while chunk := wav.readframes(frames_per_chunk):
+                if self.realtime:
+                    time.sleep(self.chunk_ms / 1000)
+                yield chunk
+
+
+"""Voice activity detection"""
+def rms(chunk: bytes) -> float:
+    samples = array("h", chunk[:len(chunk) - len(chunk) % 2])
+    if not samples:
+        return 0.
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+
+
+class EnergyVAD:
+    """
+    **End an utterance after a stretch of silence following speech.**
+    Chunks louder than `threshold` (RMS of 16-bit samples) count as speech.
+    """
+
+    def __init__(self, threshold: float = 500., silence_ms: int = 700, min_speech_ms: int = 200, max_ms: int = 15000):
+        self.threshold = threshold
+        self.silence_ms = silence_ms
+        self.min_speech_ms = min_speech_ms
+        self.max_ms = max_ms
+        self.reset()
+
+    def reset(self) -> None:
+        self.speech_ms = self.silence_run_ms = self.total_ms = 0
+
+    def update(self, chunk: bytes, chunk_ms: float) -> bool:
+        """Feed one chunk; returns True once the utterance has ended."""
+        self.total_ms += chunk_ms
+        if rms(chunk) >= self.threshold:
+            self.speech_ms += chunk_ms
+            self.silence_run_ms = 0
+        elif self.speech_ms:
+            self.silence_run_ms += chunk_ms
+        ended = self.speech_ms >= self.min_speech_ms and self.silence_run_ms >= self.silence_ms
+        return ended or self.total_ms >= self.max_ms
+
+
+"""Recognizers"""
+class Recognizer(Protocol):
+    def start(self, sample_rate: int) -> None: ...
+
+    def feed(self, chunk: bytes) -> str | None:
+        """Feed audio; returns the partial transcript so far, or None if unknown."""
+
+    def finish(self) -> str | None:
+        """The final transcript, or None if recognition failed."""
+
+
+class VoskRecognizer:
+    """Offline streaming recognition with Vosk; the model directory defaults to `HER_VOSK_MODEL`."""
+
+    def __init__(self, model_path: str | None = None):
+        import vosk
+
+        self._vosk = vosk
+        self._model = vosk.Model(model_path or os.environ["HER_VOSK_MODEL"])
+        self._recognizer = None
+        self._segments: list[str] = []
+
+    def start(self, sample_rate: int) -> None:
+        self._recognizer = self._vosk.KaldiRecognizer(self._model, sample_rate)
+        self._segments = []
+
+    def _text(self, result: str, key: str) -> str:
+        # Vosk separates Chinese words with spaces.
+        return json.loads(result).get(key, "").replace(" ", "")
+
+    def feed(self, chunk: bytes) -> str | None:
+        if self._recognizer.AcceptWaveform(chunk):
+            self._segments.append(self._text(self._recognizer.Result(), "text"))
+            return "".join(self._segments)
+        return "".join(self._segments) + self._text(self._recognizer.PartialResult(), "partial")
+
+    def finish(self) -> str:
+        self._segments.append(self._text(self._recognizer.FinalResult(), "text"))
+        return "".join(self._segments)
+
+
+class GoogleRecognizer:
+    """Online recognition with the Google Web Speech API; no partial transcripts."""
+
+    def __init__(self, language: str = "zh-CN"):
+        self.language = language
+        self._sample_rate = SAMPLE_RATE
+        self._audio = bytearray()
+
+    def start(self, sample_rate: int) -> None:
+        self._sample_rate = sample_rate
+        self._audio = bytearray()
+
+    def feed(self, chunk: bytes) -> str | None:
+        self._audio += chunk
+        return None
+
+    def finish(self) -> str | None:
+        import speech_recognition as sr
+
+        try:
+            return sr.Recognizer().recognize_google(sr.AudioData(bytes(self._audio), self._sample_rate, 2), language=self.language)
+        except sr.UnknownValueError:
+            return ""
+        except sr.RequestError as e:
+            logger.error("请求错误：%s", e)
+            return None
+
+
+class ScriptedRecognizer:
+    """Reveal a known transcript in proportion to the audio fed, for tests and benchmarks."""
+
+    def __init__(self, transcript: str, chars_per_second: float = 4.):
+        self.transcript = transcript
+        self.chars_per_second = chars_per_second
+        self._sample_rate = SAMPLE_RATE
+        self._samples = 0
+
+    def start(self, sample_rate: int) -> None:
+        self._sample_rate = sample_rate
+        self._samples = 0
+
+    def feed(self, chunk: bytes) -> str | None:
+        self._samples += len(chunk) // 2
+        revealed = int(self._samples / self._sample_rate * self.chars_per_second)
+        return self.transcript[:revealed]
+
+    def finish(self) -> str:
+        return self.transcript
+
+
+def stream(source: AudioSource, recognizer: Recognizer, vad: EnergyVAD | None = None, stable_chunks: int = 8) -> Iterator[Transcript]:
+    """
+    **Recognize one utterance, yielding transcripts as they change.**
+    A partial transcript is marked stable once it has not changed for `stable_chunks`
+    chunks; the last transcript yielded is the final one.
+    """
+    vad = vad or EnergyVAD()
+    vad.reset()
+    recognizer.start(source.sample_rate)
+
+    partial, unchanged = "", 0
+    for chunk in source.chunks():
+        text = recognizer.feed(chunk)
+        if text is not None and text != partial:
+            partial, unchanged = text, 0
+            yield Transcript(partial, final=False, stable=False)
+        elif partial:
+            unchanged += 1
+            if unchanged == stable_chunks:
+                yield Transcript(partial, final=False, stable=True)
+        if vad.update(chunk, len(chunk) / 2 / source.sample_rate * 1000):
+            break
+
+    yield Transcript(recognizer.finish() or "", final=True, stable=True)
+
+
+class SpeculativeTask:
+    """
+    **Run `work` ahead of time on stable partial transcripts.**
+    Starting new work cancels the previous speculation when it has not begun yet; its
+    result is simply discarded otherwise. `resolve` reuses the speculation when the final
+    transcript matches the text it was started with.
+    """
+
+    def __init__(self, work: Callable[[str], object], normalize: Callable[[str], str] = lambda text: "".join(text.split())):
+        self.work = work
+        self.normalize = normalize
+        self.stats = {"started": 0, "reused": 0, "discarded": 0, "failed": 0}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculation")
+        self._text: str | None = None
+        self._future: Future | None = None
+
+    def on_transcript(self, transcript: Transcript) -> None:
+        if not transcript.stable or transcript.final:
+            return
+        text = self.normalize(transcript.text)
+        if not text or text == self._text:
+            return
+        self._discard()
+        self._text = text
+        self._future = self._executor.submit(self.work, transcript.text)
+        self.stats["started"] += 1
+        logger.debug("Speculating on %r", transcript.text)
+
+    def _discard(self) -> None:
+        if self._future is not None:
+            self._future.cancel()
+            self.stats["discarded"] += 1
+        self._text, self._future = None, None
+
+    def resolve(self, final: str):
+        """
+        The result of `work` for the final transcript, speculated or not. Speculation only
+        saves time: if `work` fails, the error is logged and None is returned, so the
+        transcript still goes through the normal path.
+        """
+        try:
+            if self._future is not None and self._text == self.normalize(final):
+                self.stats["reused"] += 1
+                future, self._future, self._text = self._future, None, None
+                return future.result()
+            self._discard()
+            return self.work(final)
+        except Exception:
+            self.stats["failed"] += 1
+            logger.exception("Speculation on %r failed", final)
+            return None
+
+    def close(self) -> None:
+        self._discard()
+        self._executor.shutdown(wait=False)
+
+
+@functools.lru_cache(maxsize=1)
+def get_recognizer() -> Recognizer | None:
+    """The streaming recognizer selected by `HER_SPEECH` ('vosk', 'google'), or None to use `tools`. Loaded once."""
+    match os.environ.get("HER_SPEECH", "").lower():
+        case "vosk":
+            return VoskRecognizer()
+        case "google":
+            return GoogleRecognizer()
+        case _:
+            return None
+
+
+def listen(recognizer: Recognizer, source: AudioSource | None = None, speculation: SpeculativeTask | None = None):
+    """
+    **Recognize one utterance, speculating on its stable partial transcripts.**
+    Returns:
+        tuple: The final transcript and the result of the speculative work for it
+               (None without `speculation`).
+    """
+    source = source or MicrophoneSource()
+    logger.info("请开始说话...")
+    final = ""
+    for transcript in stream(source, recognizer):
+        if transcript.final:
+            final = transcript.text
+        elif speculation is not None:
+            speculation.on_transcript(transcript)
+    logger.info("识别结果：%s", final)
+
+    if speculation is None or not final:
+        return final, None
+    return final, speculation.resolve(final)
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+"""
+File: telemetry.py
+Description:
+    This module instruments both LangGraph workflows. Every graph node runs inside a
+    span recording its wall time, and code inside a node adds measurements to the
+    current span with `record`: LLM latency and token counts, image bytes sent, cache
+    hits. A span adds its measurements to its parent when it ends, so the root span of a
+    task holds the totals of the task and the number of loop iterations. Finished spans
+    go into a bounded queue and are appended to a JSONL file by a background writer, like
+    the records of `log_pipeline`, so no node waits on the disk; spans are dropped and
+    counted when the queue is full. Every measurement feeds an in-process histogram whose
+    percentiles `snapshot` reports.
+
+    Telemetry is off unless `HER_TELEMETRY=1`; when off, instrumented code pays one
+    attribute check per call.
+"""
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPANS_PATH = os.path.join(os.path.expanduser("~"), ".her", "spans.jsonl")
+
+
+class TelemetrySettings(BaseModel):
+    """Whether and where telemetry is recorded."""
+
+    enabled: bool = Field(os.environ.get("HER_TELEMETRY", "0") == "1", description="Whether spans and metrics are recorded.")
+    spans_path: str | None = Field(os.environ.get("HER_TELEMETRY_PATH", DEFAULT_SPANS_PATH), description="The JSONL file finished spans are appended to, None to keep metrics only.")
+    samples: int = Field(4096, description="The number of recent samples every histogram keeps for its percentiles.")
+    queue_size: int = Field(10_000, description="The finished spans waiting to be written at most; more are dropped.")
+
+
+settings = TelemetrySettings()
+stats = {"dropped": 0}
+
+
+"""Metrics"""
+class Histogram:
+    """Count, sum and extremes of every value, percentiles of the most recent ones."""
+
+    PERCENTILES = (50, 90, 95, 99)
+
+    def __init__(self, samples: int):
+        self.count = 0
+        self.total = 0.
+        self.min = float("inf")
+        self.max = float("-inf")
+        self._samples = deque(maxlen=samples)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._samples.append(value)
+
+    @staticmethod
+    def _percentile(ordered: list[float], percent: float) -> float:
+        """The nearest-rank percentile of sorted values."""
+        if not ordered:
+            return 0.
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))]
+
+    def percentile(self, percent: float) -> float:
+        return self._percentile(sorted(self._samples), percent)
+
+    def summary(self) -> dict:
+        ordered = sorted(self._samples)
+        summary = {"count": self.count, "sum": self.total, "mean": self.total / self.count if self.count else 0.,
+                   "min": self.min if self.count else 0., "max": self.max if self.count else 0.}
+        for percent in self.PERCENTILES:
+            summary[f"p{percent}"] = self._percentile(ordered, percent)
+        return summary
+
+
+_histograms: dict[str, Histogram] = {}
+_lock = threading.Lock()
+
+
+def observe(name: str, value: float) -> None:
+    """Add a value to the histogram `name`."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(settings.samples)
+        histogram.add(value)
+
+
+def snapshot() -> dict[str, dict]:
+    """The summary of every histogram, by name."""
+    with _lock:
+        return {name: histogram.summary() for name, histogram in sorted(_histograms.items())}
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+
+
+"""Spans"""
+class Span:
+    """A timed unit of work with measurements, inside a trace."""
+
+    def __init__(self, name: str, parent: "Span | None" = None, attributes: dict | None = None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes or {})
+        self.metrics: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+        self.start = time.time()
+        self._clock = time.perf_counter()
+        self.duration = 0.
+
+    def add(self, metrics: dict[str, float]) -> None:
+        with _lock:
+            for key, value in metrics.items():
+                self.metrics[key] = self.metrics.get(key, 0) + value
+
+    def end(self, error: BaseException | None = None) -> None:
+        self.duration = time.perf_counter() - self._clock
+        if error is not None:
+            self.attributes["error"] = repr(error)
+        if self.calls:
+            # The most repeated node is the one the loop goes through.
+            self.metrics["iterations"] = max(self.calls.values())
+
+        prefix = "node" if self.parent else "task"
+        observe(f"{prefix}.{self.name}.seconds", self.duration)
+        if self.parent is None:
+            for key, value in self.metrics.items():
+                observe(f"task.{key}", value)
+        else:
+            with _lock:
+                self.parent.calls[self.name] = self.parent.calls.get(self.name, 0) + 1
+            self.parent.add({key: value for key, value in self.metrics.items() if key != "iterations"})
+        _export(self)
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent.span_id if self.parent else None,
+                "name": self.name, "start": self.start, "duration": self.duration,
+                "attributes": dict(self.attributes), "metrics": dict(self.metrics)}
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar("span", default=None)
+
+
+"""Export"""
+class _SpanFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+_queue: queue.Queue | None = None
+_writer: logging.handlers.QueueListener | None = None
+_writer_path: str | None = None
+_writer_lock = threading.Lock()
+
+
+def _stop_writer() -> None:
+    global _writer, _writer_path
+    if _writer is not None:
+        # Stopping the listener writes what is queued first.
+        _writer.stop()
+        for handler in _writer.handlers:
+            handler.close()
+    _writer, _writer_path = None, None
+
+
+def _start_writer(path: str) -> None:
+    global _queue, _writer, _writer_path
+    _stop_writer()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    file = logging.FileHandler(path, encoding="utf-8", delay=True)
+    file.setFormatter(_SpanFormatter())
+    if _queue is None:
+        _queue = queue.Queue(settings.queue_size)
+    _writer = logging.handlers.QueueListener(_queue, file)
+    _writer.start()
+    _writer_path = path
+
+
+def _export(span: Span) -> None:
+    path = settings.spans_path
+    if not path:
+        return
+    if _writer_path != path:
+        with _writer_lock:
+            try:
+                if _writer_path != path:
+                    _start_writer(path)
+            except OSError as e:
+                logger.warning("Could not export span %s: %s", span.name, e)
+                return
+    try:
+        _queue.put_nowait(logging.makeLogRecord({"msg": span.to_dict()}))
+    except queue.Full:
+        stats["dropped"] += 1
+
+
+def flush() -> None:
+    """Write the spans still queued and close the file; the next span starts the writer again."""
+    with _writer_lock:
+        _stop_writer()
+
+
+atexit.register(flush)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """
+    **Run the enclosed block in a span, the child of the current one if any.**
+    Yields the span, or None when telemetry is disabled.
+    """
+    if not settings.enabled:
+        yield None
+        return
+    current = Span(name, _current.get(), attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    else:
+        current.end()
+    finally:
+        _current.reset(token)
+
+
+def record(**metrics: float) -> None:
+    """Add measurements to the current span, e.g. `record(image_bytes=1024)`."""
+    if not settings.enabled:
+        return
+    current = _current.get()
+    if current is not None:
+        current.add(metrics)
+    for key, value in metrics.items():
+        observe(key, value)
+
+
+def traced(name: str, node):
+    """
+    **Wrap a graph node, synchronous or not, so every call runs in a span.**
+    Parameters:
+        name (str): The name of the node in the graph.
+        node: The node function, taking the state.
+    Returns:
+        The wrapped node.
+    """
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def wrapper(state):
+            if not settings.enabled:
+                return await node(state)
+            with span(name):
+                return await node(state)
+    else:
+        @functools.wraps(node)
+        def wrapper(state):
+            if not settings.enabled:
+                return node(state)
+            with span(name):
+                return node(state)
+    return wrapper
+
+
+"""LLM calls"""
+class _Usage:
+    """Collects the token usage the chat model reports through a LangChain callback."""
+
+    def __init__(self):
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        usage = self
+
+        class Handler(BaseCallbackHandler):
+            def on_llm_end(self, response, **kwargs):
+                usage.collect(response)
+
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.handler = Handler()
+
+    def collect(self, response) -> None:
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        if not token_usage:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    token_usage = {"prompt_tokens": metadata.get("input_tokens", 0), "completion_tokens": metadata.get("output_tokens", 0)}
+        self.prompt_tokens += token_usage.get("prompt_tokens", 0) or 0
+        self.completion_tokens += token_usage.get("completion_tokens", 0) or 0
+
+
+@contextlib.contextmanager
+def llm_call(kwargs: dict):
+    """
+    **Measure one chat model call made with `kwargs`.**
+    The keyword arguments are extended with a callback collecting the token usage; the
+    latency and token counts are recorded once the block ends.
+    """
+    if not settings.enabled:
+        yield kwargs
+        return
+    usage = _Usage()
+    config = dict(kwargs.get("config") or {})
+    config["callbacks"] = list(config.get("callbacks") or []) + [usage.handler]
+    start = time.perf_counter()
+    try:
+        yield {**kwargs, "config": config}
+    finally:
+        record(llm_calls=1, llm_seconds=time.perf_counter() - start,
+               prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
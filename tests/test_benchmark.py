@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import subprocess
+import sys
+
+import benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def result(p95: float) -> dict:
+    return {"runs": 1, "throughput": 1., "p50": p95, "p95": p95, "p99": p95, "mean": p95}
+
+
+def test_p95_growth_beyond_the_tolerance_is_a_regression():
+    baseline = {"scenarios": {"open/judge": result(.1), "operate/vision": result(.1)}, "micro": {}}
+    report = {"scenarios": {"open/judge": result(.12), "operate/vision": result(.2), "new": result(1.)}, "micro": {}}
+    regressions = benchmark.compare(report, baseline, tolerance=.25)
+    assert len(regressions) == 1 and regressions[0].startswith("operate/vision")
+
+
+def test_the_benchmark_runs_offline(tmp_path):
+    # In a process of its own, since it replaces the model, the screen and the index.
+    output = tmp_path / "report.json"
+    completed = subprocess.run([sys.executable, "benchmark.py", "--runs", "1", "--files", "200", "--latency", "0", "--output", str(output)],
+                               cwd=ROOT, capture_output=True, text=True, timeout=300)
+    assert completed.returncode == 0, completed.stderr
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert set(report["scenarios"]) == set(benchmark.SCENARIOS)
+    assert all(scenario["runs"] == 1 for scenario in report["scenarios"].values())
+    assert "file_index.search/200" in report["micro"]
+    assert benchmark.compare(report, report, tolerance=0.) == []
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import candidate_ranker
+
+# The request as `text_improvement` rewrites "打开微信".
+REWRITTEN = "请找到与微信相关的文件或文件夹，搜索系统中与微信相关的可执行文件或安装文件。"
+
+
+def items(*names: str) -> list[dict]:
+    return [{"name": name, "path": f"/home/user/Desktop/{name}"} for name in names]
+
+
+def test_keywords_drop_the_phrasing_of_the_request():
+    assert candidate_ranker.keywords(REWRITTEN) == ["微信"]
+    assert candidate_ranker.keywords("请帮我打开项目2报告") == ["项目2报告"]
+
+
+def test_generic_folders_do_not_match_a_rewritten_request():
+    match, shortlist = candidate_ranker.shortlist(REWRITTEN, items("文件", "系统", "安装", "notes.txt"))
+    assert match is None
+    assert len(shortlist) == 4
+
+
+def test_aliases_match_in_both_languages():
+    match, _ = candidate_ranker.shortlist(REWRITTEN, items("文件", "系统", "WeChat.lnk"))
+    assert match["name"] == "WeChat.lnk"
+    match, _ = candidate_ranker.shortlist("open wechat", items("微信.lnk", "notes.txt"))
+    assert match["name"] == "微信.lnk"
+
+
+def test_names_covering_more_keywords_rank_first():
+    ranked = candidate_ranker.rank("打开项目 2024 周报", items("周报.docx", "项目2024周报.docx", "2024.txt"))
+    assert [candidate["name"] for _, candidate in ranked][0] == "项目2024周报.docx"
+
+
+def test_the_implied_file_type_breaks_ties():
+    ranked = candidate_ranker.rank("打开周报的pdf", items("周报.docx", "周报.pdf"))
+    assert ranked[0][1]["name"] == "周报.pdf"
+
+
+def test_close_candidates_are_left_to_the_judge():
+    match, shortlist = candidate_ranker.shortlist("打开微信", items("WeChat.lnk", "微信.lnk"))
+    assert match is None
+    assert {candidate["name"] for candidate in shortlist} == {"WeChat.lnk", "微信.lnk"}
+
+
+def test_boosts_never_make_a_mismatch_confident():
+    candidates = items("文件", "notes.txt")
+    boosts = {candidates[0]["path"]: 1.}
+    ranked = candidate_ranker.rank(REWRITTEN, candidates, boosts)
+    assert ranked[0][1] is candidates[0]
+    assert ranked[0][0] <= candidate_ranker.score(candidate_ranker._Query(REWRITTEN), candidates[0]) + candidate_ranker.FRECENCY_WEIGHT
+    assert candidate_ranker.shortlist(REWRITTEN, candidates, threshold=0., boosts=boosts)[0] is None
+
+
+@pytest.mark.parametrize("task, name, expected", [
+    ("打开微信", "WeChat.lnk", True),
+    ("打开微信", "微信.lnk", True),
+    ("打开微信的聊天记录", "微信.lnk", False),
+    ("微信", "微信.lnk", False),
+])
+def test_open_requests(task, name, expected):
+    assert candidate_ranker.is_open_request(task, name) is expected
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import time
+
+from PIL import Image
+
+import frame_change
+import screen_capture
+from capture_service import CaptureService, ServiceSettings
+
+OPTIONS = ServiceSettings(rate=100., buffer_size=3)
+
+
+def test_frames_are_grabbed_after_the_given_moment():
+    with CaptureService(screen_capture.SyntheticBackend(resolution=(320, 180)), OPTIONS) as service:
+        after = time.monotonic()
+        frame = service.wait_for(after, timeout=2.)
+        assert frame is not None and frame.timestamp > after
+        assert frame.image.size == (320, 180)
+
+
+def test_the_buffer_is_bounded():
+    backend = screen_capture.SyntheticBackend(resolution=(64, 64))
+    with CaptureService(backend, OPTIONS) as service:
+        while backend.grabs < 10:
+            time.sleep(.01)
+        assert len(service._frames) == OPTIONS.buffer_size
+    assert service.latest() is None
+
+
+def test_a_static_screen_settles():
+    with CaptureService(screen_capture.SyntheticBackend([Image.new("RGB", (64, 64), "white")]), OPTIONS) as service:
+        assert service.wait_for(time.monotonic(), settled=True, timeout=2.) is not None
+        assert service.stats["timeouts"] == 0
+
+
+def test_a_changing_screen_times_out_with_the_newest_frame():
+    images = itertools.cycle([Image.new("RGB", (64, 64), "white"), Image.effect_noise((64, 64), 100).convert("RGB")])
+    with CaptureService(screen_capture.SyntheticBackend(lambda: next(images)), OPTIONS) as service:
+        after = time.monotonic()
+        frame = service.wait_for(after, settled=True, timeout=.2)
+        assert frame is not None and frame.timestamp > after
+        assert service.stats["timeouts"] == 1
+
+
+
+def test_a_small_change_the_hash_misses_is_not_settled():
+    base = Image.new("RGB", (640, 360), "white")
+    typed = base.copy()
+    typed.paste((0, 0, 0), (100, 100, 300, 112))
+    assert frame_change.is_same(frame_change.dhash(base), frame_change.dhash(typed))
+    images = itertools.cycle([base, typed])
+    with CaptureService(screen_capture.SyntheticBackend(lambda: next(images)), OPTIONS) as service:
+        frame = service.wait_for(time.monotonic(), settled=True, timeout=.2)
+        assert frame is not None and not frame.steady
+        assert service.stats["timeouts"] == 1
+
+
+def test_a_paused_service_grabs_nothing_until_waited_on():
+    backend = screen_capture.SyntheticBackend(resolution=(64, 64))
+    with CaptureService(backend, OPTIONS) as service:
+        assert service.wait_for(time.monotonic(), timeout=2.) is not None
+        service.pause()
+        time.sleep(.05)
+        grabs = backend.grabs
+        time.sleep(.1)
+        assert backend.grabs == grabs
+        assert service.wait_for(time.monotonic(), timeout=2.) is not None
+        assert backend.grabs > grabs
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+import daemon
+
+
+def record(status: str, finished: float | None = None) -> dict:
+    return {"status": status} if finished is None else {"status": status, "finished": finished}
+
+
+def test_finished_tasks_expire_after_the_retention():
+    tasks = {"old": record("done", 0.), "recent": record("failed", 90.), "running": record("running"), "queued": record("queued")}
+    assert daemon._expire(tasks, now=100., retention=50.) == 1
+    assert sorted(tasks) == ["queued", "recent", "running"]
+
+
+def test_only_the_newest_finished_tasks_are_kept():
+    tasks = {f"task-{i}": record("done", float(i)) for i in range(10)}
+    tasks["running"] = record("running")
+    assert daemon._expire(tasks, now=10., retention=3600., max_finished=3) == 7
+    assert sorted(tasks) == ["running", "task-7", "task-8", "task-9"]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import random
+import struct
+
+import pytest
+
+import desktop_blob
+import tools
+
+
+def baseline_read(value: bytes) -> tuple[list[str], list[list[int]]]:
+    """The byte-by-byte parser `tools._read_reg_value` used before `desktop_blob`: the names and 1-based positions."""
+    offset = 0x10
+    number_of_items = struct.unpack_from("<I", value[offset:], 8)[0]
+
+    offset += 12
+    names = []
+    for _ in range(number_of_items):
+        uint32_filesize = struct.unpack_from("<I", value[offset:], 4)[0]
+        offset += 12
+        names.append(value[offset:(offset + (2 * uint32_filesize - 8))].decode("utf-16-le"))
+        offset += (2 * uint32_filesize - 4)
+
+    mapping = tools.generate_mapping(number_of_items)
+    positions = [[0, 0] for _ in names]
+    offs = len(value)
+    for _ in range(number_of_items):
+        offs -= 10
+        row = struct.unpack_from("<H", value[offs:], 6)[0]
+        column = struct.unpack_from("<H", value[offs:], 2)[0]
+        index = struct.unpack_from("<H", value[offs:], 8)[0]
+        positions[index] = [mapping.get(row, 0), mapping.get(column, 0)]
+    return names, positions
+
+
+def random_layout(count: int, seed: int) -> tuple[list[str], list[tuple[int, int]]]:
+    generator = random.Random(seed)
+    alphabet = "abcXYZ019 _-.项目报告微信ü"
+    names = ["".join(generator.choice(alphabet) for _ in range(generator.randint(1, 40))) + generator.choice((".lnk", ".docx", ""))
+             for _ in range(count)]
+    # Both parsers only tell apart as many rows and columns as there are items.
+    side = min(max(2, count), desktop_blob.MAX_GRID_INDEX)
+    cells = generator.sample([(row, column) for row in range(1, side + 1) for column in range(1, side + 1)], count)
+    return names, cells
+
+
+@pytest.mark.parametrize("count, seed", [(1, 0), (7, 1), (60, 2), (300, 3)])
+def test_decoder_matches_the_baseline_parser(count, seed):
+    names, cells = random_layout(count, seed)
+    blob = desktop_blob.generate_blob(names, cells)
+
+    expected_names, expected_positions = baseline_read(blob)
+    decoded_names, positions = desktop_blob.decode(blob)
+    assert list(decoded_names) == expected_names == names
+
+    items = tools._read_reg_value(blob, "click")
+    assert [item["entry_name"] for item in items] == names
+    assert [item["position"] for item in items] == expected_positions == [list(cell) for cell in cells]
+    assert len(positions) == count
+
+
+def test_parse_reuses_the_layout_of_a_known_blob():
+    desktop_blob.clear_cache()
+    blob = desktop_blob.generate_blob(["微信.lnk", "报告.docx"])
+    assert desktop_blob.parse(blob) is desktop_blob.parse(bytes(blob))
+    assert desktop_blob.parse(desktop_blob.generate_blob(["other"])) is not desktop_blob.parse(blob)
+
+
+def test_grid_beyond_the_distinct_values_is_refused():
+    with pytest.raises(ValueError):
+        desktop_blob.generate_blob(["a"], [(desktop_blob.MAX_GRID_INDEX + 1, 1)])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+import file_index
+from file_index import FileIndex
+
+
+def touch(path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("")
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "root"
+    for name in ("docs/weekly report.docx", "docs/2024 budget.xlsx", "music/song.mp3", "photo.jpg", "notes.txt"):
+        touch(root / name)
+    return root
+
+
+@pytest.fixture
+def index(tmp_path, tree):
+    index = FileIndex(str(tmp_path / "index.sqlite3"), roots=[str(tree)])
+    index.refresh()
+    return index
+
+
+def names(results: list[dict]) -> list[str]:
+    return [result["name"] for result in results]
+
+
+def test_a_fresh_index_is_not_ready_until_crawled(tmp_path, tree):
+    index = FileIndex(str(tmp_path / "index.sqlite3"), roots=[str(tree)])
+    assert not index.ready
+    index.refresh()
+    assert index.ready
+    assert len(index) == 7
+
+
+def test_searches_by_regex_category_and_terms(index):
+    assert names(index.search("report")) == ["weekly report.docx"]
+    assert names(index.search(r"^\d{4}")) == ["2024 budget.xlsx"]
+    assert names(index.search("", search_type="audio")) == ["song.mp3"]
+    assert names(index.search("docs", search_type="folder")) == ["docs"]
+    assert names(index.search("weekly docx", search_type="other")) == ["weekly report.docx"]
+
+
+def test_unsafe_patterns_find_nothing(index):
+    assert index.search(r"(a+)+$") == []
+
+
+def test_refresh_picks_up_added_and_removed_files(index, tree):
+    assert names(index.search("report")) == ["weekly report.docx"]
+    # Added after the regex engine was created, so matched as extra strings.
+    touch(tree / "docs" / "monthly report.docx")
+    os.remove(tree / "notes.txt")
+    os.utime(tree)
+    assert index.refresh() == (1, 1)
+    assert names(index.search("report")) == ["monthly report.docx", "weekly report.docx"]
+    assert index.search("notes") == []
+
+
+def test_removed_directories_take_their_contents_along(index, tree):
+    for name in os.listdir(tree / "music"):
+        os.remove(tree / "music" / name)
+    os.rmdir(tree / "music")
+    added, removed = index.refresh()
+    assert (added, removed) == (0, 2)
+    assert index.search("", search_type="audio") == []
+
+
+def test_a_stored_index_is_ready_when_loaded(tmp_path, index):
+    loaded = FileIndex(index.db_path, roots=index.roots)
+    assert loaded.load() == len(index)
+    assert loaded.ready
+    assert names(loaded.search("report")) == ["weekly report.docx"]
+
+
+def test_the_shared_index_is_crawled_in_the_background(tmp_path, tree, monkeypatch):
+    monkeypatch.setattr(file_index, "FileIndex", lambda: FileIndex(str(tmp_path / "shared.sqlite3"), roots=[str(tree)]))
+    file_index.set_index(None)
+    try:
+        index = file_index.get_index()
+        assert index._ready.wait(10)
+        assert names(index.search("report")) == ["weekly report.docx"]
+        assert file_index.get_index() is index
+    finally:
+        file_index.set_index(None)
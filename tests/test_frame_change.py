@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from PIL import Image, ImageDraw
+
+import frame_change
+
+
+@pytest.fixture
+def window():
+    image = Image.new("RGB", (1920, 1080), "white")
+    ImageDraw.Draw(image).rectangle((400, 300, 1500, 800), outline="gray")
+    return image
+
+
+def test_identical_frames_have_no_changed_tile(window):
+    assert frame_change.changed_tiles(window, window.copy()) == []
+    assert frame_change.is_same(frame_change.dhash(window), frame_change.dhash(window.copy()))
+
+
+def test_typed_line_is_a_change_the_hash_misses(window):
+    typed = window.copy()
+    ImageDraw.Draw(typed).text((420, 320), "hello world, a line typed into the box", fill="black")
+    # The hash alone would take both frames for the same one...
+    assert frame_change.is_same(frame_change.dhash(window), frame_change.dhash(typed))
+    # ...the tiles do not.
+    tiles = frame_change.changed_tiles(window, typed)
+    assert tiles
+    assert any(left <= 425 < left + width and top <= 325 < top + height for left, top, width, height in tiles)
+
+
+def test_blinking_caret_is_not_a_change(window):
+    caret = window.copy()
+    ImageDraw.Draw(caret).line((600, 500, 600, 516), fill="black")
+    assert frame_change.changed_tiles(window, caret) == []
+
+
+def test_new_window_changes_the_hash(window):
+    opened = window.copy()
+    ImageDraw.Draw(opened).rectangle((0, 0, 1000, 700), fill="navy")
+    assert not frame_change.is_same(frame_change.dhash(window), frame_change.dhash(opened))
+    assert len(frame_change.changed_tiles(window, opened)) > 10
+
+
+def test_frames_of_different_sizes_differ_everywhere(window):
+    assert frame_change.changed_tiles(window, window.resize((1280, 720))) == [(0, 0, 1280, 720)]
+
+
+def test_hash_threshold():
+    assert frame_change.is_same(0b1011, 0b1000, threshold=2)
+    assert not frame_change.is_same(0b1011, 0b0100, threshold=2)
+    assert not frame_change.is_same(None, 0)
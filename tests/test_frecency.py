@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+import candidate_ranker
+from frecency import FrecencyStore
+
+HALF_LIFE = 3600.
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FrecencyStore(str(tmp_path / "frecency.sqlite3"), half_life=HALF_LIFE)
+
+
+@pytest.fixture
+def targets(tmp_path):
+    paths = []
+    for name in ("WeChat.lnk", "微信备份", "report.docx"):
+        (tmp_path / name).write_text("")
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def age(store: FrecencyStore, path: str, seconds: float) -> None:
+    store._db.execute("UPDATE visits SET updated = updated - ? WHERE path = ?", (seconds, path))
+    store._db.commit()
+
+
+def test_frequent_targets_rank_first(store, targets):
+    wechat, backup, _ = targets
+    for path in (wechat, backup, wechat, wechat):
+        store.record("打开微信", path)
+    assert [path for _, path in store.ranked("打开 微信")] == [wechat, backup]
+    assert store.ranked("打开微信")[0][0] == pytest.approx(3., rel=1e-3)
+
+
+def test_visits_decay_with_the_half_life(store, targets):
+    wechat, backup, _ = targets
+    for _ in range(3):
+        store.record("打开微信", wechat)
+    store.record("打开微信", backup)
+    age(store, wechat, 2 * HALF_LIFE)
+    ranked = dict((path, score) for score, path in store.ranked("打开微信"))
+    assert ranked[wechat] == pytest.approx(.75, rel=1e-3)
+    assert [path for _, path in store.ranked("打开微信")] == [backup, wechat]
+
+
+def test_only_confident_and_dominant_targets_are_recalled(store, targets):
+    wechat, backup, _ = targets
+    store.record("打开微信", wechat)
+    assert store.lookup("打开微信") is None
+    store.record("打开微信", wechat)
+    assert store.lookup("打开微信") == wechat
+    store.record("打开微信", backup)
+    assert store.lookup("打开微信") is None
+
+
+def test_missing_targets_are_forgotten(store, targets):
+    wechat = targets[0]
+    store.record("打开微信", wechat)
+    store.record("打开微信", wechat)
+    os.remove(wechat)
+    assert store.lookup("打开微信") is None
+    assert store.stats["forgotten"] == 1
+
+
+def test_boosts_are_capped_in_the_shortlist(store, targets):
+    wechat, backup, report = targets
+    for _ in range(100):
+        store.record("打开报告", report)
+    boosts = store.boosts([wechat, report])
+    assert set(boosts) == {report} and 0. < boosts[report] < 1.
+
+    candidates = [{"name": os.path.basename(path), "path": path} for path in targets]
+    task = "打开微信"
+    query = candidate_ranker._Query(task)
+    plain = {candidate["path"]: candidate_ranker.score(query, candidate) for candidate in candidates}
+    boosted = {candidate["path"]: value for value, candidate in candidate_ranker.rank(task, candidates, boosts)}
+    assert 0. < boosted[report] - plain[report] <= candidate_ranker.FRECENCY_WEIGHT
+    # However familiar, a target that misses the request is never a confident match.
+    match, _ = candidate_ranker.shortlist("打开报告", candidates, boosts=store.boosts(targets), threshold=0.)
+    assert match is None or match["path"] == report
+    match, _ = candidate_ranker.shortlist(task, candidates[1:], boosts=store.boosts(targets), threshold=0., margin=0.)
+    assert match is None or match["path"] != report
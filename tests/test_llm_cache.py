@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from pydantic import BaseModel
+
+from llm_cache import CachedLLM, ResponseCache, make_key
+
+
+class Answer(BaseModel):
+    path: str = ""
+
+
+class FakeLLM:
+    """Answers with the number of calls made so far."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return AIMessage(content=f"answer {self.calls}")
+
+    def with_structured_output(self, schema, **kwargs):
+        llm = self
+
+        class Structured:
+            def invoke(self, messages, **kwargs):
+                llm.calls += 1
+                return schema(path=f"/answer/{llm.calls}")
+
+        return Structured()
+
+
+def messages(system: str = "Improve the request.", human: str = "打开微信") -> list:
+    return [SystemMessage(system), HumanMessage(human)]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "llm_cache.sqlite3")
+
+
+def test_repeated_calls_are_answered_from_the_cache(db_path):
+    llm = FakeLLM()
+    cached = CachedLLM(llm, ResponseCache(db_path), model_name="model")
+    assert cached.invoke(messages(human="打开 微信")).content == "answer 1"
+    # Whitespace and width variants normalize to the same key.
+    assert cached.invoke(messages(human=" 打开　 微信\n")).content == "answer 1"
+    assert llm.calls == 1
+    assert cached.cache.stats["misses"] == 1 and cached.cache.stats["memory_hits"] == 1
+
+
+def test_structured_answers_are_cached_as_their_schema(db_path):
+    llm = FakeLLM()
+    structured = CachedLLM(llm, ResponseCache(db_path), model_name="model").with_structured_output(Answer)
+    assert structured.invoke(messages()) == Answer(path="/answer/1")
+    assert structured.invoke(messages()) == Answer(path="/answer/1")
+    assert llm.calls == 1
+
+
+def test_the_memory_tier_falls_through_to_sqlite(db_path):
+    cache = ResponseCache(db_path, memory_entries=1)
+    cache.put("first", "1")
+    cache.put("second", "2")
+    assert cache.get("first") == "1"
+    assert cache.stats["disk_hits"] == 1
+    # The disk hit is promoted, so the next lookup stays in memory.
+    assert cache.get("first") == "1"
+    assert cache.stats["memory_hits"] == 1
+    assert ResponseCache(db_path).get("second") == "2"
+
+
+def test_expired_entries_are_misses(db_path):
+    cache = ResponseCache(db_path, ttl=0.)
+    cache.put("key", "value")
+    assert cache.get("key") is None
+    assert cache.stats["misses"] == 1
+
+
+def test_the_disk_tier_evicts_the_least_recently_used(db_path):
+    cache = ResponseCache(db_path, memory_entries=0, disk_max_bytes=10)
+    cache.put("old", "x" * 6)
+    cache.put("new", "y" * 6)
+    assert cache.get("old") is None
+    assert cache.get("new") == "y" * 6
+
+
+@pytest.mark.parametrize("other", [
+    make_key(messages(), "other-model"),
+    make_key(messages(system="Judge the candidates."), "model"),
+    make_key(messages(human="打开钉钉"), "model"),
+    make_key(messages(), "model", Answer),
+])
+def test_keys_change_with_the_model_prompt_and_schema(other):
+    assert make_key(messages(), "model") != other
+
+
+def test_a_disabled_cache_is_bypassed(db_path):
+    llm = FakeLLM()
+    cached = CachedLLM(llm, ResponseCache(db_path), model_name="model")
+    cached.cache.enabled = False
+    cached.invoke(messages())
+    cached.invoke(messages())
+    assert llm.calls == 2
+    assert cached.cache.stats["bypassed"] == 2
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import model_gateway
+
+
+class FakeLLM:
+    """Answer after `latency` seconds, failing with the queued errors first."""
+
+    def __init__(self, latency: float = 0., errors: list[BaseException] | None = None, latencies: list[float] | None = None):
+        self.latency = latency
+        self.errors = list(errors or [])
+        self.latencies = list(latencies or [])
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _begin(self) -> tuple[float, BaseException | None]:
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            latency = self.latencies.pop(0) if self.latencies else self.latency
+            return latency, self.errors.pop(0) if self.errors else None
+
+    def _end(self) -> None:
+        with self._lock:
+            self.running -= 1
+
+    def invoke(self, messages, **kwargs):
+        latency, error = self._begin()
+        try:
+            time.sleep(latency)
+            if error is not None:
+                raise error
+            return f"answer {messages[-1]}"
+        finally:
+            self._end()
+
+    async def ainvoke(self, messages, **kwargs):
+        latency, error = self._begin()
+        try:
+            await asyncio.sleep(latency)
+            if error is not None:
+                raise error
+            return f"answer {messages[-1]}"
+        finally:
+            self._end()
+
+
+def gateway(llm, **settings) -> model_gateway.ModelGateway:
+    options = {"hedge_after": None, "backoff": .01, "deadline": 5., **settings}
+    return model_gateway.ModelGateway(llm, model_gateway.GatewaySettings(**options))
+
+
+def test_transient_failures_are_retried():
+    llm = FakeLLM(errors=[ConnectionError("reset"), TimeoutError("slow")])
+    model = gateway(llm)
+    assert model.invoke(["ping"]) == "answer ping"
+    assert llm.calls == 3
+    assert model.stats["retries"] == 2
+
+
+def test_other_failures_are_not_retried():
+    llm = FakeLLM(errors=[ValueError("bad request")])
+    model = gateway(llm)
+    with pytest.raises(ValueError):
+        model.invoke(["ping"])
+    assert llm.calls == 1
+    assert model.stats["failures"] == 1
+
+
+def test_retries_are_bounded():
+    llm = FakeLLM(errors=[ConnectionError("reset")] * 5)
+    model = gateway(llm, max_retries=2)
+    with pytest.raises(ConnectionError):
+        model.invoke(["ping"])
+    assert llm.calls == 3
+
+
+def test_async_retries():
+    llm = FakeLLM(errors=[ConnectionError("reset")])
+    model = gateway(llm)
+    assert asyncio.run(model.ainvoke(["ping"])) == "answer ping"
+    assert model.stats["retries"] == 1
+
+
+def test_concurrency_is_limited():
+    llm = FakeLLM(latency=.05)
+    model = gateway(llm, max_concurrency=2)
+    with ThreadPoolExecutor(8) as pool:
+        assert len(list(pool.map(lambda index: model.invoke([index]), range(8)))) == 8
+    assert llm.peak == 2
+    assert model.stats["peak_in_flight"] == 2
+
+
+def test_callers_waiting_too_long_are_rejected():
+    model = gateway(FakeLLM(latency=.5), max_concurrency=1, queue_timeout=.05)
+    with ThreadPoolExecutor(1) as pool:
+        running = pool.submit(model.invoke, ["slow"])
+        time.sleep(.1)
+        with pytest.raises(model_gateway.GatewayBusy):
+            model.invoke(["rejected"])
+        running.result()
+    assert model.stats["rejected"] == 1
+
+
+def test_cancelled_async_callers_do_not_leak_slots():
+    model = gateway(FakeLLM(latency=.2), max_concurrency=1, queue_timeout=1.)
+
+    async def main():
+        running = asyncio.ensure_future(model.ainvoke(["slow"]))
+        await asyncio.sleep(.05)
+        # Waits for the slot the first call holds, and is cancelled meanwhile.
+        waiting = asyncio.ensure_future(model.ainvoke(["cancelled"]))
+        await asyncio.sleep(.05)
+        waiting.cancel()
+        await running
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(main())
+    time.sleep(.1)
+    assert model._shared.in_flight == 0
+    assert model.invoke(["again"]) == "answer again"
+
+
+def test_slow_calls_are_hedged():
+    llm = FakeLLM(latencies=[1., .01])
+    model = gateway(llm, hedge_after=.05)
+    start = time.monotonic()
+    assert model.invoke(["ping"]) == "answer ping"
+    assert time.monotonic() - start < .5
+    assert model.stats["hedges"] == model.stats["hedge_wins"] == 1
+
+
+def test_deadline():
+    model = gateway(FakeLLM(latency=1.), deadline=.1)
+    with pytest.raises(model_gateway.DeadlineExceeded):
+        model.invoke(["ping"])
+
+
+def test_async_client_survives_event_loops():
+    httpx = pytest.importorskip("httpx")
+    with model_gateway.StubServer(latency=0.) as server:
+        client = httpx.AsyncClient(transport=model_gateway._per_loop_transport())
+
+        async def call():
+            response = await client.post(f"{server.base_url}/chat/completions", json={"messages": [{"content": "hi"}]})
+            return response.json()["choices"][0]["message"]["content"]
+
+        # One event loop per call, as the daemon runs every task.
+        assert [asyncio.run(call()) for _ in range(3)] == ["hi"] * 3
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import model
+import operation_assistant
+import plan_cache
+import screen_capture
+from operation_assistant import AnalyzeState, OverallState
+from pc_operator import Operation
+
+
+class FakeLLM:
+    """Answers every analysis with a click, counting the calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        return self
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return AnalyzeState(operations=[Operation(operation="click", coord=[10, 10])])
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    previous = screen_capture._backend
+    screen_capture.set_backend(screen_capture.SyntheticBackend(resolution=(640, 360)))
+    fake = FakeLLM()
+    monkeypatch.setattr(model, "_llm", fake)
+    yield fake
+    screen_capture.set_backend(previous)
+
+
+def state(operation: str, unchanged: bool = True) -> OverallState:
+    return OverallState(task="open the report", screenshot=screen_capture.capture(), frame_hash=1, analyzed_hash=1,
+                        analyzed_operations=[Operation(operation=operation, coord=[5, 5])], unchanged=unchanged, replaying=False)
+
+
+def test_harmless_operations_are_reused_on_an_unchanged_screen(llm):
+    update = operation_assistant.analyze_screenshot(state("move"))
+    assert llm.calls == 0
+    assert [operation.operation for operation in update["operations"]] == ["move"]
+    assert update["reuses"] == 1
+
+
+@pytest.mark.parametrize("operation", ["click", "write_input"])
+def test_other_operations_are_analyzed_again(llm, operation):
+    update = operation_assistant.analyze_screenshot(state(operation))
+    assert llm.calls == 1
+    assert [operation.operation for operation in update["operations"]] == ["click"]
+
+
+def test_a_changed_screen_is_analyzed_again(llm):
+    operation_assistant.analyze_screenshot(state("move", unchanged=False))
+    assert llm.calls == 1
+
+
+@pytest.fixture
+def recorded(tmp_path, monkeypatch):
+    cache = plan_cache.PlanCache(str(tmp_path / "plans.sqlite3"))
+    monkeypatch.setattr(plan_cache, "_cache", cache)
+    return cache
+
+
+def replay_state(frame_hash: int) -> OverallState:
+    return OverallState(task="open the report", screenshot=screen_capture.capture(), frame_hash=frame_hash)
+
+
+def test_a_recorded_plan_is_replayed_on_the_same_screen(llm, recorded):
+    recorded.put("open the report", (640, 360), [{"hash": 1, "operations": [{"operation": "move", "coord": [3, 4]}], "completed": False}])
+    update = operation_assistant.analyze_screenshot(replay_state(1))
+    assert llm.calls == 0
+    assert [operation.coord for operation in update["operations"]] == [[3, 4]]
+    assert recorded.stats["replayed_steps"] == 1
+
+
+def test_a_different_screen_hands_back_to_the_model(llm, recorded):
+    recorded.put("open the report", (640, 360), [{"hash": (1 << 64) - 1, "operations": [], "completed": True}])
+    update = operation_assistant.analyze_screenshot(replay_state(1))
+    assert llm.calls == 1
+    assert update["replaying"] is False and update["plan"] is None
+    assert recorded.stats["mismatches"] == 1
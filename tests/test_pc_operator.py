@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from pc_operator import ExecutorSettings, Operation, RecordingBackend, coalesce, execute_plan
+
+
+def op(operation: str, x: int = 0, y: int = 0, **fields) -> Operation:
+    return Operation(operation=operation, coord=[x, y], **fields)
+
+
+def kinds(operations: list[Operation]) -> list[tuple]:
+    return [(operation.operation, *operation.coord) for operation in operations]
+
+
+def test_nops_are_dropped():
+    assert kinds(coalesce([op("nop"), op("click", 5, 5), op("nop")])) == [("click", 5, 5)]
+
+
+def test_move_to_the_next_pointer_coordinate_is_dropped():
+    assert kinds(coalesce([op("move", 5, 5), op("click", 5, 5)])) == [("click", 5, 5)]
+    assert kinds(coalesce([op("move", 5, 5), op("move", 5, 5)])) == [("move", 5, 5)]
+
+
+def test_move_elsewhere_is_kept():
+    # Hovering a menu before clicking one of its items.
+    plan = [op("move", 100, 10), op("click", 100, 60)]
+    assert kinds(coalesce(plan)) == kinds(plan)
+
+
+def test_move_before_other_operations_is_kept():
+    plan = [op("move", 5, 5), op("scroll", scroll_clicks=-3), op("write_input", content="x"), op("move", 9, 9)]
+    assert kinds(coalesce(plan)) == kinds(plan)
+
+
+def test_execute_plan_records_coalesced_actions():
+    backend = RecordingBackend()
+    plan = [op("move", 10, 10), op("click", 10, 10), op("move", 20, 20), op("double_click", 30, 30), op("write_input", content="hi")]
+    timings = execute_plan(plan, backend, ExecutorSettings(pause=0.))
+    assert backend.actions == [("click", 10, 10, 1), ("move", 20, 20), ("click", 30, 30, 2), ("write", "hi")]
+    assert len(timings) == 4
+
+
+def test_execute_plan_rejects_off_screen_plans_before_acting():
+    backend = RecordingBackend((800, 600))
+    with pytest.raises(ValueError):
+        execute_plan([op("click", 10, 10), op("click", 900, 10)], backend, ExecutorSettings(pause=0.))
+    assert backend.actions == []
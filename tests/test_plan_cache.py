@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import plan_cache
+from plan_cache import PlanCache
+
+RESOLUTION = (1920, 1080)
+OTHER = (2560, 1440)
+
+
+def steps(*hashes: int) -> list[dict]:
+    return [{"hash": frame_hash, "operations": [{"operation": "click", "coord": [10, 10]}], "completed": False}
+            for frame_hash in hashes[:-1]] + [{"hash": hashes[-1], "operations": [], "completed": True}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PlanCache(str(tmp_path / "plans.sqlite3"), max_plans=2)
+
+
+def test_recorded_plans_are_found_by_the_normalized_task(cache):
+    cache.put("打开 微信！", RESOLUTION, steps(1, 2))
+    assert cache.get("打开微信", RESOLUTION) == steps(1, 2)
+    assert cache.get("打开钉钉", RESOLUTION) is None
+
+
+def test_plans_of_another_resolution_are_dropped(cache):
+    cache.put("open wechat", RESOLUTION, steps(1, 2))
+    assert cache.get("open wechat", OTHER) is None
+    assert cache.get("open wechat", RESOLUTION) is None
+    assert cache.stats["invalidated"] == 1
+
+
+def test_least_recently_used_plans_are_evicted(cache):
+    cache.put("first", RESOLUTION, steps(1))
+    cache.put("second", RESOLUTION, steps(2))
+    assert cache.get("first", RESOLUTION) is not None
+    cache.put("third", RESOLUTION, steps(3))
+    assert cache.get("second", RESOLUTION) is None
+    assert cache.get("first", RESOLUTION) is not None
+
+
+def test_plans_survive_a_restart(cache):
+    cache.put("open wechat", RESOLUTION, steps(1, 2))
+    db_path = cache._db.execute("PRAGMA database_list").fetchone()[2]
+    assert PlanCache(db_path).get("open wechat", RESOLUTION) == steps(1, 2)
+
+
+def test_steps_are_replayed_while_the_frames_match():
+    plan = steps(0, 0xFF)
+    assert plan_cache.replay_step(plan, 0, 0) is plan[0]
+    assert plan_cache.replay_step(plan, 1, 0xFF) is plan[1]
+    assert plan_cache.replay_step(plan, 1, (1 << 64) - 1) is None
+    assert plan_cache.replay_step(plan, 2, 0xFF) is None
+    assert plan_cache.replay_step(None, 0, 0) is None
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import types
+
+import pytest
+
+import prompt_builder
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    """Replace tiktoken with a module whose encoding is `encoder`, or fails to load if it is None."""
+    def install(encoder):
+        def get_encoding(name):
+            if encoder is None:
+                raise OSError("offline")
+            return encoder
+
+        monkeypatch.setattr(prompt_builder, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding))
+        monkeypatch.setattr(prompt_builder, "_encoder", None)
+        monkeypatch.setattr(prompt_builder, "_loader", None)
+
+    return install
+
+
+def loaded() -> None:
+    prompt_builder._loader.join(5)
+
+
+def test_counts_are_estimated_when_the_encoding_cannot_be_loaded(encoding):
+    encoding(None)
+    assert prompt_builder.count_tokens("打开微信 and reply") == 4 + 3
+    loader = prompt_builder._loader
+    loaded()
+    assert prompt_builder.count_tokens("abcdefgh") == 2
+    assert prompt_builder._loader is loader
+
+
+def test_counts_are_exact_once_the_encoding_is_loaded(encoding):
+    encoding(types.SimpleNamespace(encode=lambda text: text.split()))
+    prompt_builder.count_tokens("")
+    loaded()
+    assert prompt_builder.count_tokens("one two three") == 3
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import re
+import time
+
+import pytest
+
+import regex_engine
+
+
+@pytest.mark.parametrize("pattern", [
+    r"\w*\w*\w*\w*\w*\w*z",
+    r"[^z]*[^z]*[^z]*[^z]*z",
+    r"\d+\d+\d+\d+y",
+    r"\w*\w?\w*\w*z",
+    r"(\w*)(\w*)(\w*)z",
+    r"(.*a){20}",
+    r"(a+){2}",
+    r"(a+)+$",
+    r"(\w+\s?)*$",
+    r"(a|ab)*c",
+    r"(.)\1",
+    r"[",
+    "a" * 300,
+])
+def test_rejects_unsafe_patterns(pattern):
+    with pytest.raises(regex_engine.UnsafePattern):
+        regex_engine.compile_pattern(pattern)
+
+
+@pytest.mark.parametrize("pattern", [
+    r"^.*微信.*$",
+    r".*\.(docx|pdf|txt).*",
+    r"(jpg|png)+",
+    r"(\d{3})+",
+    r"(?:\d{1,3}\.){3}\d{1,3}",
+    r"项目.*2024.*报告.*pdf",
+    r"\w*-\w*",
+    r"[a-z]+\d+",
+    r".*\d+",
+    r"\w*\w*z",
+    r"\.(jpe?g|png)$",
+    r"^[^.]*\.exe$",
+])
+def test_accepts_safe_patterns(pattern):
+    assert isinstance(regex_engine.compile_pattern(pattern), re.Pattern)
+
+
+def test_rejected_patterns_are_fast_to_reject():
+    start = time.perf_counter()
+    with pytest.raises(regex_engine.UnsafePattern):
+        regex_engine.compile_pattern(r"\w*" * 20 + "z")
+    assert time.perf_counter() - start < 1.
+
+
+def test_compile_pattern_sanitizes():
+    assert regex_engine.compile_pattern(r"^.*微信.*.*$").pattern == "微信"
+    assert regex_engine.compile_pattern(r"a.*.*b").pattern == "a.*b"
+    assert regex_engine.compile_pattern("REPORT").search("report.pdf")
+
+
+@pytest.mark.parametrize("pattern, simplified", [
+    (".*?微信.*?", ".*?微信.*?"),
+    ("^.*?报告", "^.*?报告"),
+    (".*+abc", ".*+abc"),
+    (".*.*?报告", ".*?报告"),
+    ("a.*.*+b", "a.*.*+b"),
+])
+def test_lazy_and_possessive_repeats_keep_their_modifier(pattern, simplified):
+    assert regex_engine.sanitize(pattern) == simplified
+    regex_engine.compile_pattern(pattern)
+
+
+@pytest.fixture
+def engine():
+    corpus = [f"file {i}.txt" for i in range(1000)] + ["报告 2024.docx", "a" * 5000 + "b"]
+    engine = regex_engine.RegexEngine(corpus)
+    yield engine
+    engine.close()
+
+
+def test_engine_finds_matches(engine):
+    assert list(engine.search(r"报告.*\.docx$")) == [1000]
+    assert len(list(engine.search(r"file \d+\.txt", max_results=7))) == 7
+
+
+def test_engine_matches_positions_and_extra_strings(engine):
+    found = set(engine.search(r"file 1\d\.txt", positions=[10, 11, 500], extra=[(2000, "file 15.txt"), (2001, "nope")]))
+    assert found == {10, 11, 2000}
+
+
+def test_engine_stops_at_the_deadline(engine):
+    hits = regex_engine.stats["deadline_hits"]
+    start = time.monotonic()
+    assert list(engine.search(r"a.*a.*a.*z", positions=[1001] * 4, timeout=.3)) == []
+    assert time.monotonic() - start < 2.
+    assert regex_engine.stats["deadline_hits"] == hits + 1
+    # The terminated workers are replaced on the next query.
+    assert list(engine.search(r"报告")) == [1000]
+
+
+def test_small_queries_start_no_workers(engine):
+    regex_engine._terminate_pool()
+    assert list(engine.search(r"报告", positions=range(1001))) == [1000]
+    assert regex_engine._pool is None
+    # Long strings go to a worker, whose match can be cut short at the deadline.
+    assert list(engine.search(r"a+b$")) == [1001]
+    assert regex_engine._pool is not None
+
+
+@pytest.fixture
+def pooled(monkeypatch):
+    monkeypatch.setattr(regex_engine.settings, "inline_limit", 0)
+    monkeypatch.setattr(regex_engine.settings, "shard_size", 100)
+
+
+def test_workers_read_the_list_from_shared_memory(pooled):
+    engine = regex_engine.RegexEngine([f"file {i}.txt" for i in range(1000)] + ["报告 2024.docx", "bad \udcff name"])
+    try:
+        assert sorted(engine.search(r"file 99\d\.txt|报告|\udcff")) == list(range(990, 1002))
+        assert set(engine.search(r"file 1\d\.txt", positions=[10, 11, 500], extra=[(2000, "file 15.txt")])) == {10, 11, 2000}
+    finally:
+        engine.close()
+    # The list is copied again once freed.
+    assert list(engine.search(r"报告")) == [1000]
+    engine.close()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+import screen_capture
+
+
+@pytest.fixture
+def backend():
+    previous = screen_capture._backend
+    backend = screen_capture.SyntheticBackend(resolution=(2560, 1440))
+    screen_capture.set_backend(backend)
+    yield backend
+    screen_capture.set_backend(previous)
+
+
+def decode(frame: screen_capture.EncodedFrame) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(frame.data)))
+
+
+def test_frames_are_downscaled_and_encoded_in_memory(backend):
+    frame = screen_capture.capture(screen_capture.CaptureSettings(max_width=1280, format="JPEG"))
+    assert (frame.width, frame.height) == (1280, 720)
+    assert frame.mime == "image/jpeg"
+    assert decode(frame).size == (1280, 720)
+    assert frame.data_url.startswith("data:image/jpeg;base64,")
+
+
+def test_coordinates_map_back_to_the_screen(backend):
+    frame = screen_capture.capture(screen_capture.CaptureSettings(max_width=1280))
+    assert frame.to_screen(640, 360) == [1280, 720]
+
+
+def test_regions_map_back_to_the_screen(backend):
+    frame = screen_capture.capture(screen_capture.CaptureSettings(max_width=0, max_height=0), region=(100, 200, 400, 300))
+    assert frame.box == (100, 200, 400, 300)
+    assert (frame.width, frame.height) == (400, 300)
+    assert frame.to_screen(0, 0) == [100, 200]
+    assert frame.to_screen(400, 300) == [500, 500]
+
+
+def test_grayscale_png(backend):
+    frame = screen_capture.capture(screen_capture.CaptureSettings(format="PNG", grayscale=True))
+    assert frame.mime == "image/png"
+    assert decode(frame).mode == "L"
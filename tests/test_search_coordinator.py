@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import search_coordinator
+from search_coordinator import SearchCoordinator, StaticSource
+
+
+def item(name: str, directory: str = "/home/user") -> dict:
+    return {"name": name, "path": f"{directory}/{name}"}
+
+
+class FailingSource:
+    name = "failing"
+    timeout = 1.
+
+    def search(self, pattern, max_results):
+        raise OSError("service down")
+
+
+def test_results_of_every_source_are_merged_without_duplicates():
+    search = SearchCoordinator([StaticSource([item("report.docx"), item("notes.txt")], name="index"),
+                                StaticSource([item("report.docx"), item("report.pdf", "/tmp")], name="desktop")])
+    names = sorted(result["path"] for result in search.search("report"))
+    assert names == ["/home/user/report.docx", "/tmp/report.pdf"]
+
+
+def test_slow_sources_are_dropped_at_their_timeout():
+    search = SearchCoordinator([StaticSource([item("report.docx")], name="fast"),
+                                StaticSource([item("report.pdf")], name="slow", delay=1., timeout=.1)])
+    start = time.monotonic()
+    assert [result["name"] for result in search.search("report")] == ["report.docx"]
+    assert time.monotonic() - start < .5
+    assert search.stats["slow"]["timeouts"] == 1
+
+
+class HungSource:
+    name = "hung"
+    timeout = .1
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def search(self, pattern, max_results):
+        self.calls += 1
+        self.release.wait()
+        return [item("late.docx")]
+
+
+def test_a_hung_source_holds_one_thread_and_is_skipped_until_it_returns():
+    hung = HungSource()
+    search = SearchCoordinator([StaticSource([item("report.docx")]), hung])
+    try:
+        for _ in range(5):
+            assert [result["name"] for result in search.search("report")] == ["report.docx"]
+        assert hung.calls == 1
+        assert search.stats["hung"] == {"results": 0, "timeouts": 1, "errors": 0, "abandoned": 1, "skipped": 4}
+    finally:
+        hung.release.set()
+    deadline = time.monotonic() + 2.
+    while search.stats["hung"]["abandoned"] and time.monotonic() < deadline:
+        time.sleep(.01)
+    assert search.stats["hung"]["abandoned"] == 0
+    hung.release.clear()
+    search.search("report")
+    hung.release.set()
+    assert hung.calls == 2
+
+
+def test_failing_sources_are_skipped():
+    search = SearchCoordinator([StaticSource([item("report.docx")]), FailingSource()])
+    assert [result["name"] for result in search.search("report")] == ["report.docx"]
+    assert search.stats["failing"]["errors"] == 1
+
+
+def test_unsafe_patterns_fall_back_to_the_keywords_of_the_task():
+    search = SearchCoordinator([StaticSource([item("weekly report.docx"), item("photo.jpg")])])
+    results = search.search(r"(\w+\s?)*$", task="open the weekly report")
+    assert [result["name"] for result in results] == ["weekly report.docx"]
+
+
+def test_paths_are_compared_normalized():
+    assert search_coordinator.normalize_path("/tmp/a/../b") == search_coordinator.normalize_path("/tmp/b")
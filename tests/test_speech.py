@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import types
+from array import array
+
+import speech
+
+CHUNK_MS = 100
+RATE = 16000
+
+
+class ListSource:
+    """`speech_ms` of loud audio followed by `silence_ms` of silence, in 100 ms chunks."""
+
+    sample_rate = RATE
+
+    def __init__(self, speech_ms: int, silence_ms: int):
+        samples = RATE * CHUNK_MS // 1000
+        loud, quiet = array("h", [4000, -4000] * (samples // 2)).tobytes(), bytes(2 * samples)
+        self._chunks = [loud] * (speech_ms // CHUNK_MS) + [quiet] * (silence_ms // CHUNK_MS)
+        self.read = 0
+
+    def chunks(self):
+        for chunk in self._chunks:
+            self.read += 1
+            yield chunk
+
+
+def test_vad_ends_the_utterance_after_silence():
+    source = ListSource(speech_ms=1000, silence_ms=3000)
+    transcripts = list(speech.stream(source, speech.ScriptedRecognizer("打开微信", chars_per_second=4.)))
+    # 10 chunks of speech and 7 of silence, the rest is never read.
+    assert source.read == 17
+    assert transcripts[-1] == speech.Transcript("打开微信", final=True, stable=True)
+    partials = [transcript.text for transcript in transcripts if not transcript.final]
+    assert partials[0] == "打" and "打开微信" in partials
+
+
+def test_speculation_is_reused_for_a_matching_final_transcript():
+    calls = []
+    speculation = speech.SpeculativeTask(lambda text: calls.append(text) or f"found {text}")
+    try:
+        final, result = speech.listen(speech.ScriptedRecognizer("打开微信", chars_per_second=8.), ListSource(1000, 1500), speculation)
+    finally:
+        speculation.close()
+    assert final == "打开微信"
+    assert result == "found 打开微信"
+    assert speculation.stats["reused"] == 1
+    assert calls.count("打开微信") == 1
+
+
+def test_google_request_errors_give_no_transcript(monkeypatch):
+    class RequestError(Exception):
+        pass
+
+    class Recognizer:
+        def recognize_google(self, audio, language):
+            raise RequestError("offline")
+
+    module = types.SimpleNamespace(Recognizer=Recognizer, AudioData=lambda *args: args,
+                                   UnknownValueError=type("UnknownValueError", (Exception,), {}), RequestError=RequestError)
+    monkeypatch.setitem(sys.modules, "speech_recognition", module)
+    recognizer = speech.GoogleRecognizer()
+    recognizer.start(RATE)
+    recognizer.feed(bytes(320))
+    assert recognizer.finish() is None
+    assert list(speech.stream(ListSource(0, 100), recognizer))[-1].text == ""
+
+
+def test_failed_speculation_leaves_the_transcript_to_the_normal_path():
+    def work(text):
+        raise OSError("desktop unavailable")
+
+    speculation = speech.SpeculativeTask(work)
+    try:
+        final, result = speech.listen(speech.ScriptedRecognizer("打开微信", chars_per_second=8.), ListSource(1000, 1500), speculation)
+        assert speculation.resolve("another request") is None
+    finally:
+        speculation.close()
+    assert final == "打开微信"
+    assert result is None
+    assert speculation.stats["failed"] == 2
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import json
+import queue
+
+import pytest
+
+import telemetry
+
+
+@pytest.fixture
+def spans_path(tmp_path, monkeypatch):
+    path = tmp_path / "spans" / "spans.jsonl"
+    monkeypatch.setattr(telemetry.settings, "enabled", True)
+    monkeypatch.setattr(telemetry.settings, "spans_path", str(path))
+    yield path
+    telemetry.flush()
+
+
+def test_finished_spans_are_written_in_the_background(spans_path):
+    with telemetry.span("task") as root:
+        with telemetry.span("node"):
+            telemetry.record(llm_calls=1)
+    telemetry.flush()
+    spans = [json.loads(line) for line in spans_path.read_text(encoding="utf-8").splitlines()]
+    assert [span["name"] for span in spans] == ["node", "task"]
+    assert spans[0]["parent_id"] == root.span_id
+    assert spans[1]["metrics"]["llm_calls"] == 1
+
+
+def test_spans_are_dropped_rather_than_waited_on(spans_path, monkeypatch):
+    with telemetry.span("first"):
+        pass
+    telemetry.flush()
+    monkeypatch.setattr(telemetry, "_queue", queue.Queue(1))
+    # The writer is stopped: the first span fills the queue, the second is dropped.
+    monkeypatch.setattr(telemetry, "_writer_path", str(spans_path))
+    dropped = telemetry.stats["dropped"]
+    for name in ("second", "third"):
+        with telemetry.span(name):
+            pass
+    assert telemetry.stats["dropped"] == dropped + 1
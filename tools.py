@@ -1,35 +1,40 @@
+import functools
+import importlib.util
 import math
 import os
-import struct
-import winreg
-import everytools
-import pyautogui
 import time
-import speech_recognition as sr
+import logging
+import desktop_blob
+import file_index
 
 from typing import TypedDict
 
+logger = logging.getLogger(__name__)
+
 
 def recognize_speech_from_microphone():
+    import speech_recognition as sr
+
     r = sr.Recognizer()
     with sr.Microphone() as source:
-        print("请开始说话...")
+        logger.info("请开始说话...")
         audio = r.listen(source)
     try:
         text = r.recognize_google(audio, language='zh-CN')
-        print("识别结果：" + text)
+        logger.info("识别结果：%s", text)
         return text
     except sr.UnknownValueError:
-        print("无法识别")
+        logger.warning("无法识别")
         return None
     except sr.RequestError as e:
-        print("请求错误：" + str(e))
+        logger.error("请求错误：%s", e)
         return None
 
 class DesktopItem(TypedDict):
     entry_name: str
     index: int
     position: list[int, int]
+    coordinate: tuple[int, int] | None
 
 class Item(TypedDict):
     """
@@ -44,7 +49,25 @@ class Item(TypedDict):
 
 ICON_SIZE = (93, 89)
 
+_desktop_blob: bytes | None = None
+_opener = None
+
+def set_desktop_blob(value: bytes | None) -> None:
+    """Read the desktop layout from `value` instead of the registry, e.g. a `desktop_blob.generate_blob`; None restores the registry."""
+    global _desktop_blob
+    _desktop_blob = value
+
+def set_opener(opener) -> None:
+    """Open objects with `opener(path)` instead of `os.startfile`, e.g. to record them; None restores `os.startfile`."""
+    global _opener
+    _opener = opener
+
 def _get_reg_value(sub_key=r"Software\Microsoft\Windows\Shell\Bags\1\Desktop"):
+    if _desktop_blob is not None:
+        return _desktop_blob
+
+    import winreg
+
     with winreg.ConnectRegistry(None, winreg.HKEY_CURRENT_USER) as aReg:
         with winreg.OpenKey(aReg, sub_key) as aKey:
             _, value, _ = winreg.EnumValue(aKey, 9)
@@ -52,52 +75,20 @@ def _get_reg_value(sub_key=r"Software\Microsoft\Windows\Shell\Bags\1\Desktop"):
     return value
 
 def _read_reg_value(value, mode):
-    offset = 0x10
-    number_of_items = struct.unpack_from("<I", value[offset:],8)[0]
-
-    offset += 12
-    desktop_items = []
-    for x in range(number_of_items):
-        uint32_filesize = struct.unpack_from("<I", value[offset:],4)[0]
-        offset += 12
-        entry_name = value[offset:(offset + (2 * uint32_filesize - 8))].decode('utf-16-le')
-        offset += (2 * uint32_filesize - 4)
-
-        if mode == "click":
-            item = DesktopItem(entry_name=entry_name, index=x, position=[0, 0])
-        else:
-            item = Item(name=entry_name, path=os.path.join(os.path.expanduser(r"~\Desktop"), entry_name))
+    names, positions = desktop_blob.parse(value)
+    number_of_items = len(names)
 
-        desktop_items.append(item)
-    if mode != "click": return desktop_items
+    if mode != "click":
+        desktop = os.path.expanduser(r"~\Desktop")
+        return [Item(name=entry_name, path=os.path.join(desktop, entry_name)) for entry_name in names]
 
+    desktop_items = [DesktopItem(entry_name=entry_name, index=x, position=[0, 0], coordinate=None) for x, entry_name in enumerate(names)]
     mapping = generate_mapping(number_of_items)
-    offs = len(value)
-    for x in range(number_of_items):
-        offs -= 10
-        item_tuple = (
-            struct.unpack_from("<H", value[offs:],6)[0],  # row 
-            struct.unpack_from("<H", value[offs:],2)[0],  # column
-            struct.unpack_from("<H", value[offs:],8)[0]  # index to desktop_items
-        )
-        # item_positions.append(item_tuple[:2])
-        position = [mapping.get(i, 0) for i in item_tuple[:2]]
-        desktop_items[item_tuple[2]]['position'] = list(position)
-
-    # # 处理行列
-    # row_set = set((x[0] for x in item_positions))
-    # column_set = set((x[1] for x in item_positions))
-
-    # row_set = sorted(row_set)
-    # column_set = sorted(column_set)
-
-    # mapping = lambda x: {row: idx + 1 for idx, row in enumerate(x)}
-
-    # row_mapping = mapping(row_set)
-    # column_mapping = mapping(column_set)
-
-    # for _, item in enumerate(desktop_items):
-    #     item['position'] = (row_mapping[item['position'][0]], column_mapping[item['position'][1]])
+    rows, columns = pixel_table(number_of_items)
+    for row, column, index in positions:
+        desktop_items[index]['position'] = [mapping.get(row, 0), mapping.get(column, 0)]
+        if row in rows and column in columns:
+            desktop_items[index]['coordinate'] = (columns[column], rows[row])
 
     return desktop_items
 
@@ -110,12 +101,20 @@ def get_desktop_items(mode="click"):
     return desktop_items
 
 def get_by_windows_search(app_name):
+    if _opener is not None:
+        # Launching from the Start menu opens the app too, so the opener stands in for it.
+        return _opener(app_name)
+
+    import pyautogui
+
     pyautogui.press('win')
     time.sleep(0.5)  # Wait for the start menu to open
     pyautogui.write(app_name)
     pyautogui.press('enter')
 
 def get_by_everytools_search(keywords, max_results=10, search_type='regex', ext=None):
+    import everytools  # Windows-only, requires the Everything service.
+
     et = everytools.EveryTools()
     match search_type:
         case 'regex':
@@ -145,6 +144,18 @@ def get_by_everytools_search(keywords, max_results=10, search_type='regex', ext=
 
     return [Item(name=name, path=os.path.join(path, name)) for name, path in zip(names, paths)]
 
+def get_by_index_search(keywords, max_results=10, search_type='regex', ext=None):
+    """
+    Drop-in replacement for `get_by_everytools_search` backed by the local `file_index`.
+    While the index is still crawled for the first time, Everything answers instead where
+    it is installed; elsewhere the entries indexed so far do.
+    """
+    index = file_index.get_index()
+    if not index.ready and importlib.util.find_spec("everytools") is not None:
+        return get_by_everytools_search(keywords, max_results=max_results, search_type=search_type, ext=ext)
+    results = index.search(keywords, max_results=max_results, search_type=search_type, ext=ext)
+    return [Item(name=item["name"], path=item["path"]) for item in results]
+
 def _get_nth_row_column_value(n: int) -> int:
     if n == 1:
         res = 0
@@ -152,21 +163,24 @@ def _get_nth_row_column_value(n: int) -> int:
         res = 16256
     else:
         res = _get_nth_row_column_value(n - 1) + math.pow(2, 7 - math.floor(math.log2(n - 2)))
-    print(res)
+    logger.debug("Row/column %d: %s", n, res)
     return res
     
 def _get_nth_row_column_value_withloop(n: int) -> int:
     res = 0
     for i in range(2, n + 1):
         res = res +  (1 << (7 - (i - 2).bit_length() + 1)) if i > 2 else 16256
-        print(res)
+        logger.debug("Row/column %d: %s", i, res)
     return res
 
+@functools.lru_cache(maxsize=None)
 def generate_mapping(n: int) -> dict:
+    """Map the raw registry grid values of the first `n` rows/columns to their 1-based index. The result is shared, do not mutate it."""
     mapping = {0: 1, 16256: 2}
     tmp = 16256
 
-    for i in range(3, n + 1):
+    # The raw values are the upper 16 bits of float32(i - 1), which cannot step by one past 256.
+    for i in range(3, min(n, 257) + 1):
         tmp += (1 << (7 - (i - 2).bit_length() + 1))
         mapping[tmp] = i
     return mapping    
@@ -177,5 +191,18 @@ def get_coordinate(row: int, column: int) -> tuple:
 
     return (x, y)
 
+@functools.lru_cache(maxsize=None)
+def pixel_table(n: int) -> tuple[dict, dict]:
+    """
+    Precompute the pixel position of the first `n` rows and columns with `get_coordinate`.
+    Returns the raw row value -> y and raw column value -> x tables. The result is shared, do not mutate it.
+    """
+    mapping = generate_mapping(n)
+    rows = {raw: get_coordinate(index, 1)[1] for raw, index in mapping.items()}
+    columns = {raw: get_coordinate(1, index)[0] for raw, index in mapping.items()}
+    return rows, columns
+
 def open_object(path: str):
+    if _opener is not None:
+        return _opener(path)
     os.startfile(path)
\ No newline at end of file